@@ -0,0 +1,190 @@
+"""Streaming pre-aggregation of metrics for Sentio IoT Collectors
+
+Matching series are folded into fixed, wall-clock aligned windows keeping
+min/max/sum/count/last. When a window closes one rollup sample per configured
+function is emitted as ``<name>:<window>s_<function>`` (the naming used by
+VictoriaMetrics stream aggregation), with the series' original labels.
+"""
+import logging
+import time
+
+from prometheus_client import Counter, Gauge
+
+from rules import RuleMatcher
+from selfmetrics import gauge_function
+from series import series_key
+
+logger = logging.getLogger(__name__)
+
+aggregation_samples = Counter(
+    'sentio_aggregation_samples_total', 'Samples seen by the pre-aggregation stage', ['result']
+)
+aggregation_rollups = Counter('sentio_aggregation_windows_closed_total', 'Aggregation windows closed and emitted')
+aggregation_series = Gauge(
+    'sentio_aggregation_series', 'Series with an open aggregation window', multiprocess_mode='livesum'
+)
+
+FUNCTIONS = ('min', 'max', 'sum', 'count', 'last', 'avg')
+
+
+class AggregationRule:
+    """Aggregation settings for metric names matching a glob pattern"""
+
+    def __init__(self, match: str, window: float = 60, functions: list = None, keep_raw: bool = False):
+        self.match = match
+        self.window_ms = int(float(window) * 1000)
+        self.functions = tuple(functions or ('min', 'max', 'sum', 'count', 'last'))
+        self.keep_raw = keep_raw
+        unknown = set(self.functions) - set(FUNCTIONS)
+        if unknown:
+            raise ValueError(f"Unknown aggregation function(s) {sorted(unknown)} for '{match}'")
+        if self.window_ms <= 0:
+            raise ValueError(f"Aggregation window for '{match}' must be positive")
+        self.suffix = f":{self.window_ms // 1000}s_"
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(
+            config['match'],
+            config.get('window', 60),
+            config.get('functions'),
+            config.get('keep_raw', False)
+        )
+
+
+class _Window:
+    """Running aggregate of one series within one window"""
+
+    __slots__ = ('rule', 'name', 'labels', 'end', 'min', 'max', 'sum', 'count', 'last')
+
+    def __init__(self, rule: AggregationRule, name: str, labels: dict, end: int, value: float):
+        self.rule = rule
+        self.name = name
+        self.labels = labels
+        self.end = end
+        self.min = self.max = self.sum = self.last = value
+        self.count = 1
+
+    def add(self, value: float):
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+    def rollups(self) -> list:
+        """Rollup entries (name, labels, value, timestamp_ms) for the closed window"""
+        values = {
+            'min': self.min,
+            'max': self.max,
+            'sum': self.sum,
+            'count': self.count,
+            'last': self.last,
+            'avg': self.sum / self.count,
+        }
+        prefix = self.name + self.rule.suffix
+        return [(prefix + fn, self.labels, values[fn], self.end) for fn in self.rule.functions]
+
+
+class Aggregator:
+    """Bounded per-series window state for all aggregation rules"""
+
+    def __init__(self, rules: list, max_series: int = 100000, grace: float = 5):
+        self.rules = rules
+        self.max_series = max_series
+        self.grace_ms = int(grace * 1000)
+        self.windows = {}
+        self.matcher = RuleMatcher(rules, max_cached=10 * max_series)
+        gauge_function(aggregation_series, lambda: len(self.windows))
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build an aggregator from the ``aggregation`` config section, or None if unused"""
+        rules = [AggregationRule.from_config(rule) for rule in (config or {}).get('rules', [])]
+        if not rules:
+            return None
+        logger.info(f"Metric pre-aggregation enabled with {len(rules)} rule(s)")
+        return cls(rules, int(config.get('max_series', 100000)), float(config.get('grace', 5)))
+
+    def process(self, entries: list, now_ms: int = None) -> list:
+        """Fold matching samples into their windows.
+
+        Returns the entries that should be buffered: samples that are not
+        aggregated (or are kept raw) plus rollups of any window the new
+        samples closed.
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        out = []
+        windows = self.windows
+        aggregated = late = overflow = closed = 0
+        for entry in entries:
+            name, labels, value, timestamp = entry
+            rule = self.matcher.rule_for(name)
+            if rule is None:
+                out.append(entry)
+                continue
+            if rule.keep_raw:
+                out.append(entry)
+
+            ts = now_ms if timestamp is None else int(timestamp)
+            end = (ts // rule.window_ms + 1) * rule.window_ms
+            key = series_key(name, labels)
+            window = windows.get(key)
+            if window is not None:
+                if end == window.end:
+                    window.add(float(value))
+                    aggregated += 1
+                    continue
+                if end < window.end:
+                    # Belongs to a window that was already closed
+                    late += 1
+                    if not rule.keep_raw:
+                        out.append(entry)
+                    continue
+                out.extend(window.rollups())
+                closed += 1
+                del windows[key]
+            elif end <= now_ms - self.grace_ms:
+                # Its window was already closed by expire(); reopening it would emit a second rollup
+                late += 1
+                if not rule.keep_raw:
+                    out.append(entry)
+                continue
+            elif len(windows) >= self.max_series:
+                # State is full: pass the sample through untouched
+                overflow += 1
+                if not rule.keep_raw:
+                    out.append(entry)
+                continue
+            windows[key] = _Window(rule, name, labels, end, float(value))
+            aggregated += 1
+
+        for result, count in (('aggregated', aggregated), ('late', late), ('overflow', overflow)):
+            if count:
+                aggregation_samples.labels(result=result).inc(count)
+        if closed:
+            aggregation_rollups.inc(closed)
+        return out
+
+    def expire(self, now_ms: int = None) -> list:
+        """Close every window that ended more than the grace period ago, returning the rollups"""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        cutoff = now_ms - self.grace_ms
+        closed = [key for key, window in self.windows.items() if window.end <= cutoff]
+        return self._close(closed)
+
+    def close_all(self) -> list:
+        """Close all open windows, e.g. on shutdown"""
+        return self._close(list(self.windows))
+
+    def _close(self, keys: list) -> list:
+        out = []
+        for key in keys:
+            out.extend(self.windows.pop(key).rollups())
+        if keys:
+            aggregation_rollups.inc(len(keys))
+        return out
@@ -0,0 +1,307 @@
+"""Throughput benchmark for Sentio IoT Collectors
+
+Runs the collectors app from ``main.create_app()`` against in-process stand-ins
+for VictoriaMetrics, Loki and Tempo. It drives a load shape for a fixed time
+and writes samples/sec, ingest and flush latency percentiles, RSS and CPU per
+sample as JSON, so results can be compared between releases.
+
+Each shape runs in a fresh interpreter, so memory and CPU figures are not
+mixed between shapes. The load generator shares the process and event loop
+with the collectors, and pre-encodes its request bodies so its own cost
+stays small. CPU figures include it.
+
+    python benchmark.py --shape single --shape batched --duration 30 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+SHAPES = ('single', 'batched', 'many-series', 'ndjson', 'logs', 'traces')
+
+SINK_PATHS = {
+    'VictoriaMetrics': '/api/v1/import/prometheus',
+    'Loki': '/loki/api/v1/push',
+    'Tempo': '/v1/traces',
+}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram_quantile(buckets: list, q: float) -> float:
+    """Quantile from cumulative (upper_bound, count) buckets, interpolated within a bucket"""
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return 0.0
+    rank = q * total
+    lower, below = 0.0, 0
+    for upper, count in buckets:
+        if count >= rank:
+            if upper == float('inf'):
+                return lower
+            return lower + (upper - lower) * (rank - below) / max(1, count - below)
+        lower, below = upper, count
+    return lower
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+
+def build_requests(shape: str, batch_size: int, series: int) -> tuple:
+    """Pre-encoded request bodies for a shape, as (path, content_type, [(body, entries), ...])"""
+    if shape == 'single':
+        bodies = [
+            (json.dumps({"name": "bench_value", "value": i, "labels": {"device": f"d{i % series}"}}).encode(), 1)
+            for i in range(min(series, 1000))
+        ]
+        return '/collect/metrics', 'application/json', bodies
+    if shape in ('batched', 'ndjson', 'many-series'):
+        # many-series walks through `series` distinct series; the others reuse the first batch's worth
+        distinct = series if shape == 'many-series' else min(series, batch_size)
+        bodies = []
+        for start in range(0, distinct, batch_size):
+            metrics = [
+                {"name": "bench_value", "value": i, "labels": {"device": f"d{(start + i) % distinct}", "site": "bench"}}
+                for i in range(batch_size)
+            ]
+            if shape == 'ndjson':
+                body = ''.join(json.dumps(metric) + '\n' for metric in metrics).encode()
+            else:
+                body = json.dumps(metrics).encode()
+            bodies.append((body, batch_size))
+        content_type = 'application/x-ndjson' if shape == 'ndjson' else 'application/json'
+        return '/collect/metrics', content_type, bodies
+    if shape == 'logs':
+        logs = [
+            {"message": f"level=info unit={i % 16} msg=\"register read ok\" value={i}",
+             "labels": {"source": "bench", "device": f"d{i % series}"}}
+            for i in range(batch_size)
+        ]
+        return '/collect/logs', 'application/json', [(json.dumps(logs).encode(), batch_size)]
+    if shape == 'traces':
+        bodies = []
+        for request in range(16):
+            spans = [
+                {"traceId": f"{request:016x}{i // 8:016x}", "spanId": f"{i + 1:016x}", "name": "poll",
+                 "startTimeUnixNano": "1700000000000000000", "endTimeUnixNano": "1700000000010000000"}
+                for i in range(batch_size)
+            ]
+            body = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "bench"}}]},
+                "scopeSpans": [{"spans": spans}],
+            }]}
+            bodies.append((json.dumps(body).encode(), batch_size))
+        return '/collect/traces', 'application/json', bodies
+    raise ValueError(f"Unknown shape '{shape}'")
+
+
+class FakeSinks:
+    """Accepts pushes for all three backends and counts requests and bytes"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.stats = {name: {"requests": 0, "bytes": 0} for name in SINK_PATHS}
+        self.app = web.Application(client_max_size=1024 ** 3)
+        for name, path in SINK_PATHS.items():
+            self.app.router.add_post(path, self._handler(name))
+
+    def _handler(self, name: str):
+        async def handle(request):
+            body = await request.read()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self.stats[name]["requests"] += 1
+            self.stats[name]["bytes"] += len(body)
+            return web.Response(status=204)
+        return handle
+
+
+def listening_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    return sock
+
+
+async def start_site(app: web.Application, sock: socket.socket) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    return runner
+
+
+async def run_shape(shape: str, args) -> dict:
+    """Benchmark one shape in this process and return its results"""
+    sinks = FakeSinks(args.sink_latency_ms / 1000)
+    sink_sock = listening_socket()
+    sink_url = f"http://127.0.0.1:{sink_sock.getsockname()[1]}"
+    # The collectors read their settings at import time
+    os.environ.update(VICTORIAMETRICS_URL=sink_url, LOKI_URL=sink_url, TEMPO_OTLP_URL=sink_url)
+    if args.config:
+        os.environ['COLLECTOR_CONFIG_PATH'] = args.config
+    elif 'COLLECTOR_CONFIG_PATH' not in os.environ:
+        os.environ['COLLECTOR_CONFIG_PATH'] = os.devnull
+    import main
+    logging.getLogger().setLevel(logging.WARNING)
+    from prometheus_client import REGISTRY
+
+    sink_runner = await start_site(sinks.app, sink_sock)
+    app_sock = listening_socket()
+    app_runner = await start_site(main.create_app(), app_sock)
+    url = f"http://127.0.0.1:{app_sock.getsockname()[1]}"
+
+    path, content_type, bodies = build_requests(shape, args.batch_size, args.series)
+    latencies = []
+    counts = {"requests": 0, "entries": 0, "errors": 0, "throttled": 0}
+    rss_start = rss_bytes()
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def client(session: aiohttp.ClientSession, offset: int):
+        index = offset
+        while time.perf_counter() < deadline:
+            body, entries = bodies[index % len(bodies)]
+            index += args.concurrency
+            sent = time.perf_counter()
+            async with session.post(f"{url}{path}", data=body, headers={'Content-Type': content_type}) as response:
+                await response.read()
+                status = response.status
+            latencies.append(time.perf_counter() - sent)
+            counts["requests"] += 1
+            if status < 300:
+                counts["entries"] += entries
+            elif status == 429:
+                counts["throttled"] += 1
+            else:
+                counts["errors"] += 1
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session, offset) for offset in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    # Shutting down drains every buffer to the sinks, so flushes are included
+    await app_runner.cleanup()
+    drained = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+    await sink_runner.cleanup()
+
+    flushes = {}
+    for metric in REGISTRY.collect():
+        if metric.name != 'sentio_sink_flush_duration_seconds':
+            continue
+        buckets = {}
+        for sample in metric.samples:
+            if sample.name.endswith('_bucket'):
+                buckets.setdefault(sample.labels['sink'], []).append((float(sample.labels['le']), sample.value))
+        for sink, sink_buckets in buckets.items():
+            if sink_buckets[-1][1]:
+                flushes[sink] = {
+                    "count": int(sink_buckets[-1][1]),
+                    "p50_ms": round(histogram_quantile(sink_buckets, 0.5) * 1000, 3),
+                    "p99_ms": round(histogram_quantile(sink_buckets, 0.99) * 1000, 3),
+                }
+
+    return {
+        "shape": shape,
+        "duration_seconds": round(elapsed, 3),
+        "drain_seconds": round(drained - elapsed, 3),
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size if shape != 'single' else 1,
+        "series": args.series,
+        "requests": counts["requests"],
+        "samples": counts["entries"],
+        "samples_per_second": round(counts["entries"] / elapsed, 1),
+        "throttled_requests": counts["throttled"],
+        "failed_requests": counts["errors"],
+        "ingest_latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(max(latencies, default=0) * 1000, 3),
+        },
+        "flush_latency": flushes,
+        "rss_start_bytes": rss_start,
+        "rss_end_bytes": rss_bytes(),
+        "rss_peak_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "cpu_seconds": round(cpu, 3),
+        "cpu_us_per_sample": round(cpu / counts["entries"] * 1e6, 3) if counts["entries"] else None,
+        "sinks": sinks.stats,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shape', action='append', choices=SHAPES, help="load shape (repeatable, default: all)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of load per shape")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent client connections")
+    parser.add_argument('--batch-size', type=int, default=500, help="entries per request for batched shapes")
+    parser.add_argument('--series', type=int, default=100000, help="distinct series for many-series")
+    parser.add_argument('--sink-latency-ms', type=float, default=0, help="delay added by the fake sinks")
+    parser.add_argument('--config', help="collectors config file (default: none)")
+    parser.add_argument('--output', help="write JSON results to this file instead of stdout")
+    parser.add_argument('--run-one', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.run_one:
+        print(json.dumps(asyncio.run(run_shape(args.shape[0], args))))
+        return 0
+
+    results = []
+    for shape in args.shape or SHAPES:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', '--shape', shape,
+                   '--duration', str(args.duration), '--concurrency', str(args.concurrency),
+                   '--batch-size', str(args.batch_size), '--series', str(args.series),
+                   '--sink-latency-ms', str(args.sink_latency_ms)]
+        if args.config:
+            command += ['--config', args.config]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode:
+            print(f"Shape {shape} failed with exit code {completed.returncode}", file=sys.stderr)
+            return completed.returncode
+        result = json.loads(completed.stdout.decode().strip().splitlines()[-1])
+        print(f"{shape}: {result['samples_per_second']:.0f} samples/s, "
+              f"p99 ingest {result['ingest_latency_ms']['p99']} ms", file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Per-metric cardinality limiting for Sentio IoT Collectors
+
+Distinct series per metric name, and distinct values per label key of a
+metric, are estimated with HyperLogLog sketches over a sliding window. Once a
+metric exceeds its limits, series not seen recently are dropped or have the
+offending labels folded into a single overflow value.
+"""
+import base64
+import hashlib
+import logging
+import math
+import time
+
+from prometheus_client import Counter, Gauge
+
+from rules import RuleMatcher
+from selfmetrics import gauge_function
+from series import series_key
+
+logger = logging.getLogger(__name__)
+
+cardinality_limited = Counter(
+    'sentio_cardinality_samples_limited_total', 'Samples of new series over a cardinality limit', ['action']
+)
+cardinality_metrics = Gauge(
+    'sentio_cardinality_metrics_tracked', 'Metric names tracked by the cardinality guard', multiprocess_mode='livesum'
+)
+
+ACTIONS = ('drop', 'relabel')
+OVERFLOW_VALUE = '__overflow__'
+
+HLL_PRECISION = 10  # 1024 registers, ~3% standard error
+
+
+def hash64(value) -> int:
+    """64-bit BLAKE2b hash of a string or series key, stable across processes so sketches can be merged"""
+    if not isinstance(value, str):
+        value = repr(value)
+    digest = hashlib.blake2b(value.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with an incrementally maintained estimate"""
+
+    __slots__ = ('precision', 'registers', '_inverse_sum', '_zeros')
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytearray = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+        self._inverse_sum = sum(2.0 ** -r for r in self.registers)
+        self._zeros = self.registers.count(0)
+
+    def add(self, hashed: int):
+        width = 64 - self.precision
+        index = hashed >> width
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        old = self.registers[index]
+        if rank > old:
+            self.registers[index] = rank
+            self._inverse_sum += 2.0 ** -rank - 2.0 ** -old
+            if old == 0:
+                self._zeros -= 1
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / self._inverse_sum
+        if raw <= 2.5 * m and self._zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / self._zeros)
+        return raw
+
+    def copy(self):
+        return HyperLogLog(self.precision, bytearray(self.registers))
+
+
+class WindowedSketch:
+    """Distinct count over the last one to two half-windows.
+
+    ``current`` holds the running half-window and ``union`` the current and
+    previous half-windows combined, so estimates never need a merge.
+    """
+
+    __slots__ = ('current', 'union')
+
+    def __init__(self):
+        self.current = HyperLogLog()
+        self.union = HyperLogLog()
+
+    def add(self, hashed: int):
+        self.current.add(hashed)
+        self.union.add(hashed)
+
+    def estimate(self) -> float:
+        return self.union.estimate()
+
+    def rotate(self):
+        self.union = self.current.copy()
+        self.current = HyperLogLog()
+
+    @property
+    def empty(self) -> bool:
+        return self.union._zeros == len(self.union.registers)
+
+
+class CardinalityLimit:
+    """Limits for metric names matching a glob pattern (0 means unlimited)"""
+
+    def __init__(self, match: str = '*', max_series: int = 0, max_label_values: int = 0, action: str = 'drop'):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown cardinality action '{action}' for '{match}'")
+        self.match = match
+        self.max_series = int(max_series)
+        self.max_label_values = int(max_label_values)
+        self.action = action
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.max_series and not self.max_label_values
+
+    @classmethod
+    def from_config(cls, config: dict, default=None):
+        default = default or cls()
+        return cls(
+            config.get('match', default.match),
+            config.get('max_series', default.max_series),
+            config.get('max_label_values', default.max_label_values),
+            config.get('action', default.action)
+        )
+
+
+class _MetricState:
+    """Sketches and recently admitted series of one metric name"""
+
+    __slots__ = ('limit', 'series', 'labels', 'admitted', 'limited')
+
+    def __init__(self, limit: CardinalityLimit):
+        self.limit = limit
+        self.series = WindowedSketch()
+        self.labels = {}
+        self.admitted = {}
+        self.limited = 0
+
+
+class CardinalityGuard:
+    """Sliding-window cardinality limits for all metric names"""
+
+    def __init__(self, default: CardinalityLimit, rules: list, window: float = 600, max_metrics: int = 10000):
+        self.default = default
+        self.rules = rules
+        self.half_window = float(window) / 2
+        self.max_metrics = max_metrics
+        self.metrics = {}
+        self.generation = 0
+        self._rotated_at = time.monotonic()
+        self.matcher = RuleMatcher(rules, default, 10 * max_metrics)
+        gauge_function(cardinality_metrics, lambda: len(self.metrics))
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build a guard from the ``cardinality`` config section, or None if no limit is set"""
+        config = config or {}
+        default = CardinalityLimit.from_config(config)
+        rules = [CardinalityLimit.from_config(rule, default) for rule in config.get('rules', [])]
+        if default.unlimited and all(rule.unlimited for rule in rules):
+            return None
+        logger.info(f"Cardinality limits enabled with {len(rules)} rule(s)")
+        return cls(default, rules, float(config.get('window', 600)), int(config.get('max_metrics', 10000)))
+
+    def limit_for(self, name: str):
+        limit = self.matcher.rule_for(name)
+        return None if limit.unlimited else limit
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        if now - self._rotated_at < self.half_window:
+            return
+        self._rotated_at = now
+        self.generation += 1
+        for name in list(self.metrics):
+            state = self.metrics[name]
+            state.series.rotate()
+            if state.series.empty:
+                # Nothing seen for the last half-window
+                del self.metrics[name]
+                continue
+            for label, sketch in list(state.labels.items()):
+                sketch.rotate()
+                if sketch.empty:
+                    del state.labels[label]
+            state.admitted = {k: g for k, g in state.admitted.items() if g == self.generation - 1}
+
+    def process(self, entries: list) -> list:
+        """Return (name, labels, value, timestamp) entries within limits, relabeling where configured"""
+        self._maybe_rotate()
+        generation = self.generation
+        out = []
+        limited = {}
+        for entry in entries:
+            name, labels, value, timestamp = entry
+            limit = self.limit_for(name)
+            if limit is None:
+                out.append(entry)
+                continue
+            state = self.metrics.get(name)
+            if state is None:
+                if len(self.metrics) >= self.max_metrics:
+                    out.append(entry)
+                    continue
+                state = self.metrics[name] = _MetricState(limit)
+
+            key = series_key(name, labels)
+            seen = state.admitted.get(key)
+            if seen == generation:
+                out.append(entry)
+                continue
+
+            state.series.add(hash64(key))
+            over = []
+            for label, label_value in key[1]:
+                sketch = state.labels.get(label)
+                if sketch is None:
+                    sketch = state.labels[label] = WindowedSketch()
+                sketch.add(hash64(label_value))
+                if limit.max_label_values and sketch.estimate() > limit.max_label_values:
+                    over.append(label)
+
+            if seen is not None or (
+                not over and not (limit.max_series and state.series.estimate() > limit.max_series)
+            ):
+                if seen is not None or len(state.admitted) < (limit.max_series or 100000):
+                    state.admitted[key] = generation
+                out.append(entry)
+                continue
+
+            state.limited += 1
+            limited[limit.action] = limited.get(limit.action, 0) + 1
+            if limit.action == 'relabel':
+                # Fold the offending labels, or all of them at the series limit
+                folded = over or [label for label, _ in key[1]]
+                relabeled = {k: v for k, v in labels.items() if k not in folded}
+                relabeled.update((label, OVERFLOW_VALUE) for label in folded)
+                out.append((name, relabeled, value, timestamp))
+
+        for action, count in limited.items():
+            cardinality_limited.labels(action=action).inc(count)
+        return out
+
+    def report(self, top: int = 20, sketches: bool = False) -> dict:
+        """Top metrics by estimated series count, for the debug endpoint"""
+        ranked = sorted(self.metrics.items(), key=lambda item: item[1].series.estimate(), reverse=True)
+        metrics = []
+        for name, state in ranked[:top]:
+            info = {
+                "name": name,
+                "series_estimate": round(state.series.estimate()),
+                "max_series": state.limit.max_series,
+                "max_label_values": state.limit.max_label_values,
+                "action": state.limit.action,
+                "limited_samples": state.limited,
+                "label_values_estimate": {
+                    label: round(sketch.estimate())
+                    for label, sketch in sorted(state.labels.items(), key=lambda item: -item[1].estimate())
+                },
+            }
+            if sketches:
+                info["sketch"] = base64.b64encode(bytes(state.series.union.registers)).decode('ascii')
+            metrics.append(info)
+        return {
+            "window_seconds": self.half_window * 2,
+            "hll_precision": HLL_PRECISION,
+            "tracked_metrics": len(self.metrics),
+            "metrics": metrics,
+        }
@@ -0,0 +1,106 @@
+"""Payload compression for Sentio IoT Collectors"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# The zstd decoder has no output limit, so compressed input is fed to it in
+# small slices instead. A zstd block inflates to at most 128 KiB and takes at
+# least 4 bytes (an RLE block), so one slice yields at most ZSTD_MAX_PIECE.
+ZSTD_BLOCK_SIZE = 128 * 1024
+ZSTD_MAX_PIECE = 4 * 1024 * 1024
+ZSTD_INPUT_SLICE = 4 * (ZSTD_MAX_PIECE // ZSTD_BLOCK_SIZE - 1)
+
+
+class UnsupportedEncoding(Exception):
+    """Raised for a Content-Encoding the collectors cannot handle"""
+
+
+def available_codecs() -> tuple:
+    codecs = ('gzip', 'deflate')
+    return codecs + ('zstd',) if zstandard is not None else codecs
+
+
+def compress(body: bytes, codec: str, level: int = -1) -> bytes:
+    """Compress a payload with gzip, deflate or zstd"""
+    if codec == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(body) + compressor.flush()
+    if codec == 'deflate':
+        return zlib.compress(body, level)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3 if level < 0 else level).compress(body)
+    raise UnsupportedEncoding(f"Unsupported compression codec: {codec}")
+
+
+class StreamDecoder:
+    """Incrementally inflate a compressed request body.
+
+    Concatenated gzip members and zstd frames (as written by ``pigz`` or
+    ``pzstd``) are decoded one after another; trailing bytes after a deflate
+    stream are an error.
+    """
+
+    def __init__(self, encoding: str, max_chunk: int):
+        self.encoding = encoding
+        self.max_chunk = max_chunk
+        if encoding in ('gzip', 'x-gzip'):
+            self._wbits = GZIP_WBITS
+        elif encoding == 'deflate':
+            self._wbits = zlib.MAX_WBITS
+        elif encoding == 'zstd':
+            if zstandard is None:
+                raise UnsupportedEncoding("zstd request bodies require the 'zstandard' package")
+            self._zlib = None
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+            return
+        else:
+            raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
+        self._zlib = zlib.decompressobj(self._wbits)
+
+    def decode(self, chunk: bytes):
+        """Yield inflated pieces for one input chunk.
+
+        Pieces are at most ``max_chunk`` bytes for gzip and deflate, and at
+        most ``ZSTD_MAX_PIECE`` bytes for zstd.
+        """
+        if self._zlib is not None:
+            data = chunk
+            while data:
+                out = self._zlib.decompress(data, self.max_chunk)
+                if out:
+                    yield out
+                data = self._zlib.unconsumed_tail
+                if not data and self._zlib.eof and self._zlib.unused_data:
+                    if self._wbits != GZIP_WBITS:
+                        raise zlib.error("trailing data after deflate stream")
+                    # Another gzip member follows
+                    data = self._zlib.unused_data
+                    self._zlib = zlib.decompressobj(self._wbits)
+            return
+        for start in range(0, len(chunk), ZSTD_INPUT_SLICE):
+            data = chunk[start:start + ZSTD_INPUT_SLICE]
+            while data:
+                if self._zstd.eof:
+                    # Another frame follows
+                    self._zstd = zstandard.ZstdDecompressor().decompressobj()
+                out = self._zstd.decompress(data)
+                if out:
+                    yield out
+                data = self._zstd.unused_data if self._zstd.eof else b''
+
+    def finish(self):
+        """Yield any remaining output at end of stream, raising if the stream was cut short"""
+        if self._zlib is not None:
+            out = self._zlib.flush()
+            if out:
+                yield out
+            if not self._zlib.eof:
+                raise zlib.error("incomplete compressed stream")
+        elif not self._zstd.eof:
+            raise zstandard.ZstdError("incomplete zstd frame")
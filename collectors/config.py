@@ -0,0 +1,20 @@
+"""Configuration file loading for Sentio IoT Collectors"""
+import logging
+import os
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+def load_config(path: str) -> dict:
+    """Load the collectors configuration file, returning {} if it is absent or invalid"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return yaml.safe_load(f) or {}
+        logger.info(f"Collectors config file not found: {path}, using defaults")
+        return {}
+    except Exception as e:
+        logger.error(f"Error loading collectors config: {e}")
+        return {}
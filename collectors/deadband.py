@@ -0,0 +1,130 @@
+"""Change-only (deadband) sample suppression for Sentio IoT Collectors
+
+Slow-moving signals polled by the connectors are re-sent on every poll. For
+series matching a deadband rule a sample is only forwarded when it differs
+from the last forwarded value by more than the rule's tolerance, or when the
+heartbeat interval has passed so the series does not go stale.
+"""
+import logging
+import time
+
+from prometheus_client import Counter, Gauge
+
+from rules import RuleMatcher
+from selfmetrics import gauge_function
+from series import series_key
+
+logger = logging.getLogger(__name__)
+
+deadband_samples = Counter('sentio_deadband_samples_total', 'Samples seen by the deadband filter', ['result'])
+deadband_series = Gauge('sentio_deadband_series', 'Series tracked by the deadband filter', multiprocess_mode='livesum')
+
+
+class DeadbandRule:
+    """Tolerances for metric names matching a glob pattern"""
+
+    def __init__(self, match: str, absolute: float = 0, relative: float = 0, heartbeat: float = 60):
+        self.match = match
+        self.absolute = float(absolute)
+        self.relative = float(relative)
+        self.heartbeat_ms = int(float(heartbeat) * 1000)
+        if self.absolute < 0 or self.relative < 0:
+            raise ValueError(f"Deadband tolerances for '{match}' must not be negative")
+        if self.heartbeat_ms <= 0:
+            raise ValueError(f"Deadband heartbeat for '{match}' must be positive")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(
+            config['match'],
+            config.get('absolute', 0),
+            config.get('relative', 0),
+            config.get('heartbeat', 60)
+        )
+
+    def changed(self, value: float, last: float) -> bool:
+        """Whether ``value`` is outside the deadband around ``last``"""
+        if value != value or last != last:
+            # NaN only ever equals NaN here
+            return (value != value) != (last != last)
+        return abs(value - last) > max(self.absolute, self.relative * abs(last))
+
+
+class Deadband:
+    """Last forwarded value and time per series, for all deadband rules"""
+
+    def __init__(self, rules: list, max_series: int = 100000):
+        self.rules = rules
+        self.max_series = max_series
+        self.last = {}
+        self.matcher = RuleMatcher(rules, max_cached=10 * max_series)
+        # A series kept past its heartbeat only costs memory, so pruning more often than that gains nothing
+        self.prune_interval_ms = min((rule.heartbeat_ms for rule in rules), default=60000)
+        self._pruned_at = None
+        gauge_function(deadband_series, lambda: len(self.last))
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build a deadband filter from the ``deadband`` config section, or None if unused"""
+        rules = [DeadbandRule.from_config(rule) for rule in (config or {}).get('rules', [])]
+        if not rules:
+            return None
+        logger.info(f"Deadband filtering enabled with {len(rules)} rule(s)")
+        return cls(rules, int(config.get('max_series', 100000)))
+
+    def filter(self, entries: list, now_ms: int = None) -> list:
+        """Return the (name, labels, value, timestamp) entries that should be forwarded"""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        out = []
+        last = self.last
+        suppressed = 0
+        for entry in entries:
+            name, labels, value, timestamp = entry
+            rule = self.matcher.rule_for(name)
+            if rule is None:
+                out.append(entry)
+                continue
+
+            ts = now_ms if timestamp is None else int(timestamp)
+            value = float(value)
+            key = series_key(name, labels)
+            state = last.get(key)
+            if state is None:
+                if len(last) < self.max_series:
+                    last[key] = [value, ts]
+                out.append(entry)
+                continue
+            if ts < state[1]:
+                # Out of order: forward it, but keep the newer reference point
+                out.append(entry)
+                continue
+            if ts - state[1] >= rule.heartbeat_ms or rule.changed(value, state[0]):
+                state[0] = value
+                state[1] = ts
+                out.append(entry)
+            else:
+                suppressed += 1
+
+        if suppressed:
+            deadband_samples.labels(result='suppressed').inc(suppressed)
+        if len(entries) > suppressed:
+            deadband_samples.labels(result='forwarded').inc(len(entries) - suppressed)
+        return out
+
+    def prune(self, now_ms: int = None):
+        """Forget series whose heartbeat is already due; their next sample is forwarded either way.
+
+        Runs at most once per shortest heartbeat however often it is called.
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        if self._pruned_at is not None and now_ms - self._pruned_at < self.prune_interval_ms:
+            return
+        self._pruned_at = now_ms
+        stale = [
+            key for key, (_, ts) in self.last.items()
+            if now_ms - ts >= self.matcher.rule_for(key[0]).heartbeat_ms
+        ]
+        for key in stale:
+            del self.last[key]
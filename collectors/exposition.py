@@ -0,0 +1,26 @@
+"""Prometheus text exposition helpers for Sentio IoT Collectors"""
+import math
+
+
+def escape_label_value(value) -> str:
+    """Escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_series(name: str, labels: dict) -> str:
+    """Render ``name{k="v",...}`` for a series"""
+    if not labels:
+        return name
+    label_str = ','.join(f'{k}="{escape_label_value(v)}"' for k, v in labels.items())
+    return f"{name}{{{label_str}}}"
+
+
+def format_value(value) -> str:
+    """Format a sample value, spelling NaN and infinities the Prometheus way"""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
@@ -0,0 +1,89 @@
+"""Adaptive flush sizing for Sentio IoT Collectors
+
+Each collector's batch size and flush delay are tuned from what its sink
+reports back. Batches grow additively while flushes stay under the latency
+target and shrink multiplicatively when a flush is slow, too large or fails
+(AIMD). The flush delay is chosen so that buffering plus delivery stays near
+the collector's target end-to-end delay, and backs off while the sink errors.
+"""
+import logging
+
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+flush_batch_size = Gauge(
+    'sentio_flush_batch_size', 'Entries per flush chosen by the flush controller', ['sink'],
+    multiprocess_mode='livemax'
+)
+flush_delay = Gauge(
+    'sentio_flush_delay_seconds', 'Flush delay chosen by the flush controller', ['sink'],
+    multiprocess_mode='livemax'
+)
+flush_latency = Gauge(
+    'sentio_flush_latency_seconds', 'Smoothed flush latency seen by the flush controller', ['sink'],
+    multiprocess_mode='livemax'
+)
+
+
+class FlushController:
+    """AIMD controller for one collector's batch size and flush delay"""
+
+    def __init__(self, sink: str, batch_size: int, delay: float, min_batch: int, max_batch: int,
+                 min_delay: float = 0.5, max_delay: float = 60, target_latency: float = 1.0,
+                 max_payload_bytes: int = 8 * 1024 * 1024, increase: int = None, decrease: float = 0.5,
+                 smoothing: float = 0.3, adaptive: bool = True):
+        self.sink = sink
+        self.target_delay = delay
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self.increase = increase or max(1, min_batch)
+        self.decrease = decrease
+        self.smoothing = smoothing
+        self.adaptive = adaptive
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.batch_size = batch_size
+        self.delay = delay
+        self._export()
+
+    def _export(self):
+        flush_batch_size.labels(sink=self.sink).set(self.batch_size)
+        flush_delay.labels(sink=self.sink).set(self.delay)
+        flush_latency.labels(sink=self.sink).set(self.latency)
+
+    def _shrink(self):
+        self.batch_size = max(self.min_batch, int(self.batch_size * self.decrease))
+
+    def on_success(self, latency: float, payload_bytes: int, entries: int):
+        """Record a delivered flush of ``entries`` entries"""
+        self.latency += self.smoothing * (latency - self.latency)
+        self.error_rate *= 1 - self.smoothing
+        self.consecutive_errors = 0
+        if not self.adaptive:
+            return
+        if latency > self.target_latency or payload_bytes > self.max_payload_bytes:
+            self._shrink()
+        elif entries >= self.batch_size and self.error_rate < 0.1:
+            # Only grow when the size limit is what triggered the flush and the sink is healthy
+            self.batch_size = min(self.max_batch, self.batch_size + self.increase)
+        # Leave room for delivery within the end-to-end target
+        self.delay = min(self.max_delay, max(self.min_delay, self.target_delay - self.latency))
+        self._export()
+
+    def on_error(self):
+        """Record a failed flush: shrink the batch and back off the delay"""
+        self.error_rate += self.smoothing * (1 - self.error_rate)
+        self.consecutive_errors += 1
+        if not self.adaptive:
+            return
+        self._shrink()
+        self.delay = min(self.max_delay, max(self.delay, self.min_delay) * 2)
+        if self.consecutive_errors == 1:
+            logger.info(f"{self.sink} flush failed, reducing batch size to {self.batch_size}")
+        self._export()
@@ -0,0 +1,216 @@
+"""Request body decoding for Sentio IoT Collectors"""
+import json
+import logging
+import math
+import zlib
+
+from compression import StreamDecoder, UnsupportedEncoding, zstandard
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/ndjson')
+READ_CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+# Metric timestamps are buffered as int64 milliseconds
+MIN_TIMESTAMP_MS = -2 ** 63
+MAX_TIMESTAMP_MS = 2 ** 63 - 1
+
+
+def is_ndjson(request) -> bool:
+    """Check whether a request carries newline-delimited JSON"""
+    return request.content_type in NDJSON_CONTENT_TYPES
+
+
+class IngestError(Exception):
+    """A request body that cannot be decoded, carrying the HTTP status to return"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+DECODE_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+async def iter_body_chunks(request):
+    """Yield the request body in chunks as it arrives, inflating it per Content-Encoding.
+
+    Decompression is streamed so a large compressed body is never fully
+    inflated in memory.
+    """
+    encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    if encoding in ('', 'identity'):
+        async for chunk in request.content.iter_chunked(READ_CHUNK_SIZE):
+            yield chunk
+        return
+
+    try:
+        decoder = StreamDecoder(encoding, READ_CHUNK_SIZE)
+    except UnsupportedEncoding as e:
+        raise IngestError(str(e), status=415)
+    try:
+        async for chunk in request.content.iter_chunked(READ_CHUNK_SIZE):
+            for piece in decoder.decode(chunk):
+                yield piece
+        for piece in decoder.finish():
+            yield piece
+    except DECODE_ERRORS as e:
+        raise IngestError(f"invalid {encoding} body: {e}")
+
+
+async def read_body(request, max_size: int) -> bytes:
+    """Read a whole (possibly compressed) request body, bounded after inflation"""
+    body = bytearray()
+    async for chunk in iter_body_chunks(request):
+        body += chunk
+        if len(body) > max_size:
+            raise IngestError(f"request body exceeds {max_size} bytes", status=413)
+    return bytes(body)
+
+
+async def iter_ndjson_lines(chunks, max_line_size: int):
+    """Split a chunked byte stream into lines, yielding (line_no, bytes | None).
+
+    Lines longer than max_line_size are skipped and yielded as None so the
+    caller can report them without the whole line ever being held in memory.
+    """
+    pending = bytearray()
+    line_no = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            if end == -1:
+                if not oversized:
+                    pending += chunk[start:]
+                    if len(pending) > max_line_size:
+                        pending.clear()
+                        oversized = True
+                break
+            line_no += 1
+            if oversized:
+                yield line_no, None
+            else:
+                pending += chunk[start:end]
+                if len(pending) > max_line_size:
+                    yield line_no, None
+                else:
+                    yield line_no, bytes(pending)
+            pending.clear()
+            oversized = False
+            start = end + 1
+    if oversized or pending:
+        line_no += 1
+        yield line_no, None if oversized else bytes(pending)
+
+
+class BatchResult:
+    """Accumulates accepted/rejected counts for a single ingestion request"""
+
+    def __init__(self, position_key: str = 'index'):
+        self.position_key = position_key
+        self.accepted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.failed = 0
+        self.errors = []
+
+    def reject(self, position: int, error: str):
+        """Record a rejected entry"""
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({self.position_key: position, 'error': error})
+
+    def drop(self, position: int):
+        """Record an entry shed because the collector is under memory pressure"""
+        self.shed += 1
+        self.reject(position, "dropped under memory pressure, retry later")
+
+    def fail(self, position: int, error: str):
+        """Record a valid entry the collector failed to buffer"""
+        self.failed += 1
+        self.reject(position, error)
+
+    @property
+    def status(self) -> str:
+        if not self.rejected:
+            return 'ok'
+        return 'partial' if self.accepted else 'rejected'
+
+    @property
+    def http_status(self) -> int:
+        if self.status != 'rejected':
+            return 200
+        if self.shed:
+            return 429
+        return 500 if self.failed else 400
+
+    def to_dict(self) -> dict:
+        result = {
+            'status': self.status,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        }
+        if self.shed:
+            result['shed'] = self.shed
+        if self.errors:
+            result['errors'] = self.errors
+            result['errors_truncated'] = self.rejected > len(self.errors)
+        return result
+
+
+async def iter_ndjson_records(request, max_line_size: int):
+    """Yield (line_no, record, error) for each non-blank NDJSON line"""
+    async for line_no, line in iter_ndjson_lines(iter_body_chunks(request), max_line_size):
+        if line is None:
+            yield line_no, None, f"line exceeds {max_line_size} bytes"
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line), None
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+
+
+def validate_metric(data) -> dict:
+    """Validate a metric sample, raising ValueError on malformed input"""
+    if not isinstance(data, dict):
+        raise ValueError("metric must be a JSON object")
+    if not isinstance(data.get('name', 'unknown'), str):
+        raise ValueError("'name' must be a string")
+    value = data.get('value', 0)
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("'value' must be a number")
+    try:
+        float(value)
+    except ValueError:
+        raise ValueError(f"'value' is not numeric: {value!r}")
+    except OverflowError:
+        raise ValueError("'value' is out of range for a float")
+    if not isinstance(data.get('labels', {}), dict):
+        raise ValueError("'labels' must be an object")
+    timestamp = data.get('timestamp')
+    if timestamp is not None:
+        if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+            raise ValueError("'timestamp' must be a number")
+        if isinstance(timestamp, float) and not math.isfinite(timestamp):
+            raise ValueError(f"'timestamp' is not finite: {timestamp!r}")
+        if not MIN_TIMESTAMP_MS <= int(timestamp) <= MAX_TIMESTAMP_MS:
+            raise ValueError(f"'timestamp' is out of range: {timestamp!r}")
+    return data
+
+
+def validate_log(data) -> dict:
+    """Validate a log entry, raising ValueError on malformed input"""
+    if not isinstance(data, dict):
+        raise ValueError("log entry must be a JSON object")
+    if not isinstance(data.get('message', ''), str):
+        raise ValueError("'message' must be a string")
+    if not isinstance(data.get('labels', {}), dict):
+        raise ValueError("'labels' must be an object")
+    timestamp = data.get('timestamp')
+    if timestamp is not None and (isinstance(timestamp, bool) or not isinstance(timestamp, (int, float, str))):
+        raise ValueError("'timestamp' must be a number or a string")
+    return data
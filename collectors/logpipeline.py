@@ -0,0 +1,273 @@
+"""Log processing pipeline for Sentio IoT Collectors
+
+Configured stages run over each log entry before it is buffered for Loki:
+regex, logfmt and JSON extractors pull fields out of the line, a labels stage
+promotes a few of them to stream labels, drop stages discard lines by rule
+and a timestamp stage sets the entry time from a field. Expressions and field
+paths are compiled once at startup. Extracted fields only live for the run of
+the pipeline; the line itself is forwarded unchanged.
+"""
+import fnmatch
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+pipeline_lines = Counter(
+    'sentio_log_pipeline_lines_total', 'Log lines handled per pipeline stage', ['stage', 'result']
+)
+pipeline_seconds = Counter(
+    'sentio_log_pipeline_seconds_total', 'Time spent per pipeline stage', ['stage']
+)
+
+_LOGFMT = re.compile(r'([^\s=]+)=("(?:[^"\\]|\\.)*"|\S*)')
+_LOGFMT_ESCAPE = re.compile(r'\\(.)')
+_LOGFMT_ESCAPES = {'"': '"', '\\': '\\', 'n': '\n', 't': '\t', 'r': '\r'}
+_json_decoder = json.JSONDecoder()
+
+TIMESTAMP_UNITS = {'unix': 1_000_000_000, 'unix_ms': 1_000_000, 'unix_us': 1_000, 'unix_ns': 1}
+
+
+class Stage:
+    """One pipeline step, applied to entries whose labels match its selector"""
+
+    type = None
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.source = config.get('source')
+        self.selector = {str(k): str(v) for k, v in (config.get('match') or {}).items()}
+
+    def source_value(self, log: dict, fields: dict):
+        if self.source is None:
+            return log.get('message', '')
+        return fields.get(self.source)
+
+    def selects(self, log: dict) -> bool:
+        if not self.selector:
+            return True
+        labels = log.get('labels') or {}
+        return all(fnmatch.fnmatchcase(str(labels.get(key, '')), pattern) for key, pattern in self.selector.items())
+
+    def apply(self, log: dict, fields: dict):
+        """Process one entry: return False to drop it, None if the stage found nothing to act on"""
+        raise NotImplementedError
+
+
+class RegexStage(Stage):
+    type = 'regex'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        self.expression = re.compile(config['expression'])
+        if not self.expression.groupindex:
+            raise ValueError(f"Log pipeline stage '{name}' needs named groups")
+
+    def apply(self, log: dict, fields: dict):
+        value = self.source_value(log, fields)
+        match = self.expression.search(value) if isinstance(value, str) else None
+        if match is None:
+            return None
+        fields.update((k, v) for k, v in match.groupdict().items() if v is not None)
+        return True
+
+
+class LogfmtStage(Stage):
+    type = 'logfmt'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        self.fields = set(config.get('fields') or ())
+
+    def apply(self, log: dict, fields: dict):
+        value = self.source_value(log, fields)
+        if not isinstance(value, str):
+            return None
+        found = False
+        for key, raw in _LOGFMT.findall(value):
+            if self.fields and key not in self.fields:
+                continue
+            if raw.startswith('"'):
+                # Unescape in one pass so ``"x\\"`` decodes to ``x\``
+                raw = _LOGFMT_ESCAPE.sub(lambda m: _LOGFMT_ESCAPES.get(m.group(1), m.group(0)), raw[1:-1])
+            fields[key] = raw
+            found = True
+        return True if found else None
+
+
+class JSONStage(Stage):
+    """Decodes the first complete JSON object in the source, so prefixed fragments parse too"""
+
+    type = 'json'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        paths = config.get('fields')
+        if isinstance(paths, list):
+            paths = {path: path for path in paths}
+        self.paths = {field: path.split('.') for field, path in (paths or {}).items()}
+
+    def apply(self, log: dict, fields: dict):
+        value = self.source_value(log, fields)
+        if not isinstance(value, str):
+            return None
+        document = None
+        start = value.find('{')
+        while start >= 0 and document is None:
+            try:
+                document, _ = _json_decoder.raw_decode(value, start)
+            except ValueError:
+                start = value.find('{', start + 1)
+        if document is None:
+            return None
+        if not self.paths:
+            fields.update(
+                (k, v) for k, v in document.items() if isinstance(v, (str, int, float, bool)) and v is not None
+            )
+            return True
+        for field, path in self.paths.items():
+            node = document
+            for key in path:
+                node = node.get(key) if isinstance(node, dict) else None
+            if node is not None and not isinstance(node, (dict, list)):
+                fields[field] = node
+        return True
+
+
+class LabelsStage(Stage):
+    """Promotes extracted fields to stream labels, as ``{label: field}``"""
+
+    type = 'labels'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        labels = config['labels']
+        self.labels = {label: label for label in labels} if isinstance(labels, list) else dict(labels)
+
+    def apply(self, log: dict, fields: dict):
+        promoted = {label: str(fields[field]) for label, field in self.labels.items() if field in fields}
+        if not promoted:
+            return None
+        log['labels'] = {**(log.get('labels') or {}), **promoted}
+        return True
+
+
+class DropStage(Stage):
+    """Drops entries whose source matches ``expression`` or whose ``field`` is one of ``values``"""
+
+    type = 'drop'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        expression = config.get('expression')
+        self.expression = re.compile(expression) if expression else None
+        self.field = config.get('field')
+        self.values = {str(v) for v in config.get('values') or ()}
+        if self.expression is None and not self.field:
+            raise ValueError(f"Log pipeline stage '{name}' needs an expression or a field")
+
+    def apply(self, log: dict, fields: dict):
+        if self.field:
+            if self.field not in fields:
+                return True
+            if self.values and str(fields[self.field]) not in self.values:
+                return True
+            if self.expression is None:
+                return False
+        value = self.source_value(log, fields)
+        if isinstance(value, str) and self.expression.search(value):
+            return False
+        return True
+
+
+class TimestampStage(Stage):
+    """Sets the entry time from a field in unix units, RFC 3339 or a strptime format"""
+
+    type = 'timestamp'
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        self.field = config['field']
+        self.format = config.get('format', 'rfc3339')
+        self.unit = TIMESTAMP_UNITS.get(self.format)
+
+    def parse(self, value) -> int:
+        if self.unit is not None:
+            if isinstance(value, str) and '.' not in value:
+                return int(value) * self.unit
+            return int(float(value) * self.unit)
+        if self.format == 'rfc3339':
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        else:
+            parsed = datetime.strptime(str(value), self.format)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp()) * 1_000_000_000 + parsed.microsecond * 1000
+
+    def apply(self, log: dict, fields: dict):
+        value = fields.get(self.field)
+        if value is None:
+            return None
+        try:
+            log['timestamp'] = self.parse(value)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        return True
+
+
+STAGE_TYPES = {stage.type: stage for stage in (RegexStage, LogfmtStage, JSONStage, LabelsStage, DropStage,
+                                                TimestampStage)}
+
+
+class LogPipeline:
+    """Ordered processing stages applied to batches of log entries"""
+
+    def __init__(self, stages: list):
+        self.stages = stages
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build the pipeline from the ``log_pipeline`` config section, or None if it has no stages"""
+        stages = []
+        for index, stage in enumerate((config or {}).get('stages', [])):
+            stage_type = STAGE_TYPES.get(stage.get('type'))
+            if stage_type is None:
+                raise ValueError(f"Unknown log pipeline stage type '{stage.get('type')}'")
+            stages.append(stage_type(stage.get('name') or f"{index}-{stage_type.type}", stage))
+        if not stages:
+            return None
+        logger.info(f"Log pipeline enabled with {len(stages)} stage(s)")
+        return cls(stages)
+
+    def process(self, logs: list) -> list:
+        """Run every stage over a batch, returning the entries that were not dropped"""
+        fields = [{} for _ in logs]
+        for stage in self.stages:
+            started = time.perf_counter()
+            kept_logs, kept_fields = [], []
+            processed = unmatched = dropped = 0
+            for log, log_fields in zip(logs, fields):
+                if stage.selects(log):
+                    result = stage.apply(log, log_fields)
+                    if result is False:
+                        dropped += 1
+                        continue
+                    if result is None:
+                        unmatched += 1
+                    else:
+                        processed += 1
+                kept_logs.append(log)
+                kept_fields.append(log_fields)
+            pipeline_seconds.labels(stage=stage.name).inc(time.perf_counter() - started)
+            for result, count in (('processed', processed), ('unmatched', unmatched), ('dropped', dropped)):
+                if count:
+                    pipeline_lines.labels(stage=stage.name, result=result).inc(count)
+            logs, fields = kept_logs, kept_fields
+            if not logs:
+                break
+        return logs
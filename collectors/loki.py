@@ -0,0 +1,71 @@
+"""Loki push payload encoding for Sentio IoT Collectors"""
+import json
+import time
+
+from protowire import field_bytes, field_string, field_varint, snappy_compress
+
+PROTOBUF_CONTENT_TYPE = 'application/x-protobuf'
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def timestamp_ns(log: dict) -> int:
+    """Entry timestamp in nanoseconds, defaulting to now"""
+    timestamp = log.get('timestamp')
+    if timestamp is None:
+        return time.time_ns()
+    try:
+        return int(timestamp)
+    except (TypeError, ValueError):
+        return time.time_ns()
+
+
+def group_streams(batch: list) -> dict:
+    """Group log entries by canonical label set, each stream sorted by timestamp.
+
+    Returns ``{(('key', 'value'), ...): [(timestamp_ns, line), ...]}``.
+    """
+    streams = {}
+    for log in batch:
+        labels = log.get('labels')
+        key = tuple(sorted((str(k), str(v)) for k, v in labels.items())) if labels else ()
+        entries = streams.get(key)
+        if entries is None:
+            entries = streams[key] = []
+        entries.append((timestamp_ns(log), log.get('message', '')))
+    for entries in streams.values():
+        entries.sort(key=lambda entry: entry[0])
+    return streams
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key: tuple) -> str:
+    """Render a canonical label tuple as a LogQL stream selector"""
+    return '{' + ', '.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+
+def encode_json(streams: dict) -> bytes:
+    """Encode grouped streams as a Loki JSON push body"""
+    payload = {
+        "streams": [
+            {"stream": dict(key), "values": [[str(ts), line] for ts, line in entries]}
+            for key, entries in streams.items()
+        ]
+    }
+    return json.dumps(payload).encode('utf-8')
+
+
+def encode_protobuf(streams: dict) -> bytes:
+    """Encode grouped streams as a snappy-compressed Loki ``PushRequest``"""
+    body = bytearray()
+    for key, entries in streams.items():
+        stream = bytearray(field_string(1, format_labels(key)))
+        for ts, line in entries:
+            # EntryAdapter{timestamp: Timestamp{seconds, nanos}, line}
+            seconds, nanos = divmod(ts, 1_000_000_000)
+            timestamp = field_varint(1, seconds) + field_varint(2, nanos)
+            stream += field_bytes(2, field_bytes(1, timestamp) + field_string(2, line))
+        body += field_bytes(1, bytes(stream))
+    return snappy_compress(bytes(body))
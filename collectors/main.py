@@ -3,11 +3,13 @@ Sentio IoT Collectors Service
 Handles metrics, logs, and traces collection from devices
 """
 import os
+import sys
+import threading
 import time
 import logging
 from datetime import datetime
 from aiohttp import web
-from prometheus_client import Counter, Gauge, Histogram, generate_latest
+from prometheus_client import Counter, Gauge, Histogram
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -15,7 +17,51 @@ from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExport
 from opentelemetry.sdk.resources import Resource
 import asyncio
 import json
-import requests
+import math
+from contextlib import suppress
+
+import loki
+import otlp
+from aggregation import Aggregator
+from cardinality import CardinalityGuard
+from config import load_config
+from deadband import Deadband
+from flowcontrol import FlushController
+
+from ingest import (
+    BatchResult,
+    IngestError,
+    is_ndjson,
+    iter_ndjson_records,
+    read_body,
+    validate_log,
+    validate_metric,
+)
+from logpipeline import LogPipeline
+from pressure import (
+    PRIORITY_DEBUG_LOGS,
+    PRIORITY_LOGS,
+    PRIORITY_METRICS,
+    PRIORITY_TRACES,
+    STATE_VALUES,
+    MemoryBudget,
+    log_priority,
+    log_size,
+    metric_size,
+    span_size,
+)
+from profiling import ProfilerBusy, format_folded, sample_stacks
+from exposition import format_value
+from protowire import ProtobufError, snappy_available
+from remote_write import decode_write_request
+from samples import SampleBuffer
+from sampling import TailSampler
+from selfmetrics import MULTIPROCESS, gauge_function, generate_metrics, start_lag_monitor, start_sync_loop
+from series import SeriesTable
+from sinks import HTTPSink
+from spool import SegmentSpool
+from supervisor import Supervisor, worker_id
+from tenants import DEFAULT_TENANT, FairQueue, TenantQueue, TenantSettings
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +74,60 @@ logger = logging.getLogger(__name__)
 VICTORIAMETRICS_URL = os.getenv('VICTORIAMETRICS_URL', 'http://victoriametrics:8428')
 LOKI_URL = os.getenv('LOKI_URL', 'http://loki:3100')
 TEMPO_URL = os.getenv('TEMPO_URL', 'http://tempo:3200')
+TEMPO_OTLP_URL = os.getenv('TEMPO_OTLP_URL', 'http://tempo:4318')
+
+# Collectors config file (aggregation rules and other per-pipeline settings)
+CONFIG_PATH = os.getenv('COLLECTOR_CONFIG_PATH', '/app/config/collectors.yml')
+collector_config = load_config(CONFIG_PATH)
+tenant_settings = TenantSettings(collector_config.get('tenants'))
+
+# Ingestion limits
+MAX_BODY_SIZE = int(os.getenv('COLLECTOR_MAX_BODY_SIZE', str(16 * 1024 * 1024)))
+NDJSON_MAX_LINE_SIZE = int(os.getenv('COLLECTOR_NDJSON_MAX_LINE_SIZE', str(1024 * 1024)))
+INGEST_BATCH_SIZE = int(os.getenv('COLLECTOR_INGEST_BATCH_SIZE', '500'))
+
+# Sink settings
+SINK_MAX_IN_FLIGHT = int(os.getenv('COLLECTOR_SINK_MAX_IN_FLIGHT', '4'))
+SINK_TIMEOUT = float(os.getenv('COLLECTOR_SINK_TIMEOUT', '10'))
+VICTORIAMETRICS_COMPRESSION = os.getenv('COLLECTOR_VICTORIAMETRICS_COMPRESSION', 'gzip')
+LOKI_COMPRESSION = os.getenv('COLLECTOR_LOKI_COMPRESSION', 'gzip')
+TEMPO_COMPRESSION = os.getenv('COLLECTOR_TEMPO_COMPRESSION', 'gzip')
+LOKI_PUSH_FORMAT = os.getenv('COLLECTOR_LOKI_PUSH_FORMAT', 'protobuf')  # protobuf or json
+SINK_COMPRESSION_LEVEL = int(os.getenv('COLLECTOR_SINK_COMPRESSION_LEVEL', '-1'))
+SINK_COMPRESSION_MIN_BYTES = int(os.getenv('COLLECTOR_SINK_COMPRESSION_MIN_BYTES', '1024'))
+
+# Write-ahead spool (disabled unless a directory is configured)
+SPOOL_DIR = os.getenv('COLLECTOR_SPOOL_DIR', '')
+SPOOL_MAX_BYTES = int(os.getenv('COLLECTOR_SPOOL_MAX_BYTES', str(1024 * 1024 * 1024)))
+SPOOL_SEGMENT_BYTES = int(os.getenv('COLLECTOR_SPOOL_SEGMENT_BYTES', str(8 * 1024 * 1024)))
+SPOOL_FSYNC_INTERVAL = float(os.getenv('COLLECTOR_SPOOL_FSYNC_INTERVAL', '1'))
+SPOOL_REPLAY_RATE = int(os.getenv('COLLECTOR_SPOOL_REPLAY_RATE', str(1024 * 1024)))  # bytes/second
+
+# Memory budget shared by all collector buffers; lower priorities are shed first
+MAX_BUFFER_BYTES = int(os.getenv('COLLECTOR_MAX_BUFFER_BYTES', str(256 * 1024 * 1024)))
+SHED_DEBUG_LOGS_AT = float(os.getenv('COLLECTOR_SHED_DEBUG_LOGS_AT', '0.5'))
+SHED_TRACES_AT = float(os.getenv('COLLECTOR_SHED_TRACES_AT', '0.7'))
+SHED_LOGS_AT = float(os.getenv('COLLECTOR_SHED_LOGS_AT', '0.8'))
+
+# Worker processes sharing the listening port (1 runs a single process)
+WORKERS = int(os.getenv('COLLECTOR_WORKERS', '1'))
+WORKER_METRICS_DIR = os.getenv('COLLECTOR_METRICS_DIR', '/tmp/sentio-collectors-metrics')
+WORKER_DRAIN_TIMEOUT = float(os.getenv('COLLECTOR_DRAIN_TIMEOUT', '90'))
+
+# Adaptive flush sizing (batch size and delay tuned per sink)
+ADAPTIVE_FLUSH = os.getenv('COLLECTOR_ADAPTIVE_FLUSH', 'true').lower() in ('1', 'true', 'yes')
+FLUSH_TARGET_LATENCY = float(os.getenv('COLLECTOR_FLUSH_TARGET_LATENCY', '1.0'))
+FLUSH_MAX_PAYLOAD_BYTES = int(os.getenv('COLLECTOR_FLUSH_MAX_PAYLOAD_BYTES', str(8 * 1024 * 1024)))
+
+# Interned series table (pre-rendered exposition prefixes)
+SERIES_CACHE_SIZE = int(os.getenv('COLLECTOR_SERIES_CACHE_SIZE', '100000'))
+
+# Samples a new tenant queue buffer holds before it first grows
+SAMPLE_BUFFER_INITIAL_CAPACITY = 64
+
+# Live CPU profiling on /debug/profile (off unless enabled)
+PROFILING_ENABLED = os.getenv('COLLECTOR_PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILING_MAX_SECONDS = float(os.getenv('COLLECTOR_PROFILING_MAX_SECONDS', '60'))
 
 # Initialize OpenTelemetry
 resource = Resource.create({"service.name": "sentio-collectors"})
@@ -44,159 +144,668 @@ metrics_received = Counter('sentio_metrics_received_total', 'Total metrics recei
 logs_received = Counter('sentio_logs_received_total', 'Total logs received')
 traces_received = Counter('sentio_traces_received_total', 'Total traces received')
 collection_errors = Counter('sentio_collection_errors_total', 'Total collection errors')
-collection_duration = Histogram('sentio_collection_duration_seconds', 'Collection duration')
+collection_duration = Histogram(
+    'sentio_collection_duration_seconds', 'Time spent per collector stage (decode, buffer, encode, compress, send)',
+    ['collector', 'stage'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+buffer_bytes = Gauge(
+    'sentio_buffer_bytes', 'Bytes held by collector buffers, including in-flight flushes', ['collector'],
+    multiprocess_mode='livesum'
+)
+buffer_entries = Gauge(
+    'sentio_buffer_entries', 'Entries queued in collector buffers, excluding in-flight flushes', ['collector'],
+    multiprocess_mode='livesum'
+)
+buffer_pressure = Gauge(
+    'sentio_buffer_pressure_state', 'Buffer memory pressure (0=ok, 1=shedding, 2=full)', multiprocess_mode='livemax'
+)
+entries_shed = Counter('sentio_entries_shed_total', 'Entries dropped under memory pressure', ['collector', 'priority'])
+spans_dropped = Counter('sentio_spans_dropped_total', 'Spans dropped by the traces collector', ['reason'])
+sink_flush_duration = Histogram(
+    'sentio_sink_flush_duration_seconds', 'Time to deliver one flushed batch to a sink', ['sink']
+)
+requests_throttled = Counter('sentio_requests_throttled_total', 'Ingestion requests rejected with HTTP 429', ['collector'])
 
+memory_budget = MemoryBudget(MAX_BUFFER_BYTES, {
+    PRIORITY_DEBUG_LOGS: SHED_DEBUG_LOGS_AT,
+    PRIORITY_TRACES: SHED_TRACES_AT,
+    PRIORITY_LOGS: SHED_LOGS_AT,
+    PRIORITY_METRICS: 1.0,
+})
+gauge_function(buffer_pressure, lambda: STATE_VALUES[memory_budget.state])
 
-class MetricsCollector:
-    """Collects and forwards metrics to VictoriaMetrics"""
+
+def create_spool(kind: str, sink_name: str):
+    """Create the write-ahead spool for a collector if spooling is enabled"""
+    if not SPOOL_DIR:
+        return None
+    # Each worker replays only its own spool; worker 0 keeps the single-process layout
+    worker = worker_id()
+    directory = os.path.join(SPOOL_DIR, f"worker-{worker}", kind) if worker else os.path.join(SPOOL_DIR, kind)
+    return SegmentSpool(
+        directory,
+        sink_name,
+        max_bytes=SPOOL_MAX_BYTES,
+        segment_bytes=SPOOL_SEGMENT_BYTES,
+        fsync_interval=SPOOL_FSYNC_INTERVAL
+    )
+
+
+def orphaned_spools(spool: SegmentSpool) -> list:
+    """Spools left behind by workers beyond COLLECTOR_WORKERS, for the first worker to replay"""
+    if spool is None or worker_id():
+        return []
+    kind = os.path.basename(spool.directory)
+    orphans = []
+    for entry in sorted(os.listdir(SPOOL_DIR)):
+        prefix, _, index = entry.partition('-')
+        if prefix != 'worker' or not index.isdigit() or 0 < int(index) < WORKERS:
+            continue
+        directory = os.path.join(SPOOL_DIR, entry, kind)
+        if os.path.isdir(directory):
+            orphans.append(SegmentSpool(directory, f"{spool.name}/{entry}", max_bytes=0))
+    return orphans
+
+
+def remove_spool_directory(directory: str):
+    """Remove an emptied spool directory, and its worker directory once that is empty too"""
+    for path in (directory, os.path.dirname(directory)):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+
+
+class BufferedCollector:
+    """Base class for collectors that buffer data and flush it to a sink"""
     
-    def __init__(self):
-        self.buffer = []
-        self.buffer_size = 1000
-        self.flush_interval = 10  # seconds
+    # Highest shedding priority of anything this collector buffers
+    top_priority = PRIORITY_METRICS
     
-    async def collect_metric(self, metric_data: dict):
-        """Collect a single metric"""
-        try:
-            self.buffer.append(metric_data)
-            metrics_received.inc()
-            
-            if len(self.buffer) >= self.buffer_size:
-                await self.flush()
-        except Exception as e:
-            logger.error(f"Error collecting metric: {e}")
-            collection_errors.inc()
+    def __init__(self, name: str, sink: HTTPSink, buffer_size: int, flush_interval: float,
+                 spool: SegmentSpool = None):
+        self.name = name
+        self.sink = sink
+        self.spool = spool
+        self.flow = FlushController(
+            sink.name, buffer_size, flush_interval,
+            min_batch=max(1, buffer_size // 10),
+            max_batch=buffer_size * 50,
+            target_latency=FLUSH_TARGET_LATENCY,
+            max_payload_bytes=FLUSH_MAX_PAYLOAD_BYTES,
+            adaptive=ADAPTIVE_FLUSH
+        )
+        self.queues = FairQueue(
+            name, tenant_settings, MAX_BUFFER_BYTES, self.new_buffer, self.split_buffer, self.join_buffers
+        )
+        self._flush_tasks = set()
+        self._unsettled = set()
+        gauge_function(buffer_bytes.labels(collector=name), lambda: memory_budget.used(name))
+        gauge_function(buffer_entries.labels(collector=name), lambda: len(self.queues))
+        self.stage_duration = {
+            stage: collection_duration.labels(collector=name, stage=stage)
+            for stage in ('decode', 'buffer', 'encode', 'compress', 'send')
+        }
     
-    async def flush(self):
-        """Flush metrics buffer to VictoriaMetrics"""
-        if not self.buffer:
-            return
+    @property
+    def buffer_size(self) -> int:
+        """Entries that trigger a flush, as chosen by the flush controller"""
+        return self.flow.batch_size
+    
+    @property
+    def flush_interval(self) -> float:
+        """Seconds between periodic flushes, as chosen by the flush controller"""
+        return self.flow.delay
+    
+    @property
+    def retry_after(self) -> int:
+        """Seconds a throttled sender should wait before retrying"""
+        return max(1, math.ceil(self.flush_interval))
+    
+    def accepting(self) -> bool:
+        """Whether any new data can be buffered at all"""
+        return memory_budget.admits(self.top_priority)
+    
+    def priority(self, entry: dict) -> str:
+        """Shedding priority of an entry"""
+        return self.top_priority
+    
+    def entry_size(self, entry: dict) -> int:
+        """Approximate in-memory size of an entry - to be implemented by subclasses"""
+        raise NotImplementedError
+    
+    def tenant_of(self, labels: dict, tenant: str = None) -> str:
+        """Tenant of an entry: the request's tenant header, else the entry's tenant label"""
+        if tenant:
+            return tenant
+        value = labels.get(tenant_settings.label) if labels else None
+        return str(value) if value else DEFAULT_TENANT
+    
+    def group_by_tenant(self, records: list, tenant: str = None) -> dict:
+        """Split validated records by tenant"""
+        if tenant:
+            return {tenant: records}
+        groups = {}
+        for record in records:
+            groups.setdefault(self.tenant_of(record.get('labels')), []).append(record)
+        return groups
+    
+    def admit(self, entry, pending: int = 0, tenant: str = None) -> bool:
+        """Check an entry against its tenant's quota and the memory budget, counting it if refused"""
+        if tenant is None and isinstance(entry, dict):
+            tenant = self.tenant_of(entry.get('labels'))
+        if not self.queues.admits(tenant, pending):
+            self.queues.reject(tenant)
+            return False
+        priority = self.priority(entry)
+        if memory_budget.admits(priority, pending):
+            return True
+        entries_shed.labels(collector=self.name, priority=priority).inc()
+        self.queues.reject(tenant, 'shed')
+        return False
+    
+    def account(self, entries: list, queue: TenantQueue):
+        """Charge entries newly buffered in a tenant queue to the memory budget"""
+        size = sum(self.entry_size(entry) for entry in entries)
+        memory_budget.add(self.name, size)
+        self.queues.add(queue, len(entries), size)
+    
+    async def maybe_flush(self):
+        """Ship a batch once enough is buffered without stalling ingestion.
         
+        Flushes run in the background while the sink has free in-flight slots;
+        once it is saturated the caller waits, which pushes back on senders.
+        """
+        if len(self.queues) < self.buffer_size:
+            return
+        if self.sink.saturated:
+            await self.flush()
+        else:
+            self._flush_in_background()
+    
+    def _flush_in_background(self):
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def flush(self, limit: int = None):
+        """Take a fair batch across tenants and send it; new data keeps queuing meanwhile"""
+        parts = self.queues.take(limit or self.buffer_size)
+        if not parts:
+            return
+        # Parts out of the queues until delivered, spooled or requeued
+        self._unsettled.update(parts)
         try:
-            # Convert to Prometheus exposition format
-            lines = []
-            for metric in self.buffer:
-                name = metric.get('name', 'unknown')
-                value = metric.get('value', 0)
-                labels = metric.get('labels', {})
-                timestamp = metric.get('timestamp', int(time.time() * 1000))
-                
-                label_str = ','.join([f'{k}="{v}"' for k, v in labels.items()])
-                if label_str:
-                    line = f"{name}{{{label_str}}} {value} {timestamp}"
-                else:
-                    line = f"{name} {value} {timestamp}"
-                lines.append(line)
-            
-            # Send to VictoriaMetrics
-            data = '\n'.join(lines)
-            response = requests.post(
-                f"{VICTORIAMETRICS_URL}/api/v1/import/prometheus",
-                data=data.encode('utf-8'),
-                headers={'Content-Type': 'text/plain'},
-                timeout=10
-            )
-            response.raise_for_status()
-            
-            logger.info(f"Flushed {len(self.buffer)} metrics to VictoriaMetrics")
-            self.buffer = []
+            await self._send(parts)
+        finally:
+            self._unsettled.difference_update(parts)
+    
+    async def _send(self, parts: list):
+        batch_bytes = sum(part.bytes for part in parts)
+        entries = sum(len(part.entries) for part in parts)
+        payload = None
+        try:
+            started = time.perf_counter()
+            encoded = self.encode(parts)
+            encoded_at = time.perf_counter()
+            payload = await self.sink.prepare(*encoded)
+            prepared_at = time.perf_counter()
+            self.stage_duration['encode'].observe(encoded_at - started)
+            self.stage_duration['compress'].observe(prepared_at - encoded_at)
+            await self.sink.post(*payload)
+            latency = time.perf_counter() - prepared_at
+            self.stage_duration['send'].observe(latency)
+            sink_flush_duration.labels(sink=self.sink.name).observe(latency)
+            self.flow.on_success(latency, len(payload[1]), entries)
+            logger.info(f"Flushed {entries} entries to {self.sink.name}")
         except Exception as e:
-            logger.error(f"Error flushing metrics: {e}")
+            logger.error(f"Error flushing to {self.sink.name}: {e}")
             collection_errors.inc()
+            if payload is not None:
+                self.flow.on_error()
+            if self.spool is not None and payload is not None:
+                # Move the payload to disk so memory stays bounded while the sink is down
+                try:
+                    await asyncio.to_thread(self.spool.append, *payload)
+                    memory_budget.release(self.name, batch_bytes)
+                    self.queues.delivered(parts, 'spooled')
+                    self.recycle(parts)
+                    return
+                except Exception as e:
+                    logger.error(f"Error spooling {self.sink.name} payload: {e}")
+            # Keep unsent data ahead of anything that arrived in the meantime
+            self.queues.requeue(parts)
+            return
+        memory_budget.release(self.name, batch_bytes)
+        self.queues.delivered(parts)
+        self.recycle(parts)
+        if len(self.queues) >= self.buffer_size and not self.sink.saturated:
+            # Work through a backlog without waiting for the next interval
+            self._flush_in_background()
+    
+    def new_buffer(self):
+        """Empty buffer to collect into"""
+        return []
+    
+    def split_buffer(self, buffer, count: int):
+        """Remove and return the first ``count`` entries of a buffer"""
+        part = buffer[:count]
+        del buffer[:count]
+        return part
+    
+    def join_buffers(self, front, back):
+        """Buffer holding ``front`` followed by ``back``"""
+        front.extend(back)
+        return front
+    
+    def recycle(self, parts: list):
+        """Hand delivered (or spooled) batch parts back for reuse"""
+    
+    def encode(self, parts: list) -> tuple:
+        """Encode batch parts as (path, body, headers) - to be implemented by subclasses"""
+        raise NotImplementedError
     
     async def start_flush_loop(self):
-        """Periodically flush metrics buffer"""
+        """Periodically flush the buffer"""
         while True:
             await asyncio.sleep(self.flush_interval)
             await self.flush()
+    
+    async def start_replay_loop(self, spool: SegmentSpool = None):
+        """Replay spooled payloads, rate-limited, once the sink accepts data again.
+        
+        An adopted ``spool`` of a retired worker is replayed until it is empty and then removed.
+        """
+        adopted = spool is not None
+        spool = spool or self.spool
+        while True:
+            segment = await asyncio.to_thread(spool.next_segment)
+            if segment is None:
+                if adopted:
+                    await asyncio.to_thread(remove_spool_directory, spool.directory)
+                    logger.info(f"Replayed orphaned spool {spool.directory} to {self.sink.name}")
+                    return
+                await asyncio.to_thread(spool.sync)
+                await asyncio.sleep(1)
+                continue
+            
+            records = spool.pending_records(segment)
+            try:
+                while True:
+                    record = await asyncio.to_thread(next, records, None)
+                    if record is None:
+                        break
+                    await self.sink.post(record.path, record.body, record.headers)
+                    await asyncio.to_thread(spool.ack, segment, record)
+                    await asyncio.sleep(len(record.body) / SPOOL_REPLAY_RATE)
+                await asyncio.to_thread(spool.complete, segment)
+                logger.info(f"Replayed spooled segment {os.path.basename(segment)} to {self.sink.name}")
+            except Exception as e:
+                logger.warning(f"Replay to {self.sink.name} failed, retrying later: {e}")
+                await asyncio.sleep(self.flush_interval)
+            finally:
+                records.close()
+    
+    async def drain(self):
+        """Wait for in-flight flushes, ship (or spool) what is left and close the sink"""
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush(len(self.queues))
+        if self.spool is not None:
+            await asyncio.to_thread(self.spool.close)
+        await self.sink.close()
+
+
+class MetricsCollector(BufferedCollector):
+    """Collects and forwards metrics to VictoriaMetrics"""
+    
+    def __init__(self):
+        self._free_buffers = []
+        super().__init__(
+            'metrics',
+            HTTPSink(
+                'VictoriaMetrics', VICTORIAMETRICS_URL, SINK_MAX_IN_FLIGHT, SINK_TIMEOUT,
+                VICTORIAMETRICS_COMPRESSION, SINK_COMPRESSION_LEVEL, SINK_COMPRESSION_MIN_BYTES
+            ),
+            buffer_size=1000,
+            flush_interval=10,
+            spool=create_spool('metrics', 'VictoriaMetrics')
+        )
+        self.cardinality = CardinalityGuard.from_config(collector_config.get('cardinality'))
+        self.deadband = Deadband.from_config(collector_config.get('deadband'))
+        self.aggregator = Aggregator.from_config(collector_config.get('aggregation'))
+        self.series = SeriesTable(SERIES_CACHE_SIZE)
+    
+    @staticmethod
+    def _entry(metric: dict) -> tuple:
+        """Buffered form of a metric: (name, labels, value, timestamp_ms or None)"""
+        return (
+            metric.get('name', 'unknown'),
+            metric.get('labels', {}),
+            metric.get('value', 0),
+            metric.get('timestamp')
+        )
+    
+    def _buffer(self, entries: list, queue: TenantQueue) -> int:
+        """Limit, filter, pre-aggregate and intern entries into a tenant queue, returning how many were buffered"""
+        if self.cardinality is not None:
+            entries = self.cardinality.process(entries)
+        if self.deadband is not None:
+            entries = self.deadband.filter(entries)
+        if self.aggregator is not None:
+            entries = self.aggregator.process(entries)
+        return self._append(entries, queue)
+    
+    def _append(self, entries: list, queue: TenantQueue) -> int:
+        """Intern (name, labels, value, timestamp) entries and append them to a tenant queue"""
+        if not entries:
+            return 0
+        now_ms = int(time.time() * 1000)
+        queue.buffer.extend(
+            self.series.intern_all(entries),
+            [float(entry[2]) for entry in entries],
+            [now_ms if entry[3] is None else int(entry[3]) for entry in entries]
+        )
+        return len(entries)
+    
+    def _charge(self, count: int, queue: TenantQueue):
+        """Charge newly buffered samples to the memory budget"""
+        size = SampleBuffer.ITEM_SIZE * count
+        memory_budget.add(self.name, size)
+        self.queues.add(queue, count, size)
+    
+    def _append_rollups(self, rollups: list):
+        """Queue closed aggregation windows under the tenant of their labels"""
+        groups = {}
+        for entry in rollups:
+            groups.setdefault(self.tenant_of(entry[1]), []).append(entry)
+        for tenant, entries in groups.items():
+            queue = self.queues.get(tenant)
+            self._charge(self._append(entries, queue), queue)
+    
+    async def collect_metric(self, metric_data: dict, tenant: str = None) -> bool:
+        """Collect a single metric, returning whether it was buffered"""
+        try:
+            queue = self.queues.get(self.tenant_of(metric_data.get('labels'), tenant))
+            self._charge(self._buffer([self._entry(metric_data)], queue), queue)
+            metrics_received.inc()
+        except Exception as e:
+            logger.error(f"Error collecting metric: {e}")
+            collection_errors.inc()
+            return False
+        await self.maybe_flush()
+        return True
+    
+    async def collect_metrics(self, metrics: list, tenant: str = None) -> list:
+        """Collect a batch of validated metrics, returning those that could not be buffered"""
+        failed = []
+        for group_tenant, group in self.group_by_tenant(metrics, tenant).items():
+            try:
+                queue = self.queues.get(group_tenant)
+                self._charge(self._buffer([self._entry(metric) for metric in group], queue), queue)
+            except Exception as e:
+                logger.error(f"Error collecting metrics batch: {e}")
+                collection_errors.inc()
+                failed.extend(group)
+        metrics_received.inc(len(metrics) - len(failed))
+        await self.maybe_flush()
+        return failed
+    
+    def collect_series(self, name: str, labels: dict, samples: list, tenant: str = None):
+        """Buffer decoded (value, timestamp_ms) samples of one series, sharing its labels"""
+        queue = self.queues.get(self.tenant_of(labels, tenant))
+        if self.cardinality is None and self.deadband is None and self.aggregator is None:
+            queue.buffer.extend(
+                [self.series.intern(name, labels)] * len(samples),
+                [value for value, _ in samples],
+                [timestamp for _, timestamp in samples]
+            )
+            count = len(samples)
+        else:
+            count = self._buffer([(name, labels, value, timestamp) for value, timestamp in samples], queue)
+        self._charge(count, queue)
+        metrics_received.inc(len(samples))
+    
+    def entry_size(self, entry: dict) -> int:
+        return metric_size(entry)
+    
+    def new_buffer(self) -> SampleBuffer:
+        """Reuse a recycled sample buffer when one is available, else start a small one"""
+        if self._free_buffers:
+            return self._free_buffers.pop()
+        return SampleBuffer(SAMPLE_BUFFER_INITIAL_CAPACITY, self._resize_buffer)
+    
+    def _resize_buffer(self, size: int):
+        # Sample buffers are charged by allocated capacity, not only by filled samples
+        memory_budget.reserve(self.name, size)
+    
+    def split_buffer(self, buffer: SampleBuffer, count: int) -> SampleBuffer:
+        part = self.new_buffer()
+        buffer.move_front(count, part)
+        return part
+    
+    def join_buffers(self, front: SampleBuffer, back: SampleBuffer) -> SampleBuffer:
+        front.extend_buffer(back)
+        self._release_buffer(back)
+        return front
+    
+    def recycle(self, parts: list):
+        for part in parts:
+            self._release_buffer(part.entries)
+    
+    def _release_buffer(self, buffer: SampleBuffer):
+        buffer.clear()
+        if len(self._free_buffers) <= self.sink.max_in_flight:
+            # Keep recycled buffers no larger than a flush batch
+            buffer.trim(self.buffer_size)
+            self._free_buffers.append(buffer)
+        else:
+            buffer.release()
+    
+    def _trim_queues(self):
+        """Give back capacity that tenant queues grew into but no longer use"""
+        for queue in self.queues.queues.values():
+            buffer = queue.buffer
+            target = max(SAMPLE_BUFFER_INITIAL_CAPACITY, 2 * len(buffer))
+            if buffer.capacity > 2 * target:
+                buffer.trim(target)
+    
+    async def flush(self, limit: int = None):
+        """Add rollups of windows that have closed, then flush"""
+        if self.aggregator is not None:
+            rollups = self.aggregator.expire()
+            if rollups:
+                self._append_rollups(rollups)
+        if self.deadband is not None:
+            self.deadband.prune()
+        await super().flush(limit)
+        self._trim_queues()
+        if self.series.over_capacity:
+            # Series IDs are referenced from the queues and from parts other flushes have taken but not
+            # settled; encoded payloads already carry the rendered prefixes
+            in_use = set()
+            for queue in self.queues.queues.values():
+                in_use |= queue.buffer.series_in_use()
+            for part in self._unsettled:
+                in_use |= part.entries.series_in_use()
+            self.series.evict(in_use)
+    
+    async def drain(self):
+        """Emit every open aggregation window before the final flush"""
+        if self.aggregator is not None:
+            self._append_rollups(self.aggregator.close_all())
+        await super().drain()
+    
+    def encode(self, parts: list) -> tuple:
+        """Encode metrics for the VictoriaMetrics import API"""
+        # Render Prometheus exposition lines straight from the sample columns
+        prefixes = self.series.prefixes
+        lines = [
+            f"{prefixes[series_id]}{format_value(value)} {timestamp}"
+            for part in parts
+            for series_id, value, timestamp in part.entries
+        ]
+        
+        data = '\n'.join(lines)
+        return '/api/v1/import/prometheus', data.encode('utf-8'), {'Content-Type': 'text/plain'}
 
 
-class LogsCollector:
+class LogsCollector(BufferedCollector):
     """Collects and forwards logs to Loki"""
     
+    top_priority = PRIORITY_LOGS
+    
     def __init__(self):
-        self.buffer = []
-        self.buffer_size = 100
-        self.flush_interval = 5  # seconds
+        super().__init__(
+            'logs',
+            HTTPSink(
+                'Loki', LOKI_URL, SINK_MAX_IN_FLIGHT, SINK_TIMEOUT,
+                LOKI_COMPRESSION, SINK_COMPRESSION_LEVEL, SINK_COMPRESSION_MIN_BYTES
+            ),
+            buffer_size=100,
+            flush_interval=5,
+            spool=create_spool('logs', 'Loki')
+        )
+        self.push_format = LOKI_PUSH_FORMAT
+        if self.push_format == 'protobuf' and not snappy_available():
+            logger.warning("cramjam is not installed, falling back to JSON pushes to Loki")
+            self.push_format = 'json'
+        if self.push_format == 'protobuf':
+            # Protobuf pushes are snappy-compressed by protocol
+            self.sink.compression = 'none'
+        self.pipeline = LogPipeline.from_config(collector_config.get('log_pipeline'))
     
-    async def collect_log(self, log_data: dict):
-        """Collect a single log entry"""
+    async def collect_log(self, log_data: dict, tenant: str = None) -> bool:
+        """Collect a single log entry, returning whether it was buffered (or dropped by the pipeline)"""
         try:
-            self.buffer.append(log_data)
+            logs = self.pipeline.process([log_data]) if self.pipeline is not None else [log_data]
+            if logs:
+                queue = self.queues.get(self.tenant_of(log_data.get('labels'), tenant))
+                queue.buffer.append(log_data)
+                self.account([log_data], queue)
             logs_received.inc()
-            
-            if len(self.buffer) >= self.buffer_size:
-                await self.flush()
         except Exception as e:
             logger.error(f"Error collecting log: {e}")
             collection_errors.inc()
+            return False
+        await self.maybe_flush()
+        return True
     
-    async def flush(self):
-        """Flush logs buffer to Loki"""
-        if not self.buffer:
-            return
-        
+    async def collect_logs(self, logs: list, tenant: str = None) -> list:
+        """Collect a batch of validated log entries, returning those that could not be buffered"""
+        received = logs
         try:
-            # Format logs for Loki
-            streams = {}
-            for log in self.buffer:
-                labels = log.get('labels', {})
-                label_str = '{' + ','.join([f'{k}="{v}"' for k, v in labels.items()]) + '}'
-                
-                if label_str not in streams:
-                    streams[label_str] = []
-                
-                timestamp_ns = str(log.get('timestamp', int(time.time() * 1e9)))
-                line = log.get('message', '')
-                streams[label_str].append([timestamp_ns, line])
-            
-            # Convert to Loki format
-            loki_streams = []
-            for labels, values in streams.items():
-                loki_streams.append({
-                    "stream": json.loads(labels.replace("'", '"')),
-                    "values": values
-                })
-            
-            payload = {"streams": loki_streams}
-            
-            # Send to Loki
-            response = requests.post(
-                f"{LOKI_URL}/loki/api/v1/push",
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
-            response.raise_for_status()
-            
-            logger.info(f"Flushed {len(self.buffer)} logs to Loki")
-            self.buffer = []
+            if self.pipeline is not None:
+                logs = self.pipeline.process(logs)
         except Exception as e:
-            logger.error(f"Error flushing logs: {e}")
+            logger.error(f"Error processing logs batch: {e}")
             collection_errors.inc()
+            return received
+        failed = []
+        for group_tenant, group in self.group_by_tenant(logs, tenant).items():
+            try:
+                queue = self.queues.get(group_tenant)
+                queue.buffer.extend(group)
+                self.account(group, queue)
+            except Exception as e:
+                logger.error(f"Error collecting logs batch: {e}")
+                collection_errors.inc()
+                failed.extend(group)
+        logs_received.inc(len(received) - len(failed))
+        await self.maybe_flush()
+        return failed
     
-    async def start_flush_loop(self):
-        """Periodically flush logs buffer"""
-        while True:
-            await asyncio.sleep(self.flush_interval)
-            await self.flush()
+    def priority(self, entry: dict) -> str:
+        return log_priority(entry)
+    
+    def entry_size(self, entry: dict) -> int:
+        return log_size(entry)
+    
+    def encode(self, parts: list) -> tuple:
+        """Encode logs for the Loki push API"""
+        streams = loki.group_streams(log for part in parts for log in part.entries)
+        if self.push_format == 'protobuf':
+            body = loki.encode_protobuf(streams)
+            return '/loki/api/v1/push', body, {'Content-Type': loki.PROTOBUF_CONTENT_TYPE}
+        return '/loki/api/v1/push', loki.encode_json(streams), {'Content-Type': loki.JSON_CONTENT_TYPE}
 
 
-class TracesCollector:
-    """Collects and forwards traces to Tempo"""
+class TracesCollector(BufferedCollector):
+    """Collects OTLP spans and forwards them to Tempo in batches"""
+    
+    top_priority = PRIORITY_TRACES
     
     def __init__(self):
-        pass
+        super().__init__(
+            'traces',
+            HTTPSink(
+                'Tempo', TEMPO_OTLP_URL, SINK_MAX_IN_FLIGHT, SINK_TIMEOUT,
+                TEMPO_COMPRESSION, SINK_COMPRESSION_LEVEL, SINK_COMPRESSION_MIN_BYTES
+            ),
+            buffer_size=512,  # ResourceSpans entries
+            flush_interval=5,
+            spool=create_spool('traces', 'Tempo')
+        )
+        self.sampler = TailSampler.from_config(collector_config.get('sampling'), span_size)
+        if self.sampler is not None and self.sampler.whole_trace and WORKERS > 1:
+            # Connections are balanced across workers, so each would decide on a partial trace
+            raise ValueError(
+                "Tail sampling policies other than 'probabilistic' need all spans of a trace in one process; "
+                "set COLLECTOR_WORKERS=1 or use only probabilistic policies"
+            )
     
-    async def collect_trace(self, trace_data: dict):
-        """Collect a trace span"""
+    def _queue_spans(self, resource_spans: list, tenant: str):
+        queue = self.queues.get(tenant)
+        queue.buffer.extend(resource_spans)
+        self.account(resource_spans, queue)
+    
+    def _queue_sampled(self, decide):
+        """Run a sampler decision step and queue the traces it kept"""
+        before = self.sampler.bytes
+        kept = decide()
+        memory_budget.release(self.name, before - self.sampler.bytes)
+        for tenant, resource_spans in kept.items():
+            self._queue_spans(resource_spans, tenant)
+    
+    async def collect_spans(self, resource_spans: list, tenant: str = None):
+        """Collect a batch of OTLP ResourceSpans"""
         try:
-            traces_received.inc()
-            # OpenTelemetry SDK handles trace export automatically
-            # This is a placeholder for additional trace processing if needed
+            traces_received.inc(sum(otlp.count_spans(entry) for entry in resource_spans))
+            tenant = tenant or DEFAULT_TENANT
+            if self.sampler is not None:
+                # Spans wait in the sampler, charged to the memory budget, until their trace is decided
+                before = self.sampler.bytes
+                resource_spans = self.sampler.add(resource_spans, tenant)
+                memory_budget.add(self.name, self.sampler.bytes - before)
+                if self.sampler.over_limits():
+                    self._queue_sampled(self.sampler.expire)
+            if resource_spans:
+                self._queue_spans(resource_spans, tenant)
+            await self.maybe_flush()
         except Exception as e:
-            logger.error(f"Error collecting trace: {e}")
+            logger.error(f"Error collecting spans: {e}")
             collection_errors.inc()
+    
+    async def flush(self, limit: int = None):
+        """Queue traces whose sampling window has closed, then flush"""
+        if self.sampler is not None:
+            self._queue_sampled(self.sampler.expire)
+        await super().flush(limit)
+    
+    async def drain(self):
+        """Decide every pending trace before the final flush"""
+        if self.sampler is not None:
+            self._queue_sampled(self.sampler.close_all)
+        await super().drain()
+    
+    def entry_size(self, entry) -> int:
+        return span_size(entry)
+    
+    def encode(self, parts: list) -> tuple:
+        """Encode spans as an OTLP/HTTP protobuf export request"""
+        batch = [resource_spans for part in parts for resource_spans in part.entries]
+        return '/v1/traces', otlp.encode_request(batch), {'Content-Type': otlp.PROTOBUF_CONTENT_TYPES[0]}
 
 
 # Initialize collectors
@@ -206,12 +815,145 @@ traces_collector = TracesCollector()
 
 
 # HTTP handlers
+def throttled_response(collector: BufferedCollector):
+    """HTTP 429 telling the sender to back off until buffers drain"""
+    requests_throttled.labels(collector=collector.name).inc()
+    return web.json_response(
+        {"error": f"{collector.name} buffers are full, retry later"},
+        status=429,
+        headers={'Retry-After': str(collector.retry_after)}
+    )
+
+
+def batch_response(collector: BufferedCollector, result: BatchResult):
+    """JSON response for a batch, asking the sender to back off if anything was shed"""
+    if result.http_status == 429:
+        requests_throttled.labels(collector=collector.name).inc()
+    headers = {'Retry-After': str(collector.retry_after)} if result.shed else None
+    return web.json_response(result.to_dict(), status=result.http_status, headers=headers)
+
+
+async def ingest_request(request, collector, validate, collect_one, collect_batch):
+    """Feed a single JSON object, a JSON array or an NDJSON stream into a collector"""
+    if not collector.accepting():
+        return throttled_response(collector)
+    tenant = request.headers.get(tenant_settings.header)
+    # Time outside the collect calls is reading, decoding and validating the body
+    started = time.perf_counter()
+    buffering = 0.0
+    
+    async def timed(collect, records):
+        nonlocal buffering
+        collect_started = time.perf_counter()
+        try:
+            return await collect(records, tenant)
+        finally:
+            elapsed = time.perf_counter() - collect_started
+            buffering += elapsed
+            collector.stage_duration['buffer'].observe(elapsed)
+    
+    try:
+        return await _ingest_records(request, collector, validate, tenant, collect_one, collect_batch, timed)
+    finally:
+        collector.stage_duration['decode'].observe(time.perf_counter() - started - buffering)
+
+
+async def _ingest_records(request, collector, validate, tenant, collect_one, collect_batch, timed):
+    if is_ndjson(request):
+        # Decode line by line so a large stream is never held in memory at once
+        result = BatchResult('line')
+        batch = []
+        positions = []
+        pending = 0
+        records = iter_ndjson_records(request, NDJSON_MAX_LINE_SIZE)
+        line_no = 0
+        while True:
+            try:
+                line_no, record, error = await records.__anext__()
+            except StopAsyncIteration:
+                break
+            except IngestError as e:
+                if not line_no:
+                    raise
+                # The stream broke part-way; keep what was decoded so far
+                result.reject(line_no + 1, str(e))
+                break
+            if error is None:
+                try:
+                    record = validate(record)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                result.reject(line_no, error)
+                continue
+            size = collector.entry_size(record)
+            if not collector.admit(record, pending + size, tenant):
+                result.drop(line_no)
+                continue
+            batch.append(record)
+            positions.append(line_no)
+            pending += size
+            if len(batch) >= INGEST_BATCH_SIZE:
+                await _collect_batch(result, batch, positions, collect_batch, timed)
+                batch = []
+                positions = []
+                pending = 0
+        if batch:
+            await _collect_batch(result, batch, positions, collect_batch, timed)
+        return batch_response(collector, result)
+    
+    data = json.loads(await read_body(request, MAX_BODY_SIZE))
+    if isinstance(data, list):
+        result = BatchResult('index')
+        batch = []
+        positions = []
+        pending = 0
+        for index, record in enumerate(data):
+            try:
+                record = validate(record)
+            except ValueError as e:
+                result.reject(index, str(e))
+                continue
+            size = collector.entry_size(record)
+            if collector.admit(record, pending + size, tenant):
+                batch.append(record)
+                positions.append(index)
+                pending += size
+            else:
+                result.drop(index)
+        if batch:
+            await _collect_batch(result, batch, positions, collect_batch, timed)
+        return batch_response(collector, result)
+    
+    record = validate(data)
+    if not collector.admit(record, tenant=tenant):
+        return throttled_response(collector)
+    if not await timed(collect_one, record):
+        return web.json_response({"error": f"{collector.name} could not buffer the entry, retry later"}, status=500)
+    return web.json_response({"status": "ok"})
+
+
+async def _collect_batch(result: BatchResult, batch: list, positions: list, collect_batch, timed):
+    """Buffer a batch, counting only the entries the collector actually took as accepted"""
+    failed = {id(record) for record in await timed(collect_batch, batch)}
+    if failed:
+        for record, position in zip(batch, positions):
+            if id(record) in failed:
+                result.fail(position, "could not be buffered, retry later")
+    result.accepted += len(batch) - len(failed)
+
+
 async def handle_metrics(request):
     """Handle incoming metrics"""
     try:
-        data = await request.json()
-        await metrics_collector.collect_metric(data)
-        return web.json_response({"status": "ok"})
+        return await ingest_request(
+            request, metrics_collector, validate_metric,
+            metrics_collector.collect_metric, metrics_collector.collect_metrics
+        )
+    except IngestError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error handling metrics: {e}")
         return web.json_response({"error": str(e)}, status=500)
@@ -220,20 +962,87 @@ async def handle_metrics(request):
 async def handle_logs(request):
     """Handle incoming logs"""
     try:
-        data = await request.json()
-        await logs_collector.collect_log(data)
-        return web.json_response({"status": "ok"})
+        return await ingest_request(
+            request, logs_collector, validate_log,
+            logs_collector.collect_log, logs_collector.collect_logs
+        )
+    except IngestError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error handling logs: {e}")
         return web.json_response({"error": str(e)}, status=500)
 
 
+async def handle_remote_write(request):
+    """Handle Prometheus remote_write (snappy-compressed protobuf WriteRequest)"""
+    tenant = request.headers.get(tenant_settings.header)
+    if not metrics_collector.accepting() or not metrics_collector.queues.admits(tenant):
+        return throttled_response(metrics_collector)
+    try:
+        started = time.perf_counter()
+        body = await request.read()
+        # Decode everything first: a body that turns out malformed part-way must not leave samples queued,
+        # or the sender's retry would duplicate them
+        series = list(decode_write_request(body, MAX_BODY_SIZE))
+        collect_started = time.perf_counter()
+        samples = 0
+        for name, labels, series_samples in series:
+            metrics_collector.collect_series(name, labels, series_samples, tenant)
+            samples += len(series_samples)
+        metrics_collector.stage_duration['decode'].observe(collect_started - started)
+        metrics_collector.stage_duration['buffer'].observe(time.perf_counter() - collect_started)
+        await metrics_collector.maybe_flush()
+        logger.debug(f"Accepted {samples} remote write samples")
+        return web.Response(status=204)
+    except ProtobufError as e:
+        collection_errors.inc()
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error handling remote write: {e}")
+        collection_errors.inc()
+        return web.json_response({"error": str(e)}, status=500)
+
+
 async def handle_traces(request):
-    """Handle incoming traces"""
+    """Handle incoming OTLP/HTTP traces (protobuf or JSON)"""
+    protobuf = otlp.is_protobuf(request.content_type)
+    if not traces_collector.accepting():
+        return throttled_response(traces_collector)
+    tenant = request.headers.get(tenant_settings.header) or DEFAULT_TENANT
     try:
-        data = await request.json()
-        await traces_collector.collect_trace(data)
-        return web.json_response({"status": "ok"})
+        started = time.perf_counter()
+        body = await read_body(request, MAX_BODY_SIZE)
+        resource_spans = otlp.parse_request(body, protobuf)
+        
+        accepted = []
+        pending = 0
+        shed = 0
+        for entry in resource_spans:
+            size = traces_collector.entry_size(entry)
+            if traces_collector.admit(entry, pending + size, tenant):
+                accepted.append(entry)
+                pending += size
+            else:
+                shed += otlp.count_spans(entry)
+        collect_started = time.perf_counter()
+        traces_collector.stage_duration['decode'].observe(collect_started - started)
+        if accepted:
+            await traces_collector.collect_spans(accepted, tenant)
+            traces_collector.stage_duration['buffer'].observe(time.perf_counter() - collect_started)
+        
+        if shed:
+            spans_dropped.labels(reason='shed').inc(shed)
+            if not accepted:
+                return throttled_response(traces_collector)
+        body, content_type = otlp.encode_response(protobuf, shed, "dropped under memory pressure" if shed else '')
+        return web.Response(body=body, content_type=content_type)
+    except IngestError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+    except otlp.OTLPError as e:
+        spans_dropped.labels(reason='invalid').inc()
+        return web.json_response({"error": str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error handling traces: {e}")
         return web.json_response({"error": str(e)}, status=500)
@@ -241,7 +1050,7 @@ async def handle_traces(request):
 
 async def handle_prometheus_metrics(request):
     """Expose Prometheus metrics"""
-    return web.Response(text=generate_latest().decode('utf-8'), content_type='text/plain')
+    return web.Response(text=generate_metrics().decode('utf-8'), content_type='text/plain')
 
 
 async def handle_health(request):
@@ -252,31 +1061,94 @@ async def handle_health(request):
     })
 
 
+async def handle_cardinality_debug(request):
+    """Cardinality estimates and top offending metrics"""
+    guard = metrics_collector.cardinality
+    if guard is None:
+        return web.json_response({"enabled": False})
+    try:
+        top = int(request.query.get('top', '20'))
+    except ValueError:
+        return web.json_response({"error": "'top' must be an integer"}, status=400)
+    sketches = request.query.get('sketches', '').lower() in ('1', 'true', 'yes')
+    return web.json_response({"enabled": True, **guard.report(top, sketches)})
+
+
+async def handle_profile(request):
+    """Sampling CPU profile of the event-loop thread in collapsed-stack format"""
+    if not PROFILING_ENABLED:
+        return web.json_response({"error": "profiling is disabled (COLLECTOR_PROFILING_ENABLED)"}, status=404)
+    try:
+        seconds = float(request.query.get('seconds', '10'))
+        interval = float(request.query.get('interval', '0.01'))
+    except ValueError:
+        return web.json_response({"error": "'seconds' and 'interval' must be numbers"}, status=400)
+    if not 0 < seconds <= PROFILING_MAX_SECONDS or not 0.001 <= interval <= 1:
+        return web.json_response(
+            {"error": f"'seconds' must be in (0, {PROFILING_MAX_SECONDS:g}] and 'interval' in [0.001, 1]"},
+            status=400
+        )
+    try:
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+    except ProfilerBusy as e:
+        return web.json_response({"error": str(e)}, status=409)
+    return web.Response(text=format_folded(stacks), content_type='text/plain')
+
+
 async def start_background_tasks(app):
     """Start background flush tasks"""
     app['metrics_flush_task'] = asyncio.create_task(metrics_collector.start_flush_loop())
     app['logs_flush_task'] = asyncio.create_task(logs_collector.start_flush_loop())
+    app['traces_flush_task'] = asyncio.create_task(traces_collector.start_flush_loop())
+    app['replay_tasks'] = [
+        asyncio.create_task(collector.start_replay_loop())
+        for collector in (metrics_collector, logs_collector, traces_collector)
+        if collector.spool is not None
+    ]
+    # Spools of workers that no longer exist (COLLECTOR_WORKERS was lowered) are replayed by the first worker
+    app['replay_tasks'] += [
+        asyncio.create_task(collector.start_replay_loop(spool))
+        for collector in (metrics_collector, logs_collector, traces_collector)
+        for spool in orphaned_spools(collector.spool)
+    ]
+    app['loop_lag_task'] = asyncio.create_task(start_lag_monitor())
+    if MULTIPROCESS:
+        app['gauge_sync_task'] = asyncio.create_task(start_sync_loop())
 
 
 async def cleanup_background_tasks(app):
-    """Cleanup background tasks"""
-    app['metrics_flush_task'].cancel()
-    app['logs_flush_task'].cancel()
+    """Cleanup background tasks and drain buffers to the sinks"""
+    tasks = [
+        app['metrics_flush_task'], app['logs_flush_task'], app['traces_flush_task'], app['loop_lag_task'],
+        *app['replay_tasks']
+    ]
+    if 'gauge_sync_task' in app:
+        tasks.append(app['gauge_sync_task'])
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
     
-    await app['metrics_flush_task']
-    await app['logs_flush_task']
+    await metrics_collector.drain()
+    await logs_collector.drain()
+    await traces_collector.drain()
 
 
 def create_app():
     """Create and configure the application"""
-    app = web.Application()
+    # Request bodies are inflated by the ingest layer so decompression is bounded and streamed
+    app = web.Application(client_max_size=MAX_BODY_SIZE, handler_args={'auto_decompress': False})
     
     # Routes
     app.router.add_post('/collect/metrics', handle_metrics)
     app.router.add_post('/collect/logs', handle_logs)
+    app.router.add_post('/api/v1/write', handle_remote_write)
     app.router.add_post('/collect/traces', handle_traces)
     app.router.add_get('/metrics', handle_prometheus_metrics)
     app.router.add_get('/health', handle_health)
+    app.router.add_get('/debug/cardinality', handle_cardinality_debug)
+    app.router.add_get('/debug/profile', handle_profile)
     
     # Startup/cleanup
     app.on_startup.append(start_background_tasks)
@@ -286,6 +1158,14 @@ def create_app():
 
 
 if __name__ == '__main__':
+    if WORKERS > 1 and worker_id() is None:
+        logger.info(f"Starting Sentio IoT Collectors Service with {WORKERS} workers")
+        supervisor = Supervisor(
+            WORKERS, [sys.executable, os.path.abspath(__file__)], WORKER_METRICS_DIR, WORKER_DRAIN_TIMEOUT
+        )
+        sys.exit(supervisor.run())
+    
     logger.info("Starting Sentio IoT Collectors Service")
     app = create_app()
-    web.run_app(app, host='0.0.0.0', port=8081)
+    # Workers share the port; the kernel balances connections between them
+    web.run_app(app, host='0.0.0.0', port=8081, reuse_port=WORKERS > 1)
@@ -0,0 +1,123 @@
+"""OTLP trace decoding and encoding for Sentio IoT Collectors"""
+import base64
+import json
+
+from google.protobuf import json_format
+from google.protobuf.message import DecodeError
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse,
+)
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans
+
+from protowire import field_bytes
+
+PROTOBUF_CONTENT_TYPES = ('application/x-protobuf', 'application/protobuf')
+JSON_CONTENT_TYPE = 'application/json'
+
+# OTLP/JSON carries these ids as hex, protobuf's JSON mapping expects base64
+_ID_FIELDS = ('traceId', 'spanId', 'parentSpanId')
+
+
+class OTLPError(ValueError):
+    """Raised for an undecodable OTLP payload"""
+
+
+def is_protobuf(content_type: str) -> bool:
+    return content_type in PROTOBUF_CONTENT_TYPES
+
+
+def _hex_ids_to_base64(obj: dict):
+    for field in _ID_FIELDS:
+        value = obj.get(field)
+        if isinstance(value, str) and value:
+            try:
+                obj[field] = base64.b64encode(bytes.fromhex(value)).decode('ascii')
+            except ValueError:
+                raise OTLPError(f"invalid hex {field}: {value!r}")
+
+
+def parse_request(body: bytes, protobuf: bool) -> list:
+    """Decode an OTLP/HTTP trace export body into a list of ResourceSpans"""
+    request = ExportTraceServiceRequest()
+    if protobuf:
+        try:
+            request.ParseFromString(body)
+        except DecodeError as e:
+            raise OTLPError(f"invalid OTLP protobuf: {e}")
+        return list(request.resource_spans)
+
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise OTLPError(f"invalid OTLP JSON: {e}")
+    if not isinstance(data, dict):
+        raise OTLPError("OTLP JSON body must be an object")
+    for resource_spans in data.get('resourceSpans', []):
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for span in scope_spans.get('spans', []):
+                _hex_ids_to_base64(span)
+                for link in span.get('links', []):
+                    _hex_ids_to_base64(link)
+    try:
+        json_format.ParseDict(data, request, ignore_unknown_fields=True)
+    except json_format.ParseError as e:
+        raise OTLPError(f"invalid OTLP JSON: {e}")
+    return list(request.resource_spans)
+
+
+def count_spans(resource_spans) -> int:
+    return sum(len(scope_spans.spans) for scope_spans in resource_spans.scope_spans)
+
+
+def split_by_trace(resource_spans) -> dict:
+    """Split a ResourceSpans into one ResourceSpans per trace ID, keyed by trace ID.
+
+    The common case of a message holding a single trace is returned as is.
+    """
+    trace_ids = {span.trace_id for scope_spans in resource_spans.scope_spans for span in scope_spans.spans}
+    if len(trace_ids) <= 1:
+        return {trace_id: resource_spans for trace_id in trace_ids}
+    fragments = {}
+    for scope_spans in resource_spans.scope_spans:
+        scopes = {}
+        for span in scope_spans.spans:
+            scope = scopes.get(span.trace_id)
+            if scope is None:
+                fragment = fragments.get(span.trace_id)
+                if fragment is None:
+                    fragment = fragments[span.trace_id] = ResourceSpans(
+                        resource=resource_spans.resource, schema_url=resource_spans.schema_url
+                    )
+                scope = scopes[span.trace_id] = fragment.scope_spans.add(
+                    scope=scope_spans.scope, schema_url=scope_spans.schema_url
+                )
+            scope.spans.append(span)
+    return fragments
+
+
+def service_name(resource_spans) -> str:
+    for attribute in resource_spans.resource.attributes:
+        if attribute.key == 'service.name':
+            return attribute.value.string_value
+    return ''
+
+
+def encode_request(batch: list) -> bytes:
+    """Serialize buffered ResourceSpans as one ExportTraceServiceRequest.
+
+    Each entry is written as field 1 directly, so the buffered messages do
+    not have to be copied into a new request object first.
+    """
+    return b''.join(field_bytes(1, resource_spans.SerializeToString()) for resource_spans in batch)
+
+
+def encode_response(protobuf: bool, rejected: int = 0, message: str = '') -> tuple:
+    """Build an ExportTraceServiceResponse body and its content type"""
+    response = ExportTraceServiceResponse()
+    if rejected:
+        response.partial_success.rejected_spans = rejected
+        response.partial_success.error_message = message
+    if protobuf:
+        return response.SerializeToString(), PROTOBUF_CONTENT_TYPES[0]
+    return json_format.MessageToJson(response).encode('utf-8'), JSON_CONTENT_TYPE
@@ -0,0 +1,97 @@
+"""Memory accounting and load shedding for Sentio IoT Collectors"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lowest first: debug logs, then traces, then other logs; metrics last
+PRIORITY_DEBUG_LOGS = 'debug_logs'
+PRIORITY_TRACES = 'traces'
+PRIORITY_LOGS = 'logs'
+PRIORITY_METRICS = 'metrics'
+
+STATE_OK = 'ok'
+STATE_SHEDDING = 'shedding'
+STATE_FULL = 'full'
+STATE_VALUES = {STATE_OK: 0, STATE_SHEDDING: 1, STATE_FULL: 2}
+
+DEBUG_LEVELS = ('debug', 'trace')
+
+
+class MemoryBudget:
+    """Byte budget shared by all collector buffers.
+
+    Each priority may only use the budget up to its own watermark (a fraction
+    of ``max_bytes``), so low-priority data stops being admitted first.
+    Owners that allocate buffers ahead of use also ``reserve`` the allocated
+    capacity; an owner counts as the larger of its entries and its reservation.
+    """
+
+    def __init__(self, max_bytes: int, watermarks: dict):
+        self.max_bytes = max_bytes
+        self.watermarks = watermarks
+        self.usage = {}
+        self.reserved = {}
+
+    @property
+    def total(self) -> int:
+        return sum(self.used(owner) for owner in self.usage.keys() | self.reserved.keys())
+
+    def used(self, owner: str) -> int:
+        return max(self.usage.get(owner, 0), self.reserved.get(owner, 0))
+
+    def reserve(self, owner: str, size: int):
+        """Change an owner's allocated capacity by ``size`` bytes (negative when freed)"""
+        self.reserved[owner] = max(0, self.reserved.get(owner, 0) + size)
+
+    def add(self, owner: str, size: int):
+        self.usage[owner] = self.usage.get(owner, 0) + size
+
+    def release(self, owner: str, size: int):
+        self.usage[owner] = max(0, self.usage.get(owner, 0) - size)
+
+    def admits(self, priority: str, pending: int = 0) -> bool:
+        """Whether data of the given priority may still be buffered.
+
+        ``pending`` covers bytes accepted by the caller but not yet buffered.
+        """
+        if not self.max_bytes:
+            return True
+        return self.total + pending < self.max_bytes * self.watermarks.get(priority, 1.0)
+
+    @property
+    def state(self) -> str:
+        if not self.max_bytes:
+            return STATE_OK
+        if self.total >= self.max_bytes:
+            return STATE_FULL
+        lowest = min(self.watermarks.values(), default=1.0)
+        return STATE_SHEDDING if self.total >= self.max_bytes * lowest else STATE_OK
+
+
+def metric_size(metric: dict) -> int:
+    """Approximate size of a metric received as JSON, used for admission"""
+    size = 120 + len(metric.get('name', ''))
+    for key, value in metric.get('labels', {}).items():
+        size += 60 + len(key) + len(str(value))
+    return size
+
+
+def span_size(resource_spans) -> int:
+    """Approximate buffered size of an OTLP ResourceSpans message"""
+    return 2 * resource_spans.ByteSize() + 200
+
+
+def log_size(log: dict) -> int:
+    """Approximate buffered size of a log entry in bytes"""
+    size = 120 + len(log.get('message', ''))
+    for key, value in log.get('labels', {}).items():
+        size += 60 + len(key) + len(str(value))
+    return size
+
+
+def log_priority(log: dict) -> str:
+    """Shedding priority of a log entry, from its level field or label"""
+    level = log.get('level') or log.get('labels', {}).get('level', '')
+    if str(level).lower() in DEBUG_LEVELS:
+        return PRIORITY_DEBUG_LOGS
+    return PRIORITY_LOGS
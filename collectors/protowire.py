@@ -0,0 +1,144 @@
+"""Minimal protobuf wire-format helpers for Sentio IoT Collectors
+
+Only the handful of messages the collectors exchange with Loki and
+Prometheus-compatible senders are needed, so they are encoded and decoded
+directly on the wire format instead of through generated classes.
+"""
+import struct
+
+try:
+    import cramjam
+except ImportError:  # snappy support is optional
+    cramjam = None
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+WIRE_FIXED32 = 5
+
+DOUBLE = struct.Struct('<d')
+
+
+class ProtobufError(ValueError):
+    """Raised for malformed protobuf or snappy input"""
+
+
+def snappy_available() -> bool:
+    return cramjam is not None
+
+
+def snappy_compress(data: bytes) -> bytes:
+    """Snappy block (raw) compression, as used by Loki and remote_write"""
+    if cramjam is None:
+        raise ProtobufError("snappy support requires the 'cramjam' package")
+    return bytes(cramjam.snappy.compress_raw(data))
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    """Snappy block (raw) decompression"""
+    if cramjam is None:
+        raise ProtobufError("snappy support requires the 'cramjam' package")
+    try:
+        return bytes(cramjam.snappy.decompress_raw(data))
+    except Exception as e:
+        raise ProtobufError(f"invalid snappy data: {e}")
+
+
+# Encoding
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def field_varint(number: int, value: int) -> bytes:
+    return encode_varint(number << 3 | WIRE_VARINT) + encode_varint(value)
+
+
+def field_bytes(number: int, value: bytes) -> bytes:
+    return encode_varint(number << 3 | WIRE_BYTES) + encode_varint(len(value)) + value
+
+
+def field_string(number: int, value: str) -> bytes:
+    return field_bytes(number, value.encode('utf-8'))
+
+
+def field_double(number: int, value: float) -> bytes:
+    return encode_varint(number << 3 | WIRE_FIXED64) + DOUBLE.pack(value)
+
+
+# Decoding
+
+def decode_varint(buf, pos: int) -> tuple:
+    result = 0
+    shift = 0
+    try:
+        while True:
+            byte = buf[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result, pos
+            shift += 7
+            if shift >= 64:
+                raise ProtobufError("varint too long")
+    except IndexError:
+        raise ProtobufError("truncated varint")
+
+
+def skip_field(buf, pos: int, wire_type: int) -> int:
+    """Return the position just past a field value of the given wire type"""
+    if wire_type == WIRE_VARINT:
+        return decode_varint(buf, pos)[1]
+    if wire_type == WIRE_BYTES:
+        length, pos = decode_varint(buf, pos)
+        return pos + length
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ProtobufError(f"unsupported wire type {wire_type}")
+
+
+def iter_fields(buf):
+    """Yield (field number, wire type, value) for each field of a message.
+
+    Varints are yielded as ints, length-delimited fields as memoryview slices
+    and fixed-width fields as raw bytes.
+    """
+    buf = memoryview(buf)
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = decode_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == WIRE_VARINT:
+            value, pos = decode_varint(buf, pos)
+        elif wire_type == WIRE_BYTES:
+            length, pos = decode_varint(buf, pos)
+            if pos + length > end:
+                raise ProtobufError("truncated length-delimited field")
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == WIRE_FIXED64:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ProtobufError(f"unsupported wire type {wire_type}")
+        if pos > end:
+            raise ProtobufError("truncated field")
+        yield number, wire_type, value
+
+
+def to_signed64(value: int) -> int:
+    """Interpret a decoded varint as a two's-complement int64"""
+    return value - (1 << 64) if value >= 1 << 63 else value
@@ -0,0 +1,93 @@
+"""Prometheus remote_write decoding for Sentio IoT Collectors"""
+from protowire import (
+    DOUBLE,
+    WIRE_BYTES,
+    WIRE_FIXED64,
+    WIRE_VARINT,
+    ProtobufError,
+    decode_varint,
+    iter_fields,
+    skip_field,
+    snappy_decompress,
+    to_signed64,
+)
+
+NAME_LABEL = '__name__'
+
+
+def _decode_label(buf) -> tuple:
+    name = value = ''
+    try:
+        for number, wire_type, field in iter_fields(buf):
+            if wire_type != WIRE_BYTES:
+                continue
+            if number == 1:
+                name = str(field, 'utf-8')
+            elif number == 2:
+                value = str(field, 'utf-8')
+    except UnicodeDecodeError as e:
+        raise ProtobufError(f"label is not valid UTF-8: {e}")
+    return name, value
+
+
+def _decode_sample(buf) -> tuple:
+    """Decode a Sample{double value = 1; int64 timestamp = 2} without generic field dispatch"""
+    value = 0.0
+    timestamp = 0
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = decode_varint(buf, pos)
+        if key == (1 << 3 | WIRE_FIXED64):
+            if pos + 8 > end:
+                raise ProtobufError("truncated sample value")
+            (value,) = DOUBLE.unpack_from(buf, pos)
+            pos += 8
+        elif key == (2 << 3 | WIRE_VARINT):
+            raw, pos = decode_varint(buf, pos)
+            timestamp = to_signed64(raw)
+        else:
+            pos = skip_field(buf, pos, key & 0x07)
+    if pos > end:
+        raise ProtobufError("truncated sample")
+    return value, timestamp
+
+
+def iter_timeseries(buf):
+    """Yield (name, labels, samples) for each TimeSeries in a WriteRequest.
+
+    ``samples`` is a list of (value, timestamp_ms) tuples; exemplars,
+    histograms and metadata are skipped.
+    """
+    for number, wire_type, series in iter_fields(buf):
+        if number != 1 or wire_type != WIRE_BYTES:
+            continue
+        name = ''
+        labels = {}
+        samples = []
+        for field_number, field_type, field in iter_fields(series):
+            if field_type != WIRE_BYTES:
+                continue
+            if field_number == 1:
+                label_name, label_value = _decode_label(field)
+                if label_name == NAME_LABEL:
+                    name = label_value
+                else:
+                    labels[label_name] = label_value
+            elif field_number == 2:
+                samples.append(_decode_sample(field))
+        if not name:
+            raise ProtobufError("time series without a __name__ label")
+        yield name, labels, samples
+
+
+def decode_write_request(body: bytes, max_size: int):
+    """Snappy-decompress a remote_write body and iterate its time series.
+
+    Iteration raises ``ProtobufError`` part-way through a malformed body, so
+    callers that buffer series should decode them all first.
+    """
+    uncompressed_size, _ = decode_varint(body, 0)
+    if uncompressed_size > max_size:
+        raise ProtobufError(f"remote write body inflates to {uncompressed_size} bytes (limit {max_size})")
+    return iter_timeseries(snappy_decompress(body))
@@ -0,0 +1,25 @@
+"""Metric-name rule matching shared by the aggregation, deadband and cardinality stages"""
+import fnmatch
+
+
+class RuleMatcher:
+    """First rule whose ``match`` glob matches a metric name, cached per name.
+
+    The cache is bounded so a flood of distinct names cannot grow it without
+    limit; names beyond ``max_cached`` are matched on every call.
+    """
+
+    def __init__(self, rules: list, default=None, max_cached: int = 100000):
+        self.rules = rules
+        self.default = default
+        self.max_cached = max_cached
+        self._cache = {}
+
+    def rule_for(self, name: str):
+        try:
+            return self._cache[name]
+        except KeyError:
+            rule = next((r for r in self.rules if fnmatch.fnmatchcase(name, r.match)), self.default)
+            if len(self._cache) < self.max_cached:
+                self._cache[name] = rule
+            return rule
@@ -0,0 +1,116 @@
+"""Columnar sample buffer for Sentio IoT Collectors
+
+Buffered metric samples are kept in three parallel typed arrays (series ID,
+float64 value, int64 timestamp in milliseconds) instead of one Python object
+per sample. The arrays start small, grow by doubling and are reused after a
+flush, so steady-state ingestion allocates no per-sample objects. An owner can
+pass ``on_resize`` to be told (in bytes) whenever the allocation grows or
+shrinks, to charge the capacity rather than only the filled samples.
+"""
+from array import array
+from itertools import islice
+
+
+class SampleBuffer:
+    """Growable (series_id, value, timestamp_ms) columns with a fill length"""
+
+    __slots__ = ('series_ids', 'values', 'timestamps', 'length', 'on_resize')
+
+    # Bytes held per buffered sample
+    ITEM_SIZE = 24
+
+    def __init__(self, capacity: int = 1024, on_resize=None):
+        capacity = max(1, capacity)
+        self.series_ids = array('q', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.timestamps = array('q', bytes(8 * capacity))
+        self.length = 0
+        self.on_resize = on_resize
+        if on_resize is not None:
+            on_resize(self.ITEM_SIZE * capacity)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def capacity(self) -> int:
+        return len(self.values)
+
+    def _reserve(self, count: int):
+        needed = self.length + count
+        capacity = len(self.values)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        added = capacity - len(self.values)
+        padding = bytes(8 * added)
+        self.series_ids.frombytes(padding)
+        self.values.frombytes(padding)
+        self.timestamps.frombytes(padding)
+        if self.on_resize is not None:
+            self.on_resize(self.ITEM_SIZE * added)
+
+    def extend(self, series_ids, values, timestamps):
+        """Append equally long sequences of series IDs, float values and int timestamps"""
+        count = len(series_ids)
+        self._reserve(count)
+        start, end = self.length, self.length + count
+        self.series_ids[start:end] = array('q', series_ids)
+        self.values[start:end] = array('d', values)
+        self.timestamps[start:end] = array('q', timestamps)
+        self.length = end
+
+    def extend_buffer(self, other):
+        """Append the samples of another buffer"""
+        count = other.length
+        self._reserve(count)
+        start, end = self.length, self.length + count
+        self.series_ids[start:end] = other.series_ids[:count]
+        self.values[start:end] = other.values[:count]
+        self.timestamps[start:end] = other.timestamps[:count]
+        self.length = end
+
+    def move_front(self, count: int, into):
+        """Move the first ``count`` samples to the end of ``into``, keeping the rest in order"""
+        into._reserve(count)
+        start, end = into.length, into.length + count
+        into.series_ids[start:end] = self.series_ids[:count]
+        into.values[start:end] = self.values[:count]
+        into.timestamps[start:end] = self.timestamps[:count]
+        into.length = end
+        rest = self.length - count
+        self.series_ids[:rest] = self.series_ids[count:self.length]
+        self.values[:rest] = self.values[count:self.length]
+        self.timestamps[:rest] = self.timestamps[count:self.length]
+        self.length = rest
+
+    def clear(self):
+        """Empty the buffer, keeping its allocation"""
+        self.length = 0
+
+    def trim(self, capacity: int):
+        """Shrink the allocation to ``capacity`` samples, never below the fill length"""
+        capacity = max(1, self.length, capacity)
+        removed = len(self.values) - capacity
+        if removed <= 0:
+            return
+        del self.series_ids[capacity:]
+        del self.values[capacity:]
+        del self.timestamps[capacity:]
+        if self.on_resize is not None:
+            self.on_resize(-self.ITEM_SIZE * removed)
+
+    def release(self):
+        """Report the whole allocation freed before the buffer is dropped"""
+        if self.on_resize is not None:
+            self.on_resize(-self.ITEM_SIZE * len(self.values))
+            self.on_resize = None
+
+    def series_in_use(self) -> set:
+        return set(islice(self.series_ids, self.length))
+
+    def __iter__(self):
+        """Iterate (series_id, value, timestamp_ms) without copying the columns"""
+        count = self.length
+        return zip(islice(self.series_ids, count), islice(self.values, count), islice(self.timestamps, count))
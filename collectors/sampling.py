@@ -0,0 +1,217 @@
+"""Tail-based trace sampling for Sentio IoT Collectors
+
+Spans are held per trace ID for a decision window after the first span of a
+trace arrives. When the window closes the whole trace is kept if any policy
+matches (errors, latency over a threshold, selected services or a
+probabilistic baseline) and dropped otherwise. Spans arriving after the
+decision follow it. The table of undecided traces is capped by trace count
+and bytes; traces evicted early are decided on the spans seen so far.
+"""
+import fnmatch
+import logging
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+import otlp
+from selfmetrics import gauge_function
+
+logger = logging.getLogger(__name__)
+
+sampling_traces = Counter(
+    'sentio_tail_sampling_traces_total', 'Traces decided by the tail sampler', ['decision', 'policy']
+)
+sampling_spans = Counter('sentio_tail_sampling_spans_total', 'Spans seen by the tail sampler', ['decision'])
+sampling_evictions = Counter(
+    'sentio_tail_sampling_evictions_total', 'Traces decided before their window closed to stay within limits',
+    ['reason']
+)
+sampling_traces_pending = Gauge(
+    'sentio_tail_sampling_traces_pending', 'Traces waiting for a sampling decision', multiprocess_mode='livesum'
+)
+sampling_bytes_pending = Gauge(
+    'sentio_tail_sampling_bytes_pending', 'Bytes of spans waiting for a sampling decision', multiprocess_mode='livesum'
+)
+
+POLICY_TYPES = ('error', 'latency', 'service', 'probabilistic')
+STATUS_CODE_ERROR = 2
+
+
+class SamplingPolicy:
+    """A condition under which a trace is kept"""
+
+    def __init__(self, type: str, name: str = None, threshold_ms: float = 0, services: list = None,
+                 rate: float = 0):
+        if type not in POLICY_TYPES:
+            raise ValueError(f"Unknown sampling policy type '{type}'")
+        self.type = type
+        self.name = name or type
+        self.threshold_ns = int(float(threshold_ms) * 1_000_000)
+        self.services = list(services or [])
+        self.rate = float(rate)
+        if type == 'latency' and self.threshold_ns <= 0:
+            raise ValueError(f"Sampling policy '{self.name}' needs a positive threshold_ms")
+        if type == 'service' and not self.services:
+            raise ValueError(f"Sampling policy '{self.name}' needs services")
+        if type == 'probabilistic' and not 0 <= self.rate <= 1:
+            raise ValueError(f"Sampling policy '{self.name}' rate must be between 0 and 1")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(
+            config['type'],
+            config.get('name'),
+            config.get('threshold_ms', 0),
+            config.get('services'),
+            config.get('rate', 0)
+        )
+
+    @property
+    def whole_trace(self) -> bool:
+        """Whether the policy looks at the trace's spans (so needs all of them), not just its ID"""
+        return self.type != 'probabilistic'
+
+    def matches(self, trace) -> bool:
+        if self.type == 'error':
+            return trace.error
+        if self.type == 'latency':
+            return trace.end_ns - trace.start_ns >= self.threshold_ns
+        if self.type == 'service':
+            return any(fnmatch.fnmatchcase(service, pattern) for service in trace.services for pattern in self.services)
+        # Derived from the trace ID so every collector worker decides alike
+        return int.from_bytes(trace.trace_id[-8:].rjust(8, b'\0'), 'big') < self.rate * 2 ** 64
+
+
+class PendingTrace:
+    """Spans of one trace and what the policies need to know about them"""
+
+    __slots__ = ('trace_id', 'tenant', 'deadline', 'fragments', 'bytes', 'spans', 'error', 'start_ns', 'end_ns',
+                 'services')
+
+    def __init__(self, trace_id: bytes, tenant: str, deadline: float):
+        self.trace_id = trace_id
+        self.tenant = tenant
+        self.deadline = deadline
+        self.fragments = []
+        self.bytes = 0
+        self.spans = 0
+        self.error = False
+        self.start_ns = None
+        self.end_ns = 0
+        self.services = set()
+
+    def add(self, fragment, size: int):
+        self.fragments.append(fragment)
+        self.bytes += size
+        self.services.add(otlp.service_name(fragment))
+        for scope_spans in fragment.scope_spans:
+            for span in scope_spans.spans:
+                self.spans += 1
+                if span.status.code == STATUS_CODE_ERROR:
+                    self.error = True
+                if self.start_ns is None or span.start_time_unix_nano < self.start_ns:
+                    self.start_ns = span.start_time_unix_nano
+                if span.end_time_unix_nano > self.end_ns:
+                    self.end_ns = span.end_time_unix_nano
+
+
+class TailSampler:
+    """Undecided traces, recent decisions and the policies to decide with"""
+
+    def __init__(self, policies: list, size, decision_wait: float = 10, max_traces: int = 50000,
+                 max_bytes: int = 64 * 1024 * 1024, decision_cache: int = 100000):
+        self.policies = policies
+        self.size = size
+        self.decision_wait = decision_wait
+        self.max_traces = max_traces
+        self.max_bytes = max_bytes
+        self.decision_cache = decision_cache
+        self.pending = {}
+        self.decisions = OrderedDict()
+        self.bytes = 0
+        gauge_function(sampling_traces_pending, lambda: len(self.pending))
+        gauge_function(sampling_bytes_pending, lambda: self.bytes)
+
+    @property
+    def whole_trace(self) -> bool:
+        """Whether any policy needs every span of a trace to be seen by this process"""
+        return any(policy.whole_trace for policy in self.policies)
+
+    @classmethod
+    def from_config(cls, config: dict, size):
+        """Build a sampler from the ``sampling`` config section, or None if no policy is set"""
+        config = config or {}
+        policies = [SamplingPolicy.from_config(policy) for policy in config.get('policies', [])]
+        if not policies:
+            return None
+        logger.info(f"Tail sampling enabled with {len(policies)} policy(ies)")
+        return cls(
+            policies, size,
+            float(config.get('decision_wait', 10)),
+            int(config.get('max_traces', 50000)),
+            int(config.get('max_bytes', 64 * 1024 * 1024)),
+            int(config.get('decision_cache', 100000))
+        )
+
+    def add(self, resource_spans: list, tenant: str) -> list:
+        """Hold spans until their trace is decided, returning late spans of traces already kept"""
+        now = time.monotonic()
+        forward = []
+        for entry in resource_spans:
+            for trace_id, fragment in otlp.split_by_trace(entry).items():
+                keep = self.decisions.get(trace_id)
+                if keep is not None:
+                    count = otlp.count_spans(fragment)
+                    sampling_spans.labels(decision='sampled' if keep else 'dropped').inc(count)
+                    if keep:
+                        forward.append(fragment)
+                    continue
+                trace = self.pending.get(trace_id)
+                if trace is None:
+                    trace = self.pending[trace_id] = PendingTrace(trace_id, tenant, now + self.decision_wait)
+                size = self.size(fragment)
+                trace.add(fragment, size)
+                self.bytes += size
+        return forward
+
+    def expire(self) -> dict:
+        """Decide traces whose window has closed or that exceed the limits, returning kept spans by tenant"""
+        now = time.monotonic()
+        kept = {}
+        # Traces are held in arrival order, so the oldest come first
+        while self.pending:
+            trace = next(iter(self.pending.values()))
+            if len(self.pending) > self.max_traces:
+                sampling_evictions.labels(reason='max_traces').inc()
+            elif self.bytes > self.max_bytes:
+                sampling_evictions.labels(reason='max_bytes').inc()
+            elif trace.deadline > now:
+                break
+            self._decide(trace, kept)
+        return kept
+
+    def over_limits(self) -> bool:
+        return len(self.pending) > self.max_traces or self.bytes > self.max_bytes
+
+    def close_all(self) -> dict:
+        """Decide every pending trace, for shutdown"""
+        kept = {}
+        while self.pending:
+            self._decide(next(iter(self.pending.values())), kept)
+        return kept
+
+    def _decide(self, trace: PendingTrace, kept: dict):
+        del self.pending[trace.trace_id]
+        self.bytes -= trace.bytes
+        policy = next((p for p in self.policies if p.matches(trace)), None)
+        keep = policy is not None
+        sampling_traces.labels(
+            decision='sampled' if keep else 'dropped', policy=policy.name if keep else 'none'
+        ).inc()
+        sampling_spans.labels(decision='sampled' if keep else 'dropped').inc(trace.spans)
+        if keep:
+            kept.setdefault(trace.tenant, []).extend(trace.fragments)
+        self.decisions[trace.trace_id] = keep
+        if len(self.decisions) > self.decision_cache:
+            self.decisions.popitem(last=False)
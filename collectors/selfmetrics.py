@@ -0,0 +1,73 @@
+"""Self-metrics exposition for Sentio IoT Collectors
+
+In single-process mode gauges read their value from a callback at scrape
+time. When several workers run under the supervisor, prometheus_client's
+multiprocess mode (``PROMETHEUS_MULTIPROC_DIR``) shares values through files,
+where callbacks are not visible to other processes, so the callbacks are
+evaluated periodically and written to the shared files instead.
+
+The event loop's responsiveness is tracked here as well: a monitor task
+measures how late its own wakeups are, which is the delay every request and
+flush currently sees before it gets to run.
+"""
+import asyncio
+import logging
+import os
+
+from prometheus_client import CollectorRegistry, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+logger = logging.getLogger(__name__)
+
+event_loop_lag = Histogram(
+    'sentio_event_loop_lag_seconds', 'How late event-loop wakeups run past their scheduled time',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+_function_gauges = []
+
+
+def gauge_function(gauge, function):
+    """Back a gauge (or labeled gauge child) by a callback, in either mode"""
+    if MULTIPROCESS:
+        _function_gauges.append((gauge, function))
+        gauge.set(function())
+    else:
+        gauge.set_function(function)
+
+
+def sync_function_gauges():
+    """Write the current callback values of this process to the shared files"""
+    for gauge, function in _function_gauges:
+        try:
+            gauge.set(function())
+        except Exception as e:
+            logger.debug(f"Error updating gauge: {e}")
+
+
+async def start_sync_loop(interval: float = 5):
+    """Keep this worker's callback gauges fresh for scrapes served by other workers"""
+    while True:
+        await asyncio.sleep(interval)
+        sync_function_gauges()
+
+
+def generate_metrics() -> bytes:
+    """Render the self-metrics of this process, or of all workers in multiprocess mode"""
+    if not MULTIPROCESS:
+        return generate_latest()
+    sync_function_gauges()
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+async def start_lag_monitor(interval: float = 0.5):
+    """Observe event-loop lag by timing a periodic sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - scheduled))
@@ -0,0 +1,105 @@
+"""Interned metric series for Sentio IoT Collectors
+
+Each distinct (name, labels) identity is assigned a compact integer ID and its
+``name{k="v",...} `` exposition prefix is rendered once. Buffered samples refer
+to the ID, so a flush only has to concatenate prefixes with values.
+"""
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+from exposition import render_series
+from selfmetrics import gauge_function
+
+series_lookups = Counter('sentio_series_cache_lookups_total', 'Series table lookups', ['result'])
+series_evictions = Counter('sentio_series_cache_evictions_total', 'Idle series evicted from the series table')
+series_interned = Gauge('sentio_series_cache_series', 'Series held in the series table', multiprocess_mode='livesum')
+
+
+def series_key(name: str, labels: dict) -> tuple:
+    """Canonical identity of a series, independent of label order"""
+    if not labels:
+        return (name, ())
+    return (name, tuple(sorted((str(k), str(v)) for k, v in labels.items())))
+
+
+class SeriesTable:
+    """LRU table mapping series identities to IDs and pre-rendered prefixes.
+
+    IDs are never reused, so an evicted series that shows up again simply gets
+    a new ID. Eviction is left to the owner (see ``evict``) because only it
+    knows which IDs are still referenced by buffered samples.
+    """
+
+    def __init__(self, max_series: int = 100000):
+        self.max_series = max_series
+        self.prefixes = {}
+        self._ids = OrderedDict()
+        self._next_id = 0
+        gauge_function(series_interned, lambda: len(self.prefixes))
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+    @property
+    def over_capacity(self) -> bool:
+        return len(self.prefixes) > self.max_series
+
+    def intern(self, name: str, labels: dict) -> int:
+        """Return the ID of a series, rendering its prefix on first sight"""
+        key = series_key(name, labels)
+        series_id = self._ids.get(key)
+        if series_id is not None:
+            self._ids.move_to_end(key)
+            series_lookups.labels(result='hit').inc()
+            return series_id
+        series_lookups.labels(result='miss').inc()
+        series_id = self._next_id
+        self._next_id += 1
+        self._ids[key] = series_id
+        self.prefixes[series_id] = render_series(name, dict(key[1])) + ' '
+        return series_id
+
+    def intern_all(self, entries: list) -> list:
+        """Series IDs of (name, labels, value, timestamp) entries"""
+        ids = self._ids
+        prefixes = self.prefixes
+        out = []
+        hits = 0
+        for entry in entries:
+            name, labels = entry[0], entry[1]
+            key = series_key(name, labels)
+            series_id = ids.get(key)
+            if series_id is None:
+                series_id = self._next_id
+                self._next_id += 1
+                ids[key] = series_id
+                prefixes[series_id] = render_series(name, dict(key[1])) + ' '
+            else:
+                ids.move_to_end(key)
+                hits += 1
+            out.append(series_id)
+        if hits:
+            series_lookups.labels(result='hit').inc(hits)
+        if len(out) > hits:
+            series_lookups.labels(result='miss').inc(len(out) - hits)
+        return out
+
+    def evict(self, in_use: set) -> int:
+        """Drop least recently used series beyond ``max_series``, skipping IDs in use"""
+        evicted = 0
+        skipped = []
+        while len(self.prefixes) > self.max_series and self._ids:
+            key, series_id = self._ids.popitem(last=False)
+            if series_id in in_use:
+                skipped.append((key, series_id))
+                continue
+            del self.prefixes[series_id]
+            evicted += 1
+        # Series still referenced keep their place at the cold end
+        for key, series_id in reversed(skipped):
+            self._ids[key] = series_id
+            self._ids.move_to_end(key, last=False)
+        if evicted:
+            series_evictions.inc(evicted)
+        return evicted
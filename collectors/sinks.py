@@ -0,0 +1,93 @@
+"""Pooled asynchronous HTTP sinks for Sentio IoT Collectors"""
+import asyncio
+import logging
+
+import aiohttp
+from prometheus_client import Counter, Gauge
+
+from compression import compress
+from selfmetrics import gauge_function
+
+logger = logging.getLogger(__name__)
+
+sink_requests = Counter('sentio_sink_requests_total', 'Requests sent to a sink by outcome', ['sink', 'result'])
+sink_bytes = Counter('sentio_sink_bytes_total', 'Request body bytes sent to a sink, after compression', ['sink'])
+sink_in_flight = Gauge('sentio_sink_in_flight', 'Requests outstanding to a sink', ['sink'], multiprocess_mode='livesum')
+
+
+class HTTPSink:
+    """Keep-alive HTTP client for a single storage backend.
+
+    One ``aiohttp.ClientSession`` is shared by every flush to the backend and
+    at most ``max_in_flight`` requests are outstanding at any time.
+    """
+
+    # Payloads at least this large are compressed off the event loop
+    THREADED_COMPRESSION_BYTES = 64 * 1024
+
+    def __init__(self, name: str, base_url: str, max_in_flight: int = 4, timeout: float = 10,
+                 compression: str = 'none', compression_level: int = -1, compression_min_bytes: int = 1024):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_min_bytes = compression_min_bytes
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._session = None
+        gauge_function(sink_in_flight.labels(sink=name), lambda: self.in_flight)
+
+    @property
+    def saturated(self) -> bool:
+        """True when every in-flight slot is taken"""
+        return self.in_flight >= self.max_in_flight
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def prepare(self, path: str, data: bytes, headers: dict = None) -> tuple:
+        """Compress a payload for this backend, returning (path, data, headers)"""
+        if self.compression == 'none' or len(data) < self.compression_min_bytes:
+            return path, data, headers
+        if len(data) >= self.THREADED_COMPRESSION_BYTES:
+            data = await asyncio.to_thread(compress, data, self.compression, self.compression_level)
+        else:
+            data = compress(data, self.compression, self.compression_level)
+        return path, data, {**(headers or {}), 'Content-Encoding': self.compression}
+
+    async def post(self, path: str, data: bytes, headers: dict = None) -> bytes:
+        """POST a payload to the backend, raising on HTTP errors"""
+        async with self._semaphore:
+            self.in_flight += 1
+            result = 'error'
+            try:
+                session = self._get_session()
+                async with session.post(f"{self.base_url}{path}", data=data, headers=headers) as response:
+                    body = await response.read()
+                    if response.status >= 400:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                            message=body[:200].decode('utf-8', 'replace'),
+                        )
+                    result = 'success'
+                    sink_bytes.labels(sink=self.name).inc(len(data))
+                    return body
+            finally:
+                self.in_flight -= 1
+                sink_requests.labels(sink=self.name, result=result).inc()
+
+    async def close(self):
+        """Close the pooled session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info(f"Closed {self.name} sink")
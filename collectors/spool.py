@@ -0,0 +1,242 @@
+"""Disk-backed write-ahead spool for Sentio IoT Collectors
+
+Payloads that could not be delivered are appended to segment files as framed
+records and replayed once the backend is reachable again. Each record is::
+
+    <u32 length> <u32 crc32> <u16 meta length> <meta JSON> <body>
+
+where length/crc cover everything after the 8-byte frame header and the meta
+JSON holds the request path and headers. A segment is deleted once every
+record in it has been acknowledged by the backend; progress inside a segment
+is kept in a ``.ack`` sidecar so a restart resumes where replay stopped.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('<II')
+META_HEADER = struct.Struct('<H')
+SEGMENT_SUFFIX = '.wal'
+ACK_SUFFIX = '.ack'
+
+spool_bytes = Gauge('sentio_spool_bytes', 'Bytes held in the write-ahead spool', ['sink'], multiprocess_mode='livesum')
+spool_records_written = Counter('sentio_spool_records_written_total', 'Records appended to the spool', ['sink'])
+spool_records_replayed = Counter('sentio_spool_records_replayed_total', 'Spooled records delivered on replay', ['sink'])
+spool_records_dropped = Counter(
+    'sentio_spool_records_dropped_total', 'Spooled records discarded (overflow or corruption)', ['sink']
+)
+
+
+class SpoolRecord:
+    """A single spooled request"""
+
+    __slots__ = ('path', 'headers', 'body', 'end_offset')
+
+    def __init__(self, path: str, headers: dict, body: bytes, end_offset: int = 0):
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.end_offset = end_offset
+
+
+class SegmentSpool:
+    """Append-only segment files with batched fsync and acknowledged replay"""
+
+    def __init__(self, directory: str, name: str, max_bytes: int, segment_bytes: int = 8 * 1024 * 1024,
+                 fsync_interval: float = 1.0, fsync_batch: int = 64):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_seq = 0
+        self._active_size = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        sealed = self._sealed_segments()
+        self._active_seq = (self._segment_seq(sealed[-1]) + 1) if sealed else 1
+        self._bytes = sum(self._unacked_size(p) for p in sealed)
+        self._update_size_gauge()
+        if sealed:
+            logger.info(f"Found {len(sealed)} spooled segment(s) for {name} in {directory}")
+
+    # Segment bookkeeping
+
+    @staticmethod
+    def _segment_seq(path: str) -> int:
+        return int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)])
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _all_segments(self) -> list:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _sealed_segments(self) -> list:
+        active = self._segment_path(self._active_seq) if self._active is not None else None
+        return [p for p in self._all_segments() if p != active]
+
+    def _unacked_size(self, path: str) -> int:
+        try:
+            return max(0, os.path.getsize(path) - self._read_ack(path))
+        except OSError:
+            return 0
+
+    def total_bytes(self) -> int:
+        """Bytes spooled but not yet acknowledged"""
+        return self._bytes
+
+    def _update_size_gauge(self):
+        spool_bytes.labels(sink=self.name).set(self._bytes)
+
+    # Writing
+
+    def append(self, path: str, body: bytes, headers: dict = None):
+        """Append one request to the active segment"""
+        meta = json.dumps({'path': path, 'headers': headers or {}}).encode('utf-8')
+        payload = META_HEADER.pack(len(meta)) + meta + body
+        frame = FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            self._enforce_limit(len(frame))
+            if self._active is None:
+                self._active = open(self._segment_path(self._active_seq), 'ab')
+                self._active_size = self._active.tell()
+            self._active.write(frame)
+            self._active_size += len(frame)
+            self._bytes += len(frame)
+            self._unsynced += 1
+            spool_records_written.labels(sink=self.name).inc()
+
+            if self._active_size >= self.segment_bytes:
+                self._seal_locked()
+            else:
+                self._maybe_sync_locked()
+        self._update_size_gauge()
+
+    def _maybe_sync_locked(self, force: bool = False):
+        if self._active is None or not self._unsynced:
+            return
+        due = time.monotonic() - self._last_sync >= self.fsync_interval
+        if force or due or self._unsynced >= self.fsync_batch:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def _seal_locked(self):
+        if self._active is None:
+            return
+        self._maybe_sync_locked(force=True)
+        self._active.close()
+        self._active = None
+        self._active_seq += 1
+        self._active_size = 0
+
+    def _enforce_limit(self, incoming: int):
+        """Drop the oldest sealed segments until the new frame fits"""
+        while self.max_bytes and self._bytes + incoming > self.max_bytes:
+            sealed = self._sealed_segments()
+            if not sealed:
+                break
+            dropped = sum(1 for _ in self.pending_records(sealed[0]))
+            self._remove_segment(sealed[0])
+            spool_records_dropped.labels(sink=self.name).inc(dropped)
+            logger.warning(f"{self.name} spool over {self.max_bytes} bytes, dropped {dropped} oldest record(s)")
+
+    def sync(self):
+        """Fsync pending writes if the batching interval has elapsed"""
+        with self._lock:
+            self._maybe_sync_locked()
+
+    def close(self):
+        """Seal the active segment so it is picked up on the next start"""
+        with self._lock:
+            self._seal_locked()
+
+    # Reading
+
+    def _read_ack(self, path: str) -> int:
+        try:
+            with open(path + ACK_SUFFIX, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_ack(self, path: str, offset: int):
+        tmp = path + ACK_SUFFIX + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp, path + ACK_SUFFIX)
+
+    def _remove_segment(self, path: str):
+        self._bytes -= self._unacked_size(path)
+        for p in (path, path + ACK_SUFFIX):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def _iter_records(self, path: str, offset: int = 0):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    if header:
+                        logger.warning(f"Truncated frame header at end of {path}")
+                    return
+                length, crc = FRAME_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.warning(f"Corrupt or torn record in {path}, skipping rest of segment")
+                    spool_records_dropped.labels(sink=self.name).inc()
+                    return
+                (meta_len,) = META_HEADER.unpack_from(payload)
+                meta = json.loads(payload[META_HEADER.size:META_HEADER.size + meta_len])
+                body = payload[META_HEADER.size + meta_len:]
+                yield SpoolRecord(meta['path'], meta.get('headers', {}), body, f.tell())
+
+    def next_segment(self):
+        """Return the oldest segment ready for replay, sealing the active one if needed"""
+        with self._lock:
+            sealed = self._sealed_segments()
+            if not sealed and self._active is not None and self._active_size:
+                self._seal_locked()
+                sealed = self._sealed_segments()
+        return sealed[0] if sealed else None
+
+    def pending_records(self, path: str):
+        """Iterate records of a segment that have not been acknowledged yet"""
+        return self._iter_records(path, self._read_ack(path))
+
+    def ack(self, path: str, record: SpoolRecord):
+        """Mark a record as delivered"""
+        with self._lock:
+            if not os.path.exists(path):
+                # Segment was dropped for space while it was being replayed
+                return
+            self._bytes -= record.end_offset - self._read_ack(path)
+            self._write_ack(path, record.end_offset)
+        spool_records_replayed.labels(sink=self.name).inc()
+        self._update_size_gauge()
+
+    def complete(self, path: str):
+        """Remove a fully acknowledged segment"""
+        with self._lock:
+            self._remove_segment(path)
+        self._update_size_gauge()
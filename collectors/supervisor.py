@@ -0,0 +1,92 @@
+"""Multi-process supervisor for Sentio IoT Collectors
+
+Runs several copies of the collectors service sharing one listening port via
+SO_REUSEPORT, so the kernel spreads connections across cores. Workers share
+nothing: each owns its buffers, sink connections and spool and drains them
+when it receives SIGTERM. Self-metrics are combined through prometheus_client's
+multiprocess mode, so any worker can answer ``/metrics`` for all of them.
+"""
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+
+from prometheus_client.multiprocess import mark_process_dead
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID_ENV = 'COLLECTOR_WORKER_ID'
+
+
+def worker_id():
+    """Index of this worker process, or None outside the supervisor"""
+    value = os.environ.get(WORKER_ID_ENV)
+    return int(value) if value else None
+
+
+class Supervisor:
+    """Start, restart and gracefully stop a fixed number of worker processes"""
+
+    def __init__(self, workers: int, command: list, metrics_dir: str, drain_timeout: float = 30,
+                 restart_delay: float = 1):
+        self.workers = workers
+        self.command = command
+        self.metrics_dir = metrics_dir
+        self.drain_timeout = drain_timeout
+        self.restart_delay = restart_delay
+        self.processes = {}
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        env = {**os.environ, WORKER_ID_ENV: str(index), 'PROMETHEUS_MULTIPROC_DIR': self.metrics_dir}
+        process = subprocess.Popen(self.command, env=env)
+        self.processes[index] = process
+        logger.info(f"Started collectors worker {index} (pid {process.pid})")
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self) -> int:
+        """Supervise workers until SIGTERM/SIGINT, then drain them and return an exit code"""
+        # Stale files from a previous run would be summed into the metrics
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for index in range(self.workers):
+            self._spawn(index)
+
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, process in list(self.processes.items()):
+                if process.poll() is None or self._stopping:
+                    continue
+                logger.error(f"Collectors worker {index} (pid {process.pid}) exited with {process.returncode}")
+                mark_process_dead(process.pid, self.metrics_dir)
+                time.sleep(self.restart_delay)
+                self._spawn(index)
+
+        return self._stop()
+
+    def _stop(self) -> int:
+        logger.info(f"Draining {len(self.processes)} collectors worker(s)")
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+        deadline = time.monotonic() + self.drain_timeout
+        exit_code = 0
+        for index, process in self.processes.items():
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.error(f"Collectors worker {index} did not drain in {self.drain_timeout}s, killing it")
+                process.kill()
+                process.wait()
+            if process.returncode:
+                exit_code = 1
+            mark_process_dead(process.pid, self.metrics_dir)
+        return exit_code
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Collector modules import each other by bare name, as they do when run from the service directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main reads its configuration at import time; keep the tests off any deployment config
+os.environ.setdefault('COLLECTOR_CONFIG_PATH', os.devnull)
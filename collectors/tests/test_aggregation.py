@@ -0,0 +1,88 @@
+import pytest
+
+from aggregation import AggregationRule, Aggregator
+
+MINUTE = 60000
+
+
+def sample(value: float, timestamp: int, sensor: str = 'a', name: str = 'temperature') -> tuple:
+    return (name, {'sensor': sensor}, value, timestamp)
+
+
+def rollups(entries: list) -> dict:
+    return {name: (value, timestamp) for name, _, value, timestamp in entries if ':' in name}
+
+
+def test_window_closes_on_the_next_window_with_named_rollups():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['min', 'max', 'avg', 'count'])])
+    assert aggregator.process([sample(1.0, 1000), sample(3.0, 2000), sample(2.0, 59999)], now_ms=60000) == []
+    out = aggregator.process([sample(10.0, MINUTE)], now_ms=MINUTE + 1)
+    assert rollups(out) == {
+        'temperature:60s_min': (1.0, MINUTE),
+        'temperature:60s_max': (3.0, MINUTE),
+        'temperature:60s_avg': (2.0, MINUTE),
+        'temperature:60s_count': (3, MINUTE),
+    }
+    assert all(labels == {'sensor': 'a'} for _, labels, _, _ in out)
+
+
+def test_expire_waits_for_grace():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['sum'])], grace=5)
+    aggregator.process([sample(1.0, 1000)], now_ms=1000)
+    assert aggregator.expire(now_ms=MINUTE + 4999) == []
+    assert rollups(aggregator.expire(now_ms=MINUTE + 5000)) == {'temperature:60s_sum': (1.0, MINUTE)}
+    assert aggregator.windows == {}
+
+
+def test_straggler_within_grace_joins_its_window():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['sum'])], grace=5)
+    aggregator.process([sample(1.0, 1000)], now_ms=1000)
+    assert aggregator.process([sample(2.0, 59000)], now_ms=MINUTE + 3000) == []
+    assert rollups(aggregator.expire(now_ms=MINUTE + 5000)) == {'temperature:60s_sum': (3.0, MINUTE)}
+
+
+def test_straggler_after_grace_passes_through_raw():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['sum'])], grace=5)
+    aggregator.process([sample(1.0, 1000)], now_ms=1000)
+    aggregator.expire(now_ms=MINUTE + 5000)
+    straggler = sample(2.0, 59000)
+    assert aggregator.process([straggler], now_ms=MINUTE + 6000) == [straggler]
+    assert aggregator.windows == {}
+
+
+def test_straggler_for_a_window_already_replaced_passes_through_raw():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['sum'])])
+    aggregator.process([sample(1.0, 1000), sample(2.0, MINUTE + 1000)], now_ms=MINUTE + 1000)
+    straggler = sample(5.0, 2000)
+    assert aggregator.process([straggler], now_ms=MINUTE + 2000) == [straggler]
+
+
+def test_keep_raw_forwards_samples_alongside_rollups():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['last'], keep_raw=True)])
+    first, second = sample(1.0, 1000), sample(2.0, MINUTE + 1000)
+    assert aggregator.process([first], now_ms=1000) == [first]
+    out = aggregator.process([second], now_ms=MINUTE + 1000)
+    assert second in out
+    assert rollups(out) == {'temperature:60s_last': (1.0, MINUTE)}
+
+
+def test_unmatched_names_and_series_beyond_max_series_pass_through():
+    aggregator = Aggregator([AggregationRule('temperature', window=60)], max_series=1)
+    humidity = sample(50.0, 1000, name='humidity')
+    overflow = sample(2.0, 1000, sensor='b')
+    assert aggregator.process([sample(1.0, 1000), humidity, overflow], now_ms=1000) == [humidity, overflow]
+    assert len(aggregator.windows) == 1
+
+
+def test_close_all_emits_every_open_window():
+    aggregator = Aggregator([AggregationRule('temperature', window=60, functions=['count'])])
+    aggregator.process([sample(1.0, 1000, sensor='a'), sample(1.0, 1000, sensor='b')], now_ms=1000)
+    assert len(aggregator.close_all()) == 2
+    assert aggregator.windows == {}
+
+
+def test_rules_reject_bad_settings():
+    with pytest.raises(ValueError, match="Unknown aggregation function"):
+        AggregationRule('temperature', functions=['median'])
+    with pytest.raises(ValueError, match="must be positive"):
+        AggregationRule('temperature', window=0)
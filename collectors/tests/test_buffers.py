@@ -0,0 +1,33 @@
+from samples import SampleBuffer
+
+
+def test_tenant_queues_start_small_and_charge_their_capacity():
+    import main
+
+    collector, budget = main.metrics_collector, main.memory_budget
+    before = budget.reserved.get('metrics', 0)
+    collector.collect_series('temperature', {}, [(1.0, 1700000000000)], tenant='capacity-small')
+    queue = collector.queues.get('capacity-small')
+    assert queue.buffer.capacity == main.SAMPLE_BUFFER_INITIAL_CAPACITY
+    assert budget.reserved['metrics'] - before == SampleBuffer.ITEM_SIZE * queue.buffer.capacity
+
+
+def test_grown_tenant_queues_are_trimmed_after_flush():
+    import main
+
+    collector, budget = main.metrics_collector, main.memory_budget
+    samples = [(float(i), 1700000000000 + i) for i in range(5000)]
+    collector.collect_series('temperature', {}, samples, tenant='capacity-burst')
+    queue = collector.queues.get('capacity-burst')
+    assert queue.buffer.capacity >= 5000
+    grown = budget.reserved['metrics']
+
+    collector._trim_queues()
+    assert queue.buffer.capacity >= 5000, "buffered samples must not be trimmed away"
+    # As if the samples had been flushed
+    queue.buffer.clear()
+    budget.release('metrics', queue.bytes)
+    queue.bytes = 0
+    collector._trim_queues()
+    assert queue.buffer.capacity == main.SAMPLE_BUFFER_INITIAL_CAPACITY
+    assert grown - budget.reserved['metrics'] >= SampleBuffer.ITEM_SIZE * (5000 - main.SAMPLE_BUFFER_INITIAL_CAPACITY)
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from cardinality import HyperLogLog, WindowedSketch, hash64
+
+
+def test_hash64_is_stable_across_processes():
+    code = "from cardinality import hash64; print(hash64('sensor-1'), hash64(('temp', (('site', 'a'),))))"
+    outputs = set()
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        outputs.add(subprocess.run(
+            [sys.executable, '-c', code], env=env, cwd=os.path.dirname(os.path.dirname(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout)
+    assert outputs == {f"{hash64('sensor-1')} {hash64(('temp', (('site', 'a'),)))}\n"}
+
+
+def test_hash64_fits_64_bits():
+    assert all(0 <= hash64(f"value-{i}") < 2 ** 64 for i in range(1000))
+    assert hash64('\ud800') != hash64('')
+
+
+def test_hll_estimates_within_tolerance():
+    for count in (10, 1000, 50000):
+        sketch = HyperLogLog()
+        for i in range(count):
+            sketch.add(hash64(f"series-{i}"))
+        assert abs(sketch.estimate() - count) <= 0.1 * count + 1
+
+
+def test_windowed_sketch_forgets_after_two_rotations():
+    sketch = WindowedSketch()
+    for i in range(500):
+        sketch.add(hash64(f"series-{i}"))
+    sketch.rotate()
+    assert abs(sketch.estimate() - 500) <= 50
+    sketch.rotate()
+    assert sketch.empty and sketch.estimate() == 0
@@ -0,0 +1,79 @@
+import asyncio
+import zlib
+
+import pytest
+import zstandard
+from aiohttp.test_utils import TestClient, TestServer
+
+from compression import ZSTD_MAX_PIECE, StreamDecoder, compress
+
+
+def decode_all(encoding: str, body: bytes, chunk_size: int = 65536) -> list:
+    decoder = StreamDecoder(encoding, chunk_size)
+    pieces = []
+    for start in range(0, len(body), chunk_size):
+        pieces.extend(decoder.decode(body[start:start + chunk_size]))
+    pieces.extend(decoder.finish())
+    return pieces
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate', 'zstd'])
+def test_round_trip(encoding):
+    body = b'{"name": "temperature", "value": 21.5}\n' * 1000
+    assert b''.join(decode_all(encoding, compress(body, encoding))) == body
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'zstd'])
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_concatenated_members_are_all_decoded(encoding, chunk_size):
+    body = compress(b'a' * 10, encoding) + compress(b'b' * 10, encoding) + compress(b'c' * 5000, encoding)
+    assert b''.join(decode_all(encoding, body, chunk_size)) == b'a' * 10 + b'b' * 10 + b'c' * 5000
+
+
+def test_trailing_data_after_deflate_is_rejected():
+    with pytest.raises(zlib.error, match="trailing data"):
+        decode_all('deflate', compress(b'a' * 10, 'deflate') + b'junk')
+
+
+def test_truncated_second_gzip_member_is_rejected():
+    second = compress(b'b' * 1000, 'gzip')
+    with pytest.raises(zlib.error, match="incomplete"):
+        decode_all('gzip', compress(b'a' * 10, 'gzip') + second[:len(second) // 2])
+
+
+def test_zstd_bomb_is_inflated_in_bounded_pieces():
+    body = bytes(64 * 1024 * 1024)
+    bomb = compress(body, 'zstd', level=19)
+    total = 0
+    for piece in decode_all('zstd', bomb):
+        assert len(piece) <= ZSTD_MAX_PIECE
+        total += len(piece)
+    assert total == len(body)
+
+
+@pytest.mark.parametrize('encoding, error', [('gzip', zlib.error), ('deflate', zlib.error),
+                                             ('zstd', zstandard.ZstdError)])
+def test_truncated_stream_is_rejected(encoding, error):
+    body = compress(bytes(range(256)) * 64, encoding)
+    with pytest.raises(error, match="incomplete"):
+        decode_all(encoding, body[:len(body) // 2])
+
+
+def test_truncated_body_gets_400():
+    import main
+
+    async def post():
+        client = TestClient(TestServer(main.create_app()))
+        await client.start_server()
+        try:
+            body = compress(b'{"name": "temperature", "value": 21.5}', 'zstd')
+            response = await client.post('/collect/metrics', data=body[:-3], headers={
+                'Content-Type': 'application/json', 'Content-Encoding': 'zstd'
+            })
+            return response.status, await response.text()
+        finally:
+            await client.close()
+
+    status, text = asyncio.run(post())
+    assert status == 400
+    assert 'incomplete zstd frame' in text
@@ -0,0 +1,59 @@
+import pytest
+
+from deadband import Deadband, DeadbandRule
+
+
+def entry(value: float, timestamp: int, name: str = 'temperature', sensor: str = 'a') -> tuple:
+    return (name, {'sensor': sensor}, value, timestamp)
+
+
+def forwarded(deadband: Deadband, samples: list) -> list:
+    return [value for _, _, value, _ in deadband.filter([entry(v, ts) for v, ts in samples], now_ms=0)]
+
+
+def test_absolute_tolerance():
+    deadband = Deadband([DeadbandRule('temperature', absolute=0.5)])
+    assert forwarded(deadband, [(20.0, 1), (20.4, 2), (20.6, 3), (20.2, 4), (20.0, 5)]) == [20.0, 20.6, 20.0]
+
+
+def test_relative_tolerance_scales_with_the_last_value():
+    deadband = Deadband([DeadbandRule('temperature', relative=0.1)])
+    assert forwarded(deadband, [(100.0, 1), (109.0, 2), (111.0, 3), (1.0, 4), (1.05, 5)]) == [100.0, 111.0, 1.0]
+
+
+def test_heartbeat_forwards_unchanged_values():
+    deadband = Deadband([DeadbandRule('temperature', absolute=1, heartbeat=10)])
+    assert forwarded(deadband, [(5.0, 0), (5.0, 9999), (5.0, 10000), (5.0, 15000), (5.0, 20000)]) == [5.0, 5.0, 5.0]
+
+
+def test_nan_and_unmatched_names():
+    deadband = Deadband([DeadbandRule('temperature', absolute=1)])
+    assert len(forwarded(deadband, [(1.0, 1), (float('nan'), 2), (float('nan'), 3), (1.0, 4)])) == 3
+    humidity = [entry(50.0, 1, 'humidity'), entry(50.0, 2, 'humidity')]
+    assert deadband.filter(humidity, now_ms=0) == humidity
+
+
+def test_series_beyond_max_series_pass_through_untracked():
+    deadband = Deadband([DeadbandRule('temperature', absolute=1)], max_series=1)
+    samples = [entry(1.0, 1, sensor='a'), entry(1.0, 1, sensor='b'), entry(1.0, 2, sensor='a'),
+               entry(1.0, 2, sensor='b')]
+    assert [labels['sensor'] for _, labels, _, _ in deadband.filter(samples, now_ms=0)] == ['a', 'b', 'b']
+    assert len(deadband.last) == 1
+
+
+def test_prune_runs_at_most_once_per_heartbeat():
+    deadband = Deadband([DeadbandRule('temperature', heartbeat=10), DeadbandRule('*', heartbeat=60)])
+    deadband.filter([entry(1.0, 0)], now_ms=0)
+    deadband.prune(now_ms=5000)
+    deadband.filter([entry(1.0, 0, sensor='b')], now_ms=0)
+    deadband.prune(now_ms=12000)
+    assert len(deadband.last) == 2, "pruned again before the shortest heartbeat passed"
+    deadband.prune(now_ms=15000)
+    assert deadband.last == {}
+
+
+def test_rules_reject_bad_settings():
+    with pytest.raises(ValueError):
+        DeadbandRule('temperature', absolute=-1)
+    with pytest.raises(ValueError):
+        DeadbandRule('temperature', heartbeat=0)
@@ -0,0 +1,81 @@
+from flowcontrol import FlushController
+
+
+def controller(**kwargs) -> FlushController:
+    settings = dict(batch_size=1000, delay=10, min_batch=100, max_batch=5000, target_latency=1.0,
+                    max_payload_bytes=1000000)
+    settings.update(kwargs)
+    return FlushController('test', **settings)
+
+
+def test_full_fast_flushes_grow_additively_up_to_max_batch():
+    flow = controller()
+    flow.on_success(0.1, 1000, 1000)
+    assert flow.batch_size == 1100
+    for _ in range(100):
+        flow.on_success(0.1, 1000, flow.batch_size)
+    assert flow.batch_size == 5000
+
+
+def test_partial_batches_do_not_grow():
+    flow = controller()
+    flow.on_success(0.1, 1000, 10)
+    assert flow.batch_size == 1000
+
+
+def test_slow_or_oversized_flushes_halve_down_to_min_batch():
+    flow = controller()
+    flow.on_success(2.0, 1000, 1000)
+    assert flow.batch_size == 500
+    flow.on_success(0.1, 2000000, 500)
+    assert flow.batch_size == 250
+    for _ in range(10):
+        flow.on_success(5.0, 1000, 250)
+    assert flow.batch_size == 100
+
+
+def test_errors_shrink_and_back_off_delay_within_bounds():
+    flow = controller(max_delay=60)
+    flow.on_error()
+    assert (flow.batch_size, flow.delay) == (500, 20)
+    for _ in range(10):
+        flow.on_error()
+    assert (flow.batch_size, flow.delay) == (100, 60)
+    assert flow.consecutive_errors == 11
+
+
+def test_recent_errors_block_growth_until_they_decay():
+    flow = controller()
+    flow.on_error()
+    flow.on_success(0.1, 1000, flow.batch_size)
+    assert flow.batch_size == 500
+    for _ in range(10):
+        flow.on_success(0.1, 1000, flow.batch_size)
+    assert flow.batch_size > 500
+    assert flow.consecutive_errors == 0
+
+
+def test_delay_leaves_room_for_delivery_and_stays_above_min_delay():
+    flow = controller(delay=10, min_delay=0.5)
+    for _ in range(50):
+        flow.on_success(4.0, 1000, 10)
+    assert 5.9 < flow.delay < 6.1
+    flow = controller(delay=1, min_delay=0.5)
+    for _ in range(50):
+        flow.on_success(3.0, 1000, 10)
+    assert flow.delay == 0.5
+
+
+def test_latency_converges_under_steady_load():
+    flow = controller()
+    for _ in range(30):
+        flow.on_success(0.8, 1000, 10)
+    assert abs(flow.latency - 0.8) < 0.01
+
+
+def test_disabled_controller_keeps_its_settings():
+    flow = controller(adaptive=False)
+    flow.on_error()
+    flow.on_success(5.0, 10 ** 9, 1000)
+    flow.on_success(0.1, 1000, 1000)
+    assert (flow.batch_size, flow.delay) == (1000, 10)
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from ingest import validate_log, validate_metric
+
+
+@pytest.mark.parametrize('timestamp', [float('nan'), float('inf'), float('-inf'), 1e20, 2 ** 63, -2 ** 63 - 1])
+def test_validate_metric_rejects_unrepresentable_timestamps(timestamp):
+    with pytest.raises(ValueError, match="'timestamp'"):
+        validate_metric({'name': 'temperature', 'value': 1, 'timestamp': timestamp})
+
+
+@pytest.mark.parametrize('timestamp', [None, 0, 1700000000000, 1700000000000.5, 2 ** 63 - 1])
+def test_validate_metric_accepts_int64_timestamps(timestamp):
+    metric = {'name': 'temperature', 'value': 1, 'timestamp': timestamp}
+    assert validate_metric(metric) is metric
+
+
+@pytest.mark.parametrize('value', [10 ** 400, -10 ** 400])
+def test_validate_metric_rejects_values_too_large_for_a_float(value):
+    with pytest.raises(ValueError, match="'value' is out of range"):
+        validate_metric({'name': 'temperature', 'value': value})
+
+
+@pytest.mark.parametrize('timestamp', [True, [1], {'s': 1}])
+def test_validate_log_names_accepted_timestamp_types(timestamp):
+    with pytest.raises(ValueError, match="'timestamp' must be a number or a string"):
+        validate_log({'message': 'started', 'timestamp': timestamp})
+
+
+@pytest.mark.parametrize('timestamp', [1700000000000, 1700000000.5, '2024-01-01T00:00:00Z'])
+def test_validate_log_accepts_numeric_and_string_timestamps(timestamp):
+    log = {'message': 'started', 'timestamp': timestamp}
+    assert validate_log(log) is log
+
+
+async def _post_metrics(body):
+    import main
+
+    client = TestClient(TestServer(main.create_app()))
+    await client.start_server()
+    try:
+        before = len(main.metrics_collector.queues)
+        response = await client.post('/collect/metrics', json=body)
+        return response.status, await response.json(), len(main.metrics_collector.queues) - before
+    finally:
+        await client.close()
+
+
+def test_bad_timestamp_rejects_only_its_own_sample():
+    body = [
+        {'name': 'a', 'value': 1, 'timestamp': 1700000000000},
+        {'name': 'b', 'value': 2, 'timestamp': 1e20},
+        {'name': 'c', 'value': 3},
+    ]
+    status, result, buffered = asyncio.run(_post_metrics(body))
+    assert status == 200
+    assert result['status'] == 'partial'
+    assert (result['accepted'], result['rejected']) == (2, 1)
+    assert result['errors'][0]['index'] == 1
+    assert buffered == 2
+
+
+def test_samples_that_fail_to_buffer_are_not_accepted(monkeypatch):
+    import main
+
+    def broken_append(entries, queue):
+        raise OverflowError("boom")
+
+    monkeypatch.setattr(main.metrics_collector, '_append', broken_append)
+    status, result, buffered = asyncio.run(_post_metrics([{'name': 'a', 'value': 1}, {'name': 'b', 'value': 2}]))
+    assert status == 500
+    assert (result['accepted'], result['rejected']) == (0, 2)
+    assert buffered == 0
+
+
+def test_huge_integer_value_rejects_only_its_own_sample():
+    status, result, buffered = asyncio.run(_post_metrics([{'name': 'a', 'value': 1}, {'name': 'b', 'value': 10 ** 400}]))
+    assert status == 200
+    assert (result['accepted'], result['rejected'], buffered) == (1, 1, 1)
+    assert "'value' is out of range" in result['errors'][0]['error']
@@ -0,0 +1,124 @@
+import pytest
+
+from logpipeline import LogPipeline
+
+
+def run(stages: list, *logs) -> list:
+    return LogPipeline.from_config({'stages': stages}).process([dict(log) for log in logs])
+
+
+def line(message: str, **labels) -> dict:
+    return {'message': message, 'labels': labels}
+
+
+def test_regex_extracts_named_groups_to_labels():
+    [log] = run([
+        {'type': 'regex', 'expression': r'level=(?P<level>\w+) unit=(?P<unit>\d+)'},
+        {'type': 'labels', 'labels': ['level', 'unit']},
+    ], line('poll level=warn unit=3 timed out', job='modbus'))
+    assert log['labels'] == {'job': 'modbus', 'level': 'warn', 'unit': '3'}
+    assert log['message'] == 'poll level=warn unit=3 timed out'
+
+
+def test_regex_needs_named_groups():
+    with pytest.raises(ValueError, match="named groups"):
+        LogPipeline.from_config({'stages': [{'type': 'regex', 'expression': r'(\w+)'}]})
+
+
+@pytest.mark.parametrize('message, expected', [
+    ('a=1 b="two words"', {'a': '1', 'b': 'two words'}),
+    (r'a="say \"hi\""', {'a': 'say "hi"'}),
+    (r'a="x\\" b=2', {'a': 'x\\', 'b': '2'}),
+    (r'a="x\\\"y"', {'a': 'x\\"y'}),
+    (r'a="tab\there"', {'a': 'tab\there'}),
+    (r'a="C:\dir\\"', {'a': 'C:\\dir\\'}),
+    ('a= b=3', {'a': '', 'b': '3'}),
+])
+def test_logfmt_unescapes_in_one_pass(message, expected):
+    [log] = run([{'type': 'logfmt'}, {'type': 'labels', 'labels': list(expected)}], line(message))
+    assert log['labels'] == expected
+
+
+def test_logfmt_keeps_only_listed_fields():
+    [log] = run([{'type': 'logfmt', 'fields': ['b']}, {'type': 'labels', 'labels': ['a', 'b']}], line('a=1 b=2'))
+    assert log['labels'] == {'b': '2'}
+
+
+@pytest.mark.parametrize('message', [
+    '{"level": "error", "ctx": {"unit": 7}}',
+    'prefix {"level": "error", "ctx": {"unit": 7}} suffix',
+    '{bad prefix {"level": "error", "ctx": {"unit": 7}}',
+])
+def test_json_decodes_the_first_complete_object(message):
+    [log] = run([
+        {'type': 'json', 'fields': {'level': 'level', 'unit': 'ctx.unit'}},
+        {'type': 'labels', 'labels': ['level', 'unit']},
+    ], line(message))
+    assert log['labels'] == {'level': 'error', 'unit': '7'}
+
+
+def test_json_without_paths_takes_top_level_scalars():
+    [log] = run([{'type': 'json'}, {'type': 'labels', 'labels': ['a', 'nested']}], line('{"a": 1, "nested": {"b": 2}}'))
+    assert log['labels'] == {'a': '1'}
+
+
+def test_json_without_an_object_is_unmatched():
+    logs = run([{'type': 'json'}, {'type': 'labels', 'labels': ['a']}], line('no json {here'))
+    assert logs[0]['labels'] == {}
+
+
+def test_drop_by_expression_field_values_and_both():
+    logs = [line('GET /health 200'), line('GET /api 500'), line('level=debug x=1'), line('level=debug cache miss'),
+            line('level=info ok')]
+    kept = run([
+        {'type': 'drop', 'expression': '/health'},
+        {'type': 'logfmt', 'fields': ['level']},
+        {'type': 'drop', 'field': 'level', 'values': ['debug'], 'expression': 'cache'},
+    ], *logs)
+    assert [log['message'] for log in kept] == ['GET /api 500', 'level=debug x=1', 'level=info ok']
+
+    kept = run([{'type': 'logfmt'}, {'type': 'drop', 'field': 'level', 'values': ['debug', 'trace']}], *logs)
+    assert [log['message'] for log in kept] == ['GET /health 200', 'GET /api 500', 'level=info ok']
+
+
+def test_drop_needs_an_expression_or_field():
+    with pytest.raises(ValueError, match="expression or a field"):
+        LogPipeline.from_config({'stages': [{'type': 'drop'}]})
+
+
+@pytest.mark.parametrize('value, fmt, expected', [
+    ('1700000000', 'unix', 1700000000 * 10 ** 9),
+    ('1700000000.5', 'unix', 1700000000500000000),
+    ('1700000000123', 'unix_ms', 1700000000123 * 10 ** 6),
+    ('2023-11-14T22:13:20.25Z', 'rfc3339', 1700000000250000000),
+    ('14/11/2023 22:13:20', '%d/%m/%Y %H:%M:%S', 1700000000 * 10 ** 9),
+])
+def test_timestamp_formats(value, fmt, expected):
+    [log] = run([{'type': 'logfmt'}, {'type': 'timestamp', 'field': 'ts', 'format': fmt}], line(f'ts="{value}"'))
+    assert log['timestamp'] == expected
+
+
+def test_unparseable_timestamp_leaves_the_entry_alone():
+    [log] = run([{'type': 'logfmt'}, {'type': 'timestamp', 'field': 'ts'}], line('ts=yesterday'))
+    assert 'timestamp' not in log
+
+
+def test_match_selects_entries_by_label_glob():
+    logs = [line('level=error', job='modbus-1'), line('level=error', job='opcua')]
+    kept = run([{'type': 'logfmt'}, {'type': 'drop', 'field': 'level', 'match': {'job': 'modbus-*'}}], *logs)
+    assert [log['labels']['job'] for log in kept] == ['opcua']
+
+
+def test_source_reads_an_extracted_field():
+    [log] = run([
+        {'type': 'regex', 'expression': r'payload=(?P<payload>\S+)'},
+        {'type': 'json', 'source': 'payload'},
+        {'type': 'labels', 'labels': {'device': 'id'}},
+    ], line('recv payload={"id":"d1"}'))
+    assert log['labels'] == {'device': 'd1'}
+
+
+def test_unknown_stage_type_and_empty_config():
+    with pytest.raises(ValueError, match="Unknown log pipeline stage type"):
+        LogPipeline.from_config({'stages': [{'type': 'grok'}]})
+    assert LogPipeline.from_config({}) is None
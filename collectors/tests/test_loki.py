@@ -0,0 +1,61 @@
+import json
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory, timestamp_pb2
+
+from loki import encode_json, encode_protobuf, group_streams
+from protowire import snappy_decompress
+
+
+def push_request_class():
+    """Loki's logproto.PushRequest, built from its .proto definition for use as a reference decoder"""
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(timestamp_pb2.DESCRIPTOR.serialized_pb)
+    proto = descriptor_pb2.FileDescriptorProto(
+        name='push.proto', package='logproto', syntax='proto3', dependency=['google/protobuf/timestamp.proto']
+    )
+    Field = descriptor_pb2.FieldDescriptorProto
+    request = proto.message_type.add(name='PushRequest')
+    request.field.add(name='streams', number=1, type=Field.TYPE_MESSAGE, label=Field.LABEL_REPEATED,
+                      type_name='.logproto.StreamAdapter')
+    stream = proto.message_type.add(name='StreamAdapter')
+    stream.field.add(name='labels', number=1, type=Field.TYPE_STRING, label=Field.LABEL_OPTIONAL)
+    stream.field.add(name='entries', number=2, type=Field.TYPE_MESSAGE, label=Field.LABEL_REPEATED,
+                     type_name='.logproto.EntryAdapter')
+    stream.field.add(name='hash', number=3, type=Field.TYPE_UINT64, label=Field.LABEL_OPTIONAL)
+    entry = proto.message_type.add(name='EntryAdapter')
+    entry.field.add(name='timestamp', number=1, type=Field.TYPE_MESSAGE, label=Field.LABEL_OPTIONAL,
+                    type_name='.google.protobuf.Timestamp')
+    entry.field.add(name='line', number=2, type=Field.TYPE_STRING, label=Field.LABEL_OPTIONAL)
+    pool.Add(proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName('logproto.PushRequest'))
+
+
+BATCH = [
+    {'message': 'second', 'timestamp': 1700000000_000000002, 'labels': {'job': 'modbus', 'unit': '1'}},
+    {'message': 'first', 'timestamp': 1700000000_000000001, 'labels': {'unit': '1', 'job': 'modbus'}},
+    {'message': 'quote " and \\ and\nnewline ünïcode', 'timestamp': 1700000001_999999999,
+     'labels': {'job': 'say "hi"\n'}},
+    {'message': '', 'timestamp': 0},
+]
+
+
+def test_protobuf_push_request_decodes_with_the_reference_schema():
+    request = push_request_class()()
+    request.ParseFromString(snappy_decompress(encode_protobuf(group_streams(BATCH))))
+    decoded = {
+        stream.labels: [(entry.timestamp.seconds, entry.timestamp.nanos, entry.line) for entry in stream.entries]
+        for stream in request.streams
+    }
+    assert decoded == {
+        '{job="modbus", unit="1"}': [(1700000000, 1, 'first'), (1700000000, 2, 'second')],
+        '{job="say \\"hi\\"\\n"}': [(1700000001, 999999999, 'quote " and \\ and\nnewline ünïcode')],
+        '{}': [(0, 0, '')],
+    }
+
+
+def test_json_push_body():
+    body = json.loads(encode_json(group_streams(BATCH[:2])))
+    assert body == {'streams': [{
+        'stream': {'job': 'modbus', 'unit': '1'},
+        'values': [['1700000000000000001', 'first'], ['1700000000000000002', 'second']],
+    }]}
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse,
+)
+
+from otlp import OTLPError, encode_request, encode_response, parse_request, service_name, split_by_trace
+
+TRACE_A = '5b8efff798038103d269b633813fc60c'
+TRACE_B = '0af7651916cd43dd8448eb211c80319c'
+
+
+def json_body(*spans) -> bytes:
+    return json.dumps({'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'gateway'}}]},
+        'scopeSpans': [{'scope': {'name': 'sentio'}, 'spans': list(spans)}],
+    }]}).encode('utf-8')
+
+
+def span(trace_id: str, span_id: str, **extra) -> dict:
+    return {'traceId': trace_id, 'spanId': span_id, 'name': 'poll', 'startTimeUnixNano': '1700000000000000001',
+            'endTimeUnixNano': '1700000000500000000', **extra}
+
+
+def test_json_hex_ids_and_string_nanosecond_timestamps():
+    body = json_body(span(TRACE_A, 'eee19b7ec3c1b174', parentSpanId='eee19b7ec3c1b173',
+                          links=[{'traceId': TRACE_B, 'spanId': '00f067aa0ba902b7'}]))
+    [resource_spans] = parse_request(body, protobuf=False)
+    [decoded] = resource_spans.scope_spans[0].spans
+    assert decoded.trace_id.hex() == TRACE_A
+    assert decoded.span_id.hex() == 'eee19b7ec3c1b174'
+    assert decoded.parent_span_id.hex() == 'eee19b7ec3c1b173'
+    assert decoded.links[0].trace_id.hex() == TRACE_B
+    assert decoded.start_time_unix_nano == 1700000000000000001
+    assert service_name(resource_spans) == 'gateway'
+
+
+@pytest.mark.parametrize('body', [b'not json', b'[]', json_body(span('xyz', '00f067aa0ba902b7')),
+                                  json_body(span(TRACE_A, '00f067aa0ba902b7', startTimeUnixNano='soon'))])
+def test_invalid_json_bodies(body):
+    with pytest.raises(OTLPError):
+        parse_request(body, protobuf=False)
+
+
+def test_invalid_protobuf_body():
+    with pytest.raises(OTLPError, match="invalid OTLP protobuf"):
+        parse_request(b'\xff\xff\xff', protobuf=True)
+
+
+def test_protobuf_round_trip_through_split_and_encode():
+    [resource_spans] = parse_request(json_body(
+        span(TRACE_A, '0000000000000001'), span(TRACE_B, '0000000000000002'), span(TRACE_A, '0000000000000003')
+    ), protobuf=False)
+    request = ExportTraceServiceRequest(resource_spans=[resource_spans])
+    [parsed] = parse_request(request.SerializeToString(), protobuf=True)
+    assert parsed == resource_spans
+
+    fragments = split_by_trace(parsed)
+    assert {trace_id.hex(): [s.span_id.hex()[-1] for s in f.scope_spans[0].spans] for trace_id, f in fragments.items()} \
+        == {TRACE_A: ['1', '3'], TRACE_B: ['2']}
+    assert all(service_name(f) == 'gateway' and f.scope_spans[0].scope.name == 'sentio' for f in fragments.values())
+
+    encoded = ExportTraceServiceRequest()
+    encoded.ParseFromString(encode_request(list(fragments.values())))
+    assert list(encoded.resource_spans) == list(fragments.values())
+
+
+def test_single_trace_is_not_copied():
+    [resource_spans] = parse_request(json_body(span(TRACE_A, '0000000000000001')), protobuf=False)
+    assert list(split_by_trace(resource_spans).values())[0] is resource_spans
+
+
+def test_response_reports_shed_spans():
+    body, content_type = encode_response(True, rejected=3, message='shed under memory pressure')
+    response = ExportTraceServiceResponse()
+    response.ParseFromString(body)
+    assert content_type == 'application/x-protobuf'
+    assert (response.partial_success.rejected_spans, response.partial_success.error_message) == \
+        (3, 'shed under memory pressure')
+
+    body, content_type = encode_response(False, rejected=3, message='shed')
+    assert content_type == 'application/json'
+    assert json.loads(body) == {'partialSuccess': {'rejectedSpans': '3', 'errorMessage': 'shed'}}
+    assert json.loads(encode_response(False)[0]) == {}
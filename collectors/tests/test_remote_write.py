@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from protowire import ProtobufError, field_bytes, field_double, field_varint, snappy_compress
+from remote_write import decode_write_request
+
+
+def label(name: bytes, value: bytes) -> bytes:
+    return field_bytes(1, name) + field_bytes(2, value)
+
+
+def timeseries(labels: list, samples: list) -> bytes:
+    body = b''.join(field_bytes(1, label(name, value)) for name, value in labels)
+    body += b''.join(field_bytes(2, field_double(1, value) + field_varint(2, ts)) for value, ts in samples)
+    return field_bytes(1, body)
+
+
+def write_request(*series: bytes) -> bytes:
+    return snappy_compress(b''.join(series))
+
+
+GOOD = timeseries([(b'__name__', b'up'), (b'job', b'node')], [(1.0, 1700000000000), (0.0, 1700000015000)])
+BAD_UTF8 = timeseries([(b'__name__', b'up'), (b'job', b'\xff\xfe')], [(1.0, 1700000000000)])
+
+
+def test_decode_write_request():
+    assert list(decode_write_request(write_request(GOOD), 1 << 20)) == [
+        ('up', {'job': 'node'}, [(1.0, 1700000000000), (0.0, 1700000015000)])
+    ]
+
+
+def test_invalid_utf8_label_is_a_protobuf_error():
+    with pytest.raises(ProtobufError, match='UTF-8'):
+        list(decode_write_request(write_request(GOOD, BAD_UTF8), 1 << 20))
+
+
+async def _post_write(body):
+    import main
+
+    client = TestClient(TestServer(main.create_app()))
+    await client.start_server()
+    try:
+        before = len(main.metrics_collector.queues)
+        response = await client.post('/api/v1/write', data=body, headers={
+            'Content-Type': 'application/x-protobuf', 'Content-Encoding': 'snappy'
+        })
+        return response.status, len(main.metrics_collector.queues) - before
+    finally:
+        await client.close()
+
+
+def test_malformed_write_request_buffers_nothing():
+    # The valid series comes first, so a streaming decoder would already have queued it
+    status, buffered = asyncio.run(_post_write(write_request(GOOD, BAD_UTF8)))
+    assert status == 400
+    assert buffered == 0
+
+
+def test_write_request_is_buffered():
+    status, buffered = asyncio.run(_post_write(write_request(GOOD)))
+    assert status == 204
+    assert buffered == 2
@@ -0,0 +1,14 @@
+from types import SimpleNamespace
+
+from rules import RuleMatcher
+
+
+def test_first_matching_rule_wins_and_cache_is_bounded():
+    temperature, sensors = SimpleNamespace(match='temperature_*'), SimpleNamespace(match='*')
+    default = SimpleNamespace(match=None)
+    matcher = RuleMatcher([temperature, sensors], default, max_cached=2)
+    assert matcher.rule_for('temperature_c') is temperature
+    assert matcher.rule_for('humidity') is sensors
+    assert matcher.rule_for('pressure') is sensors
+    assert len(matcher._cache) == 2
+    assert RuleMatcher([temperature], default).rule_for('humidity') is default
@@ -0,0 +1,57 @@
+from samples import SampleBuffer
+
+
+def test_on_resize_reports_growth_trim_and_release():
+    changes = []
+    buffer = SampleBuffer(4, changes.append)
+    buffer.extend([1] * 5, [1.0] * 5, [0] * 5)
+    assert buffer.capacity == 8
+    buffer.clear()
+    buffer.trim(2)
+    assert buffer.capacity == 2
+    buffer.release()
+    assert changes == [4 * 24, 4 * 24, -6 * 24, -2 * 24]
+    assert sum(changes) == 0
+
+
+def test_trim_keeps_buffered_samples():
+    buffer = SampleBuffer(16)
+    buffer.extend([1, 2, 3], [1.0, 2.0, 3.0], [10, 20, 30])
+    buffer.trim(1)
+    assert buffer.capacity == 3
+    assert list(buffer) == [(1, 1.0, 10), (2, 2.0, 20), (3, 3.0, 30)]
+
+
+def test_extend_grows_by_doubling_and_keeps_order():
+    buffer = SampleBuffer(2)
+    buffer.extend([1, 2, 3], [1.0, 2.0, 3.0], [10, 20, 30])
+    buffer.extend([4], [4.5], [40])
+    assert buffer.capacity == 4
+    assert list(buffer) == [(1, 1.0, 10), (2, 2.0, 20), (3, 3.0, 30), (4, 4.5, 40)]
+
+
+def test_move_front_splits_in_order():
+    buffer, part = SampleBuffer(4), SampleBuffer(1)
+    buffer.extend([1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0], [10, 20, 30, 40])
+    part.extend([9], [9.0], [90])
+    buffer.move_front(3, part)
+    assert list(part) == [(9, 9.0, 90), (1, 1.0, 10), (2, 2.0, 20), (3, 3.0, 30)]
+    assert list(buffer) == [(4, 4.0, 40)]
+    buffer.move_front(1, part)
+    assert len(buffer) == 0 and len(part) == 5
+
+
+def test_extend_buffer_appends_only_filled_samples():
+    front, back = SampleBuffer(8), SampleBuffer(8)
+    front.extend([1], [1.0], [10])
+    back.extend([2, 3], [2.0, 3.0], [20, 30])
+    front.extend_buffer(back)
+    assert list(front) == [(1, 1.0, 10), (2, 2.0, 20), (3, 3.0, 30)]
+    assert back.series_in_use() == {2, 3}
+
+
+def test_clear_keeps_allocation():
+    buffer = SampleBuffer(4)
+    buffer.extend([1, 2], [1.0, 2.0], [10, 20])
+    buffer.clear()
+    assert len(buffer) == 0 and list(buffer) == [] and buffer.capacity == 4
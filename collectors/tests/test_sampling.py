@@ -0,0 +1,15 @@
+from sampling import SamplingPolicy, TailSampler
+
+
+def sampler(*policies) -> TailSampler:
+    return TailSampler.from_config({'policies': list(policies)}, lambda entry: 0)
+
+
+def test_probabilistic_only_sampling_decides_by_trace_id():
+    assert not sampler({'type': 'probabilistic', 'rate': 0.1}).whole_trace
+
+
+def test_span_policies_need_whole_traces():
+    assert sampler({'type': 'probabilistic', 'rate': 0.1}, {'type': 'error'}).whole_trace
+    assert SamplingPolicy('latency', threshold_ms=100).whole_trace
+    assert SamplingPolicy('service', services=['api-*']).whole_trace
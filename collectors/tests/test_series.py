@@ -0,0 +1,55 @@
+import asyncio
+
+from series import SeriesTable
+
+
+def test_evict_skips_series_in_use():
+    table = SeriesTable(2)
+    ids = [table.intern('temperature', {'sensor': str(i)}) for i in range(4)]
+    assert table.evict({ids[0]}) == 2
+    assert set(table.prefixes) == {ids[0], ids[3]}
+
+
+def test_failed_flush_keeps_series_while_another_flush_evicts():
+    import main
+
+    async def scenario():
+        collector = main.MetricsCollector()
+        collector.spool = None
+        collector.series = SeriesTable(2)
+        release_first = asyncio.Event()
+        posted = []
+
+        async def prepare(path, data, headers=None):
+            if not posted and not release_first.is_set():
+                await release_first.wait()
+            return path, data, headers
+
+        async def post(path, data, headers=None):
+            posted.append(data)
+            if len(posted) == 2:
+                raise ConnectionError("backend down")
+
+        collector.sink.prepare = prepare
+        collector.sink.post = post
+
+        for i in range(3):
+            collector.collect_series('temperature', {'sensor': f"a{i}"}, [(1.0, 1000)], tenant='a')
+        first = asyncio.create_task(collector.flush(100))
+        await asyncio.sleep(0)
+
+        # A second flush delivers and evicts while the first is still compressing
+        for i in range(3):
+            collector.collect_series('temperature', {'sensor': f"b{i}"}, [(2.0, 1000)], tenant='b')
+        release_first.set()
+        await collector.flush(100)
+        await first
+        assert b'sensor="b0"' in posted[0] and b'sensor="a0"' in posted[1]
+
+        # The failed batch was requeued and still encodes
+        await collector.flush(100)
+        return posted
+
+    posted = asyncio.run(scenario())
+    assert len(posted) == 3
+    assert all(f'sensor="a{i}"'.encode() in posted[2] for i in range(3))
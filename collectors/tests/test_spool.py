@@ -0,0 +1,69 @@
+import os
+
+from spool import SegmentSpool
+
+
+def open_spool(directory, **kwargs) -> SegmentSpool:
+    return SegmentSpool(str(directory), 'test', kwargs.pop('max_bytes', 0), **kwargs)
+
+
+def replay(spool: SegmentSpool) -> list:
+    path = spool.next_segment()
+    return [] if path is None else [(r.path, r.headers, r.body) for r in spool.pending_records(path)]
+
+
+def test_records_survive_a_restart_in_order(tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append('/api/v1/import', b'one', {'Content-Encoding': 'gzip'})
+    spool.append('/api/v1/import', b'two')
+    spool.close()
+
+    spool = open_spool(tmp_path)
+    assert spool.total_bytes() > 0
+    assert replay(spool) == [
+        ('/api/v1/import', {'Content-Encoding': 'gzip'}, b'one'),
+        ('/api/v1/import', {}, b'two'),
+    ]
+
+
+def test_acknowledged_records_are_not_replayed_again(tmp_path):
+    spool = open_spool(tmp_path)
+    for body in (b'one', b'two', b'three'):
+        spool.append('/push', body)
+    path = spool.next_segment()
+    first = next(spool.pending_records(path))
+    spool.ack(path, first)
+    spool.close()
+
+    spool = open_spool(tmp_path)
+    path = spool.next_segment()
+    records = list(spool.pending_records(path))
+    assert [r.body for r in records] == [b'two', b'three']
+    for record in records:
+        spool.ack(path, record)
+    assert spool.total_bytes() == 0
+    spool.complete(path)
+    assert spool.next_segment() is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_torn_record_ends_replay_of_its_segment(tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append('/push', b'complete')
+    spool.append('/push', b'torn')
+    spool.close()
+    path = spool.next_segment()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 2)
+
+    assert [body for _, _, body in replay(open_spool(tmp_path))] == [b'complete']
+
+
+def test_oldest_segments_are_dropped_over_the_size_limit(tmp_path):
+    spool = open_spool(tmp_path, max_bytes=300, segment_bytes=100)
+    for i in range(10):
+        spool.append('/push', b'%d' % i * 60)
+    assert spool.total_bytes() <= 300
+    spool.close()
+    bodies = [body for _, _, body in replay(open_spool(tmp_path))]
+    assert bodies and bodies[0] != b'0' * 60
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+from spool import SegmentSpool
+
+
+def spool_at(directory, name: str = 'VictoriaMetrics') -> SegmentSpool:
+    return SegmentSpool(str(directory), name, max_bytes=0)
+
+
+def test_first_worker_replays_and_removes_spools_of_retired_workers(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'SPOOL_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'WORKERS', 2)
+    monkeypatch.delenv('COLLECTOR_WORKER_ID', raising=False)
+    live = spool_at(tmp_path / 'worker-1' / 'metrics')
+    live.append('/api/v1/import/prometheus', b'live')
+    live.close()
+    retired = spool_at(tmp_path / 'worker-3' / 'metrics')
+    for body in (b'one', b'two'):
+        retired.append('/api/v1/import/prometheus', body)
+    retired.close()
+    os.makedirs(tmp_path / 'worker-3' / 'logs')
+
+    own = spool_at(tmp_path / 'metrics')
+    orphans = main.orphaned_spools(own)
+    assert [spool.directory for spool in orphans] == [str(tmp_path / 'worker-3' / 'metrics')]
+
+    collector = main.MetricsCollector()
+    posted = []
+
+    async def post(path, data, headers=None):
+        posted.append(data)
+
+    collector.sink.post = post
+    asyncio.run(asyncio.wait_for(collector.start_replay_loop(orphans[0]), 5))
+    assert posted == [b'one', b'two']
+    assert sorted(os.listdir(tmp_path)) == ['metrics', 'worker-1', 'worker-3']
+    assert os.listdir(tmp_path / 'worker-3') == ['logs']
+
+
+def test_other_workers_adopt_nothing(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'SPOOL_DIR', str(tmp_path))
+    monkeypatch.setenv('COLLECTOR_WORKER_ID', '1')
+    os.makedirs(tmp_path / 'worker-5' / 'metrics')
+    assert main.orphaned_spools(spool_at(tmp_path / 'worker-1' / 'metrics')) == []
@@ -0,0 +1,60 @@
+from tenants import DEFAULT_TENANT, OTHER_TENANT, FairQueue, TenantSettings
+
+
+def split(buffer: list, count: int) -> list:
+    part = buffer[:count]
+    del buffer[:count]
+    return part
+
+
+def fair_queue(config: dict = None, max_bytes: int = 0) -> FairQueue:
+    return FairQueue('test', TenantSettings(config), max_bytes, list, split, lambda front, back: front + back)
+
+
+def fill(queues: FairQueue, tenant: str, count: int):
+    queue = queues.get(tenant)
+    queue.buffer.extend(f"{tenant}-{i}" for i in range(count))
+    queues.add(queue, count, count)
+
+
+def taken(parts: list) -> dict:
+    return {part.tenant: len(part.entries) for part in parts}
+
+
+def test_backlogged_tenants_share_a_batch_by_weight():
+    queues = fair_queue({'weights': {'big': 3}})
+    fill(queues, 'big', 1000)
+    fill(queues, 'small', 1000)
+    assert taken(queues.take(100)) == {'big': 75, 'small': 25}
+
+
+def test_idle_tenant_share_goes_to_others():
+    queues = fair_queue()
+    fill(queues, 'busy', 1000)
+    fill(queues, 'quiet', 10)
+    assert taken(queues.take(100)) == {'busy': 90, 'quiet': 10}
+    assert len(queues.get('quiet').buffer) == 0
+
+
+def test_parts_are_taken_from_the_front_and_requeued_ahead_of_new_entries():
+    queues = fair_queue()
+    fill(queues, 'site', 5)
+    parts = queues.take(3)
+    assert parts[0].entries == ['site-0', 'site-1', 'site-2']
+    assert parts[0].bytes == 3
+    queues.get('site').buffer.append('site-new')
+    queues.requeue(parts)
+    queue = queues.get('site')
+    assert queue.buffer == ['site-0', 'site-1', 'site-2', 'site-3', 'site-4', 'site-new']
+    assert queue.bytes == 5
+
+
+def test_quota_and_tenant_limit():
+    queues = fair_queue({'quota': 0.5, 'max_tenants': 2}, max_bytes=100)
+    fill(queues, 'a', 49)
+    assert queues.admits('a')
+    assert not queues.admits('a', pending=1)
+    assert queues.admits('b', pending=49)
+    fill(queues, 'b', 1)
+    assert queues.resolve('c') == OTHER_TENANT
+    assert queues.resolve('') == DEFAULT_TENANT
@@ -8,8 +8,13 @@ import logging
 from typing import Dict, Any, Optional
 import yaml
 import requests
+import aiohttp
 from datetime import datetime
 
+from modbus import ModbusConnectionPool, plan_reads
+from opcua_session import NodeEntry, OPCUASession
+from transport import CollectorsClient
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +26,26 @@ logger = logging.getLogger(__name__)
 COLLECTORS_URL = os.getenv('COLLECTORS_URL', 'http://collectors:8081')
 CONFIG_PATH = os.getenv('CONFIG_PATH', '/app/config/connectors.yml')
 
+# Batched transport to the collectors
+COLLECTORS_BATCH_SIZE = int(os.getenv('COLLECTORS_BATCH_SIZE', '500'))
+COLLECTORS_FLUSH_INTERVAL = float(os.getenv('COLLECTORS_FLUSH_INTERVAL', '1.0'))
+COLLECTORS_QUEUE_SIZE = int(os.getenv('COLLECTORS_QUEUE_SIZE', '100000'))
+COLLECTORS_MAX_RETRIES = int(os.getenv('COLLECTORS_MAX_RETRIES', '5'))
+COLLECTORS_TIMEOUT = float(os.getenv('COLLECTORS_TIMEOUT', '10'))
+
+# Shared by all connectors
+collectors_client = CollectorsClient(
+    COLLECTORS_URL,
+    batch_size=COLLECTORS_BATCH_SIZE,
+    flush_interval=COLLECTORS_FLUSH_INTERVAL,
+    max_queue=COLLECTORS_QUEUE_SIZE,
+    max_retries=COLLECTORS_MAX_RETRIES,
+    timeout=COLLECTORS_TIMEOUT
+)
+
+# Modbus gateways (connection and request slots) shared by all Modbus devices, per host and port
+modbus_pool = ModbusConnectionPool()
+
 
 class BaseConnector:
     """Base class for protocol connectors"""
@@ -51,39 +76,21 @@ class BaseConnector:
         raise NotImplementedError
     
     async def send_metric(self, name: str, value: float, labels: Dict[str, str] = None):
-        """Send metric to collectors"""
-        try:
-            metric = {
-                'name': name,
-                'value': value,
-                'labels': labels or {},
-                'timestamp': int(datetime.utcnow().timestamp() * 1000)
-            }
-            response = requests.post(
-                f"{COLLECTORS_URL}/collect/metrics",
-                json=metric,
-                timeout=5
-            )
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f"Error sending metric: {e}")
+        """Queue a metric for the next batch to the collectors"""
+        collectors_client.send_metric({
+            'name': name,
+            'value': value,
+            'labels': labels or {},
+            'timestamp': int(datetime.utcnow().timestamp() * 1000)
+        })
     
     async def send_log(self, message: str, labels: Dict[str, str] = None):
-        """Send log to collectors"""
-        try:
-            log = {
-                'message': message,
-                'labels': labels or {},
-                'timestamp': int(datetime.utcnow().timestamp() * 1e9)
-            }
-            response = requests.post(
-                f"{COLLECTORS_URL}/collect/logs",
-                json=log,
-                timeout=5
-            )
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f"Error sending log: {e}")
+        """Queue a log entry for the next batch to the collectors"""
+        collectors_client.send_log({
+            'message': message,
+            'labels': labels or {},
+            'timestamp': int(datetime.utcnow().timestamp() * 1e9)
+        })
 
 
 class HomeAssistantConnector(BaseConnector):
@@ -97,9 +104,21 @@ class HomeAssistantConnector(BaseConnector):
             'Authorization': f'Bearer {self.token}',
             'Content-Type': 'application/json'
         }
+        # 'poll' downloads /api/states every poll_interval; 'websocket' follows state_changed events
+        self.mode = config.get('mode', 'poll')
+        self.reconnect_max = config.get('reconnect_max', 60)
+        # The get_states snapshot is a single message; 0 lifts aiohttp's 4 MiB default limit
+        self.max_message_size = config.get('max_message_size', 0)
+        # Last known state per entity in websocket mode
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.stream = None
     
     async def collect(self):
         """Collect data from Home Assistant"""
+        if self.mode == 'websocket':
+            await self.collect_stream()
+            return
+        
         try:
             # Get all states
             response = requests.get(
@@ -114,35 +133,132 @@ class HomeAssistantConnector(BaseConnector):
             
             # Process each entity
             for entity in states:
-                entity_id = entity.get('entity_id', '')
-                state = entity.get('state', '')
-                attributes = entity.get('attributes', {})
-                
-                # Extract numeric values and send as metrics
-                if self._is_numeric(state):
-                    await self.send_metric(
-                        'homeassistant_entity_state',
-                        float(state),
-                        {
-                            'entity_id': entity_id,
-                            'domain': entity_id.split('.')[0],
-                            'friendly_name': attributes.get('friendly_name', entity_id)
-                        }
-                    )
-                
-                # Send log entry for state changes
-                await self.send_log(
-                    f"Entity {entity_id} state: {state}",
-                    {
-                        'connector': 'homeassistant',
-                        'entity_id': entity_id,
-                        'level': 'info'
-                    }
-                )
+                await self.publish_state(entity)
         
         except Exception as e:
             logger.error(f"Error collecting from Home Assistant: {e}")
     
+    async def publish_state(self, entity: Dict[str, Any], log: bool = True):
+        """Send an entity's state as a metric (if numeric) and, unless ``log`` is False, a log entry"""
+        entity_id = entity.get('entity_id', '')
+        state = entity.get('state', '')
+        attributes = entity.get('attributes', {})
+        
+        # Extract numeric values and send as metrics
+        if self._is_numeric(state):
+            await self.send_metric(
+                'homeassistant_entity_state',
+                float(state),
+                {
+                    'entity_id': entity_id,
+                    'domain': entity_id.split('.')[0],
+                    'friendly_name': attributes.get('friendly_name', entity_id)
+                }
+            )
+        
+        # Send log entry for state changes
+        if log:
+            await self.send_log(
+                f"Entity {entity_id} state: {state}",
+                {
+                    'connector': 'homeassistant',
+                    'entity_id': entity_id,
+                    'level': 'info'
+                }
+            )
+    
+    async def collect_stream(self):
+        """Keep the event stream running and re-send cached numeric states so their series stay fresh"""
+        if self.stream is None or self.stream.done():
+            self.stream = asyncio.create_task(self._follow_events())
+            return
+        for entity in list(self.states.values()):
+            await self.publish_state(entity, log=False)
+    
+    async def _follow_events(self):
+        """Follow state_changed events, reconnecting with backoff and resyncing after every gap"""
+        url = self.base_url.replace('http://', 'ws://', 1).replace('https://', 'wss://', 1) + '/api/websocket'
+        delay = 1
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(url, heartbeat=30, max_msg_size=self.max_message_size) as ws:
+                        await self._authenticate(ws)
+                        delay = 1
+                        await self._stream_events(ws)
+                logger.warning("Home Assistant closed the WebSocket connection")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Home Assistant event stream error: {e}")
+            logger.info(f"Reconnecting to Home Assistant in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(self.reconnect_max, delay * 2)
+    
+    async def _authenticate(self, ws):
+        message = await ws.receive_json()
+        if message.get('type') == 'auth_required':
+            await ws.send_json({'type': 'auth', 'access_token': self.token})
+            message = await ws.receive_json()
+        if message.get('type') != 'auth_ok':
+            raise PermissionError(f"Home Assistant authentication failed: {message.get('message', message)}")
+    
+    async def _stream_events(self, ws):
+        # Subscribe before taking the snapshot, so no change falls between the two
+        await ws.send_json({'id': 1, 'type': 'subscribe_events', 'event_type': 'state_changed'})
+        await ws.send_json({'id': 2, 'type': 'get_states'})
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.ERROR:
+                raise ConnectionError(f"WebSocket error: {ws.exception()}")
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            message = msg.json()
+            if message.get('type') == 'event':
+                await self._on_state_changed(message['event'].get('data', {}))
+            elif message.get('type') == 'result':
+                if not message.get('success'):
+                    raise RuntimeError(f"Home Assistant request {message.get('id')} failed: {message.get('error')}")
+                if message.get('id') == 2:
+                    await self._resync(message.get('result') or [])
+    
+    async def _resync(self, states: list):
+        """Apply a full snapshot: metrics for every entity, logs only for states that changed while away"""
+        changed = 0
+        current = {}
+        for entity in states:
+            entity_id = entity.get('entity_id', '')
+            known = self.states.get(entity_id)
+            # An event received while the snapshot was in flight may be newer
+            if known is not None and known.get('last_updated', '') > entity.get('last_updated', ''):
+                entity = known
+            current[entity_id] = entity
+            is_change = known is None or known.get('state') != entity.get('state')
+            changed += is_change
+            await self.publish_state(entity, log=is_change)
+        self.states = current
+        logger.info(f"Synchronized {len(states)} entities from Home Assistant, {changed} changed")
+    
+    async def _on_state_changed(self, data: Dict[str, Any]):
+        entity_id = data.get('entity_id', '')
+        new_state = data.get('new_state')
+        if new_state is None:
+            self.states.pop(entity_id, None)
+            await self.send_log(
+                f"Entity {entity_id} removed",
+                {
+                    'connector': 'homeassistant',
+                    'entity_id': entity_id,
+                    'level': 'info'
+                }
+            )
+            return
+        known = self.states.get(entity_id)
+        self.states[entity_id] = new_state
+        # Attribute-only updates also fire state_changed; only real transitions are forwarded
+        if known is not None and known.get('state') == new_state.get('state'):
+            return
+        await self.publish_state(new_state)
+    
     @staticmethod
     def _is_numeric(value: str) -> bool:
         """Check if a value is numeric"""
@@ -160,63 +276,104 @@ class ModbusConnector(BaseConnector):
         super().__init__("Modbus", config)
         self.host = config.get('host', 'localhost')
         self.port = config.get('port', 502)
+        self.device = config.get('name', f"{self.host}:{self.port}")
         self.unit_id = config.get('unit_id', 1)
+        self.timeout = config.get('timeout', 3)
         self.registers = config.get('registers', [])
+        # The same register map can be polled on several units behind one gateway
+        unit_ids = config.get('unit_ids') or [self.unit_id]
+        # Adjacent registers are read together; planned once since the config is static
+        self.reads = [
+            read
+            for unit_id in unit_ids
+            for read in plan_reads(self.registers, unit_id, config.get('max_gap', 8), config.get('max_read'))
+        ]
+        self.gateway = modbus_pool.gateway(
+            self.host, self.port, config.get('framer', 'socket'), config.get('max_concurrent', 1)
+        )
+        # Cumulative per-unit counters, reported after every poll
+        self.unit_stats = {
+            read.unit_id: {'reads': 0, 'errors': {'timeout': 0, 'connection': 0, 'exception': 0}}
+            for read in self.reads
+        }
+        logger.info(
+            f"Modbus {self.host}:{self.port}: {len(self.registers)} register entries on {len(unit_ids)} unit(s) "
+            f"in {len(self.reads)} read(s)"
+        )
+    
+    async def _read(self, read):
+        """Run one planned read, returning (data, latency); data is None if the read failed"""
+        stats = self.unit_stats[read.unit_id]
+        stats['reads'] += 1
+        try:
+            data, latency = await self.gateway.read(read, self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout reading {read} from {self.host}:{self.port}")
+            stats['errors']['timeout'] += 1
+            if self.gateway.framer == 'rtu':
+                # RTU frames carry no transaction ID, so a late reply would be taken for the next request's
+                self.gateway.reset()
+            return None, None
+        except Exception as e:
+            logger.error(f"Error reading {read} from {self.host}:{self.port}: {e}")
+            stats['errors']['connection'] += 1
+            self.gateway.reset()
+            return None, None
+        if data is None:
+            logger.warning(f"Modbus exception response reading {read} from {self.host}:{self.port}")
+            stats['errors']['exception'] += 1
+        return data, latency
     
     async def collect(self):
         """Collect data from Modbus devices"""
         try:
-            from pymodbus.client import ModbusTcpClient
-            
-            client = ModbusTcpClient(self.host, port=self.port)
-            if not client.connect():
-                logger.error(f"Failed to connect to Modbus device at {self.host}:{self.port}")
-                return
-            
-            logger.info(f"Connected to Modbus device at {self.host}:{self.port}")
+            # Reads wait for a free slot on the gateway, so serial gateways still see one request at a time
+            results = await asyncio.gather(*(self._read(read) for read in self.reads))
             
-            # Read configured registers
-            for register in self.registers:
-                address = register.get('address', 0)
-                count = register.get('count', 1)
-                name = register.get('name', f'register_{address}')
-                reg_type = register.get('type', 'holding')
-                
-                # Read register based on type
-                if reg_type == 'holding':
-                    result = client.read_holding_registers(address, count, unit=self.unit_id)
-                elif reg_type == 'input':
-                    result = client.read_input_registers(address, count, unit=self.unit_id)
-                elif reg_type == 'coil':
-                    result = client.read_coils(address, count, unit=self.unit_id)
-                else:
+            latencies = {}
+            for read, (data, latency) in zip(self.reads, results):
+                latencies.setdefault(read.unit_id, []).append((latency, data is not None))
+                if data is None:
                     continue
                 
-                if not result.isError():
-                    if hasattr(result, 'registers'):
-                        values = result.registers
-                    elif hasattr(result, 'bits'):
-                        values = result.bits
-                    else:
-                        continue
-                    
-                    # Send metrics
-                    for i, value in enumerate(values[:count]):
+                for register in read.entries:
+                    address = register['address']
+                    name = register.get('name', f'register_{address}')
+                    scale = register.get('scale', 1)
+                    offset = register.get('offset', 0)
+                    for i, value in enumerate(read.values(data, register)):
                         await self.send_metric(
                             f'modbus_{name}',
-                            float(value),
+                            float(value) * scale + offset,
                             {
                                 'host': self.host,
                                 'port': str(self.port),
+                                'unit_id': str(register['unit_id']),
                                 'address': str(address + i),
-                                'type': reg_type
+                                'type': register['type']
                             }
                         )
             
-            client.close()
-            
+            await self.send_device_metrics(latencies)
+        
         except Exception as e:
             logger.error(f"Error collecting from Modbus: {e}")
+    
+    async def send_device_metrics(self, latencies: Dict[int, list]):
+        """Report per-unit health, device response time and cumulative error counts for the last poll"""
+        for unit_id, samples in latencies.items():
+            labels = {'device': self.device, 'host': self.host, 'port': str(self.port), 'unit_id': str(unit_id)}
+            succeeded = [latency for latency, ok in samples if ok]
+            stats = self.unit_stats[unit_id]
+            await self.send_metric('modbus_device_up', 1 if succeeded else 0, labels)
+            if succeeded:
+                await self.send_metric(
+                    'modbus_device_read_latency_avg_seconds', sum(succeeded) / len(succeeded), labels
+                )
+                await self.send_metric('modbus_device_read_latency_max_seconds', max(succeeded), labels)
+            await self.send_metric('modbus_device_reads_total', stats['reads'], labels)
+            for reason, count in stats['errors'].items():
+                await self.send_metric('modbus_device_read_errors_total', count, {**labels, 'reason': reason})
 
 
 class ZigbeeConnector(BaseConnector):
@@ -282,51 +439,105 @@ class OPCUAConnector(BaseConnector):
         super().__init__("OPC-UA", config)
         self.endpoint = config.get('endpoint', 'opc.tcp://localhost:4840')
         self.nodes = config.get('nodes', [])
+        # 'poll' reads all nodes every poll_interval; 'subscribe' lets the server push changes
+        self.mode = config.get('mode', 'poll')
+        self.publishing_interval = config.get('publishing_interval', 1000)
+        self.sampling_interval = config.get('sampling_interval')
+        self.queue_size = config.get('queue_size', 0)
+        self.log_values = config.get('log_values', True)
+        self.session = None
+        self.changes = None
+        self.forwarder = None
+    
+    def _session(self) -> OPCUASession:
+        if self.session is None:
+            self.session = OPCUASession(
+                self.endpoint,
+                [NodeEntry(node_config) for node_config in self.nodes],
+                timeout=self.config.get('timeout', 4),
+                username=self.config.get('username'),
+                password=self.config.get('password'),
+                batch_size=self.config.get('read_batch_size', 500)
+            )
+        return self.session
+    
+    async def publish(self, entry: NodeEntry, value: Any):
+        """Send one node value as a metric (if numeric) and a log entry"""
+        if isinstance(value, (int, float)):
+            await self.send_metric(
+                f'opcua_{entry.name}',
+                float(value),
+                {
+                    'endpoint': self.endpoint,
+                    'node_id': entry.id
+                }
+            )
+        
+        if self.log_values:
+            await self.send_log(
+                f"OPC-UA node {entry.name} value: {value}",
+                {
+                    'connector': 'opcua',
+                    'node_id': entry.id,
+                    'level': 'info'
+                }
+            )
     
     async def collect(self):
         """Collect data from OPC-UA servers"""
         try:
-            from opcua import Client
-            
-            client = Client(self.endpoint)
-            client.connect()
-            logger.info(f"Connected to OPC-UA server at {self.endpoint}")
+            session = self._session()
+            if self.mode == 'subscribe':
+                await self.ensure_subscribed(session)
+                return
             
-            # Read configured nodes
-            for node_config in self.nodes:
-                node_id = node_config.get('id', '')
-                name = node_config.get('name', node_id)
-                
-                try:
-                    node = client.get_node(node_id)
-                    value = node.get_value()
-                    
-                    if isinstance(value, (int, float)):
-                        await self.send_metric(
-                            f'opcua_{name}',
-                            float(value),
-                            {
-                                'endpoint': self.endpoint,
-                                'node_id': node_id
-                            }
-                        )
-                    
-                    await self.send_log(
-                        f"OPC-UA node {name} value: {value}",
-                        {
-                            'connector': 'opcua',
-                            'node_id': node_id,
-                            'level': 'info'
-                        }
-                    )
-                
-                except Exception as e:
-                    logger.error(f"Error reading OPC-UA node {node_id}: {e}")
+            if not session.healthy:
+                await asyncio.to_thread(session.connect)
             
-            client.disconnect()
+            # All configured nodes in one Read request per batch, over the session kept from earlier polls
+            for entry, data_value in await asyncio.to_thread(session.read):
+                if not data_value.StatusCode.is_good():
+                    logger.error(f"Error reading OPC-UA node {entry.id}: {data_value.StatusCode.name}")
+                    continue
+                await self.publish(entry, data_value.Value.Value)
         
         except Exception as e:
             logger.error(f"Error with OPC-UA connector: {e}")
+            if self.session is not None:
+                await asyncio.to_thread(self.session.close)
+    
+    async def ensure_subscribed(self, session: OPCUASession):
+        """Check the session and, if it was lost, reconnect and subscribe again"""
+        if self.forwarder is None:
+            self.changes = asyncio.Queue()
+            self.forwarder = asyncio.create_task(self._forward_changes())
+        if await asyncio.to_thread(session.check):
+            return
+        
+        loop = asyncio.get_running_loop()
+        
+        def on_change(entry, data_value):
+            # Called on the opcua subscription thread
+            loop.call_soon_threadsafe(self.changes.put_nowait, (entry, data_value))
+        
+        await asyncio.to_thread(session.connect)
+        # The server reports every item's current value first, so nothing is missed across reconnects
+        created = await asyncio.to_thread(
+            session.subscribe, on_change, self.publishing_interval, self.sampling_interval, self.queue_size
+        )
+        logger.info(
+            f"Subscribed to {created} of {len(session.entries)} OPC-UA nodes on {self.endpoint} "
+            f"(publishing every {self.publishing_interval} ms)"
+        )
+    
+    async def _forward_changes(self):
+        while True:
+            entry, data_value = await self.changes.get()
+            try:
+                if data_value.StatusCode.is_good():
+                    await self.publish(entry, data_value.Value.Value)
+            except Exception as e:
+                logger.error(f"Error forwarding OPC-UA change of {entry.id}: {e}")
 
 
 async def load_config() -> Dict[str, Any]:
@@ -378,8 +589,16 @@ async def main():
             await asyncio.sleep(60)
     
     # Start all connectors
-    tasks = [connector.start() for connector in connectors]
-    await asyncio.gather(*tasks)
+    collectors_client.start()
+    try:
+        tasks = [connector.start() for connector in connectors]
+        await asyncio.gather(*tasks)
+    finally:
+        await collectors_client.close()
+        modbus_pool.close()
+        for connector in connectors:
+            if isinstance(connector, OPCUAConnector) and connector.session is not None:
+                connector.session.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+"""Modbus read planning and connection pooling for Sentio IoT Connectors
+
+Configured registers are merged into as few reads as the protocol allows:
+entries of the same unit and type whose addresses are adjacent, or separated
+by at most ``max_gap`` unused addresses, share one request of up to 125
+registers or 2000 coils. Connections are kept open per host and port and
+shared by every device and unit ID behind them.
+
+Reads are asynchronous, so many gateways are polled at once. Each gateway
+limits how many requests are outstanding on it, every request has a
+timeout, and a gateway that cannot be reached is retried with backoff
+instead of on every read.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Largest quantity one request may ask for (Modbus application protocol v1.1b3)
+MAX_READ = {
+    'holding': 125,
+    'input': 125,
+    'coil': 2000,
+    'discrete': 2000,
+}
+
+_READ_METHODS = {
+    'holding': 'read_holding_registers',
+    'input': 'read_input_registers',
+    'coil': 'read_coils',
+    'discrete': 'read_discrete_inputs',
+}
+
+
+class ReadRequest:
+    """One Modbus read covering one or more configured register entries"""
+
+    __slots__ = ('unit_id', 'type', 'address', 'count', 'entries')
+
+    def __init__(self, unit_id: int, reg_type: str, address: int, count: int):
+        self.unit_id = unit_id
+        self.type = reg_type
+        self.address = address
+        self.count = count
+        self.entries: List[Dict[str, Any]] = []
+
+    @property
+    def end(self) -> int:
+        return self.address + self.count
+
+    def values(self, data: list, entry: Dict[str, Any]) -> list:
+        """Slice the values of one configured entry out of this read's result"""
+        start = entry['address'] - self.address
+        return data[start:start + entry['count']]
+
+    def __repr__(self) -> str:
+        return f"ReadRequest(unit={self.unit_id}, {self.type}, {self.address}+{self.count})"
+
+
+def plan_reads(registers: List[Dict[str, Any]], unit_id: int = 1, max_gap: int = 8,
+               max_read: Dict[str, int] = None) -> List[ReadRequest]:
+    """Merge register entries into the fewest reads within the protocol limits.
+
+    Entries are normalised (address, count, type and unit_id filled in) and
+    attached to the read that covers them. Unknown types are skipped.
+    """
+    limits = {**MAX_READ, **(max_read or {})}
+    groups: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+    for register in registers:
+        reg_type = register.get('type', 'holding')
+        if reg_type not in limits:
+            logger.warning(f"Skipping Modbus register {register.get('name')} with unknown type '{reg_type}'")
+            continue
+        entry = {
+            **register,
+            'type': reg_type,
+            'address': int(register.get('address', 0)),
+            'count': max(1, int(register.get('count', 1))),
+            'unit_id': int(register.get('unit_id', unit_id)),
+        }
+        if entry['count'] > limits[reg_type]:
+            logger.warning(f"Modbus register {register.get('name')} count {entry['count']} exceeds the "
+                           f"{reg_type} read limit of {limits[reg_type]}")
+            entry['count'] = limits[reg_type]
+        groups.setdefault((entry['unit_id'], reg_type), []).append(entry)
+
+    reads = []
+    for (unit, reg_type), entries in sorted(groups.items()):
+        limit = limits[reg_type]
+        current = None
+        for entry in sorted(entries, key=lambda e: (e['address'], -e['count'])):
+            entry_end = entry['address'] + entry['count']
+            if (current is not None and entry['address'] - current.end <= max_gap
+                    and max(current.end, entry_end) - current.address <= limit):
+                current.count = max(current.end, entry_end) - current.address
+            else:
+                current = ReadRequest(unit, reg_type, entry['address'], entry['count'])
+                reads.append(current)
+            current.entries.append(entry)
+    return reads
+
+
+class ModbusGateway:
+    """One Modbus TCP endpoint: a shared connection and a limited number of request slots.
+
+    Serial (RTU) gateways answer one request at a time, so ``max_concurrent``
+    defaults to 1; native Modbus TCP devices can pipeline several requests.
+    """
+
+    def __init__(self, host: str, port: int, framer: str = 'socket', max_concurrent: int = 1):
+        self.host = host
+        self.port = port
+        self.framer = framer
+        self.max_concurrent = max(1, max_concurrent)
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        self.client = None
+        self.connecting = asyncio.Lock()
+        self.retry_at = 0.0
+        self.backoff = 0.0
+
+    def limit(self, max_concurrent: int):
+        """Lower the concurrency limit (the smallest configured value wins); call before polling"""
+        if max_concurrent < self.max_concurrent:
+            self.max_concurrent = max(1, max_concurrent)
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+
+    async def _connected(self, timeout: float):
+        if self.client is not None and self.client.connected:
+            return self.client
+        async with self.connecting:
+            if self.client is not None and self.client.connected:
+                return self.client
+            return await self._connect(timeout)
+
+    async def _connect(self, timeout: float):
+        now = time.monotonic()
+        if now < self.retry_at:
+            raise ConnectionError(f"{self.host}:{self.port} unreachable, retrying in {self.retry_at - now:.0f}s")
+        from pymodbus.client import AsyncModbusTcpClient
+        from pymodbus.framer import ModbusRtuFramer, ModbusSocketFramer
+
+        if self.client is not None:
+            self.client.close()
+        # Reconnection is handled here, so pymodbus' own retries and reconnects are off
+        self.client = AsyncModbusTcpClient(
+            self.host, port=self.port, framer=ModbusRtuFramer if self.framer == 'rtu' else ModbusSocketFramer,
+            timeout=timeout, retries=0, reconnect_delay=0
+        )
+        try:
+            connected = await asyncio.wait_for(self.client.connect(), timeout)
+        except asyncio.TimeoutError:
+            connected = False
+        if not connected:
+            self.backoff = min(60.0, max(1.0, self.backoff * 2))
+            self.retry_at = time.monotonic() + self.backoff
+            raise ConnectionError(f"failed to connect to Modbus device at {self.host}:{self.port}")
+        self.backoff = 0.0
+        logger.info(f"Connected to Modbus device at {self.host}:{self.port}")
+        return self.client
+
+    async def read(self, read: ReadRequest, timeout: float) -> tuple:
+        """Issue a planned read, returning (values, seconds); values are None on a Modbus exception response.
+
+        The time excludes waiting for a free slot, so it is the device's response time.
+        """
+        async with self.slots:
+            client = await self._connected(timeout)
+            started = time.monotonic()
+            result = await asyncio.wait_for(
+                getattr(client, _READ_METHODS[read.type])(read.address, read.count, slave=read.unit_id), timeout
+            )
+            elapsed = time.monotonic() - started
+        if result.isError():
+            return None, elapsed
+        if read.type in ('coil', 'discrete'):
+            return result.bits[:read.count], elapsed
+        return result.registers, elapsed
+
+    def reset(self):
+        """Drop the connection after a timeout or I/O error so a late reply cannot be mistaken for another"""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class ModbusConnectionPool:
+    """Gateways keyed by (host, port), shared by every device and unit ID behind them"""
+
+    def __init__(self):
+        self.gateways = {}
+
+    def gateway(self, host: str, port: int, framer: str = 'socket', max_concurrent: int = 1) -> ModbusGateway:
+        gateway = self.gateways.get((host, port))
+        if gateway is None:
+            gateway = self.gateways[(host, port)] = ModbusGateway(host, port, framer, max_concurrent)
+        else:
+            gateway.limit(max_concurrent)
+        return gateway
+
+    def close(self):
+        for gateway in self.gateways.values():
+            gateway.reset()
@@ -0,0 +1,118 @@
+"""Local Modbus TCP simulator for testing the Modbus connector
+
+Serves holding and input registers, coils and discrete inputs for a set of
+unit IDs, with values that change every update interval, so the connector
+can be run against it without hardware:
+
+    python modbus_simulator.py --port 5020 --units 1-8 --latency-ms 20
+
+``--latency-ms`` delays every request inside the server's event loop, so
+requests are answered one after another like a serial (RTU) gateway does.
+Requests to a unit ID that is not simulated get no answer and time out.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.server import ModbusTcpServer
+
+logger = logging.getLogger(__name__)
+
+
+class SlowDataBlock(ModbusSequentialDataBlock):
+    """Data block that takes ``latency`` seconds to answer, blocking the server like a serial line"""
+
+    def __init__(self, address: int, values: list, latency: float = 0):
+        super().__init__(address, values)
+        self.latency = latency
+
+    def getValues(self, address, count=1):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().getValues(address, count)
+
+
+def parse_units(spec: str) -> list:
+    """Unit IDs from a spec like ``1,2,5-8``"""
+    units = []
+    for part in spec.split(','):
+        first, _, last = part.strip().partition('-')
+        units.extend(range(int(first), int(last or first) + 1))
+    return units
+
+
+def register_value(unit_id: int, address: int, tick: int) -> int:
+    return (unit_id * 1000 + address + tick) % 65536
+
+
+class ModbusSimulator:
+    """Simulated units behind one Modbus TCP endpoint"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 5020, units: list = (1,), size: int = 1000,
+                 latency: float = 0, update_interval: float = 1.0):
+        self.address = (host, port)
+        self.size = size
+        self.update_interval = update_interval
+        self.tick = 0
+        self.units = {unit_id: self._unit(unit_id, latency) for unit_id in units}
+
+    def _unit(self, unit_id: int, latency: float) -> ModbusSlaveContext:
+        registers = [register_value(unit_id, address, 0) for address in range(self.size)]
+        bits = [address % 2 == 0 for address in range(self.size)]
+        # zero_mode keeps protocol addresses equal to data block addresses
+        return ModbusSlaveContext(
+            hr=SlowDataBlock(0, registers, latency), ir=SlowDataBlock(0, list(registers), latency),
+            co=SlowDataBlock(0, bits, latency), di=SlowDataBlock(0, list(bits), latency), zero_mode=True
+        )
+
+    def update(self):
+        """Advance every register by one and flip every coil"""
+        self.tick += 1
+        for unit_id, context in self.units.items():
+            registers = [register_value(unit_id, address, self.tick) for address in range(self.size)]
+            bits = [(address + self.tick) % 2 == 0 for address in range(self.size)]
+            context.setValues(3, 0, registers)
+            context.setValues(4, 0, registers)
+            context.setValues(1, 0, bits)
+            context.setValues(2, 0, bits)
+
+    async def _update_loop(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            self.update()
+
+    async def serve(self):
+        """Serve until cancelled"""
+        server = ModbusTcpServer(ModbusServerContext(slaves=self.units, single=False), address=self.address)
+        updates = asyncio.create_task(self._update_loop())
+        logger.info(f"Simulating Modbus units {sorted(self.units)} on {self.address[0]}:{self.address[1]}")
+        try:
+            await server.serve_forever()
+        finally:
+            updates.cancel()
+            await server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=5020, help="port to listen on")
+    parser.add_argument('--units', default='1', help="unit IDs to simulate, e.g. 1,2,5-8")
+    parser.add_argument('--size', type=int, default=1000, help="addresses per table and unit")
+    parser.add_argument('--latency-ms', type=float, default=0, help="delay per request")
+    parser.add_argument('--update-interval', type=float, default=1.0, help="seconds between value changes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    simulator = ModbusSimulator(args.host, args.port, parse_units(args.units), args.size,
+                                args.latency_ms / 1000, args.update_interval)
+    try:
+        asyncio.run(simulator.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
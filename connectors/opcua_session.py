@@ -0,0 +1,142 @@
+"""OPC-UA sessions for Sentio IoT Connectors
+
+One session is kept open per server instead of connecting on every poll.
+Polling reads the Value attribute of many nodes per Read request, and
+subscription mode creates monitored items in bulk so the server pushes data
+changes at the configured sampling and publishing intervals.
+
+The ``opcua`` client is synchronous and runs its own threads; connectors call
+these methods through ``asyncio.to_thread`` and receive data changes through
+a callback from the subscription thread.
+"""
+import logging
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class NodeEntry:
+    """A configured node with its parsed node ID"""
+
+    __slots__ = ('id', 'name', 'config', 'node_id')
+
+    def __init__(self, config: Dict[str, Any]):
+        from opcua import ua
+
+        self.id = config.get('id', '')
+        self.name = config.get('name', self.id)
+        self.config = config
+        self.node_id = ua.NodeId.from_string(self.id)
+
+
+class _DataChangeHandler:
+    """Subscription handler forwarding value changes of known nodes to a callback"""
+
+    def __init__(self, session: 'OPCUASession', callback: Callable):
+        self.session = session
+        self.callback = callback
+
+    def datachange_notification(self, node, val, data):
+        entry = self.session.entries.get(node.nodeid)
+        if entry is not None:
+            self.callback(entry, data.monitored_item.Value)
+
+    def status_change_notification(self, status):
+        # A bad status means the subscription is gone (session lost or timed out)
+        logger.warning(f"OPC-UA subscription on {self.session.endpoint} changed status: {status}")
+        self.session.healthy = False
+
+
+class OPCUASession:
+    """A long-lived client session to one OPC-UA server"""
+
+    def __init__(self, endpoint: str, entries: List[NodeEntry], timeout: float = 4,
+                 username: str = None, password: str = None, batch_size: int = 500):
+        self.endpoint = endpoint
+        self.entries = {entry.node_id: entry for entry in entries}
+        self.timeout = timeout
+        self.username = username
+        self.password = password
+        # Servers cap nodes per service call (MaxNodesPerRead and similar); stay below common limits
+        self.batch_size = max(1, batch_size)
+        self.client = None
+        self.subscription = None
+        self.healthy = False
+
+    def connect(self):
+        from opcua import Client
+
+        self.close()
+        client = Client(self.endpoint, timeout=self.timeout)
+        if self.username:
+            client.set_user(self.username)
+            client.set_password(self.password or '')
+        client.connect()
+        self.client = client
+        self.healthy = True
+        logger.info(f"Connected to OPC-UA server at {self.endpoint}")
+
+    def _batches(self) -> list:
+        entries = list(self.entries.values())
+        return [entries[i:i + self.batch_size] for i in range(0, len(entries), self.batch_size)]
+
+    def read(self) -> list:
+        """Read every node's value in as few requests as the batch size allows, as (entry, DataValue)"""
+        from opcua import ua
+
+        results = []
+        for batch in self._batches():
+            values = self.client.uaclient.get_attributes([entry.node_id for entry in batch], ua.AttributeIds.Value)
+            results.extend(zip(batch, values))
+        return results
+
+    def subscribe(self, callback: Callable, publishing_interval: float, sampling_interval: float = None,
+                  queue_size: int = 0) -> int:
+        """Create one subscription monitoring every node; returns how many monitored items were created.
+
+        ``callback(entry, DataValue)`` runs on the client's subscription thread.
+        """
+        from opcua import ua
+
+        self.subscription = self.client.create_subscription(publishing_interval, _DataChangeHandler(self, callback))
+        created = 0
+        for batch in self._batches():
+            requests = []
+            for entry in batch:
+                request = self.subscription._make_monitored_item_request(
+                    self.client.get_node(entry.node_id), ua.AttributeIds.Value, None, queue_size
+                )
+                if sampling_interval is not None:
+                    request.RequestedParameters.SamplingInterval = sampling_interval
+                requests.append(request)
+            for entry, result in zip(batch, self.subscription.create_monitored_items(requests)):
+                if isinstance(result, ua.StatusCode):
+                    logger.error(f"Cannot monitor OPC-UA node {entry.id} on {self.endpoint}: {result.name}")
+                else:
+                    created += 1
+        return created
+
+    def check(self) -> bool:
+        """Whether the session still answers, reading the server state"""
+        from opcua import ua
+
+        if self.client is None or not self.healthy:
+            return False
+        try:
+            self.client.get_node(ua.ObjectIds.Server_ServerStatus_State).get_value()
+            return True
+        except Exception as e:
+            logger.warning(f"OPC-UA server at {self.endpoint} stopped answering: {e}")
+            self.healthy = False
+            return False
+
+    def close(self):
+        client, self.client = self.client, None
+        self.subscription = None
+        self.healthy = False
+        if client is None:
+            return
+        try:
+            client.disconnect()
+        except Exception as e:
+            logger.debug(f"Error disconnecting from OPC-UA server at {self.endpoint}: {e}")
@@ -0,0 +1,73 @@
+"""Local OPC-UA simulator for testing the OPC-UA connector
+
+Runs the ``opcua`` library's server with a number of numeric tags whose
+values change every update interval, so polling and subscription mode can be
+tried without a real server:
+
+    python opcua_simulator.py --port 4840 --tags 5000
+
+Tags are named ``Tag0`` .. ``TagN`` with node IDs ``ns=2;s=Tag0`` and so on
+(the namespace index is printed at startup).
+"""
+import argparse
+import logging
+import math
+import time
+
+from opcua import Server
+
+logger = logging.getLogger(__name__)
+
+
+class OPCUASimulator:
+    """Numeric tags served from one OPC-UA endpoint"""
+
+    def __init__(self, endpoint: str = 'opc.tcp://127.0.0.1:4840', tags: int = 100):
+        self.server = Server()
+        self.server.set_endpoint(endpoint)
+        self.server.set_server_name("Sentio OPC-UA simulator")
+        self.namespace = self.server.register_namespace('urn:sentio:simulator')
+        folder = self.server.get_objects_node().add_folder(f"ns={self.namespace};s=Simulator", "Simulator")
+        self.tags = [
+            folder.add_variable(f"ns={self.namespace};s=Tag{i}", f"Tag{i}", 0.0) for i in range(tags)
+        ]
+        self.tick = 0
+
+    def update(self):
+        """Move every tag along its own sine wave"""
+        self.tick += 1
+        for i, tag in enumerate(self.tags):
+            tag.set_value(round(100 * math.sin((self.tick + i) / 10), 3))
+
+    def start(self):
+        self.server.start()
+        logger.info(f"Simulating {len(self.tags)} OPC-UA tags in namespace {self.namespace} "
+                    f"on {self.server.endpoint.geturl()}")
+
+    def stop(self):
+        self.server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=4840, help="port to listen on")
+    parser.add_argument('--tags', type=int, default=100, help="number of simulated tags")
+    parser.add_argument('--update-interval', type=float, default=1.0, help="seconds between value changes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    simulator = OPCUASimulator(f"opc.tcp://{args.host}:{args.port}", args.tags)
+    simulator.start()
+    try:
+        while True:
+            time.sleep(args.update_interval)
+            simulator.update()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
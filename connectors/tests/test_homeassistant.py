@@ -0,0 +1,216 @@
+import asyncio
+import logging
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+
+class FakeHomeAssistant:
+    """Home Assistant WebSocket API; each connection plays the next script of messages after the snapshot request"""
+
+    def __init__(self, scripts: list):
+        self.scripts = list(scripts)
+        self.connections = 0
+        self.requests = []
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        await ws.send_json({'type': 'auth_required'})
+        auth = await ws.receive_json()
+        if auth.get('access_token') != 'token':
+            await ws.send_json({'type': 'auth_invalid', 'message': 'Invalid access token'})
+            return ws
+        await ws.send_json({'type': 'auth_ok'})
+        for _ in range(2):
+            self.requests.append(await ws.receive_json())
+        await ws.send_json({'id': 1, 'type': 'result', 'success': True, 'result': None})
+        script = self.scripts.pop(0) if self.scripts else []
+        for message in script:
+            if message == 'close':
+                await ws.close()
+                return ws
+            await ws.send_json(message)
+        async for _ in ws:
+            pass
+        return ws
+
+
+class Recorder:
+    """Stands in for the collectors client"""
+
+    def __init__(self):
+        self.metrics = []
+        self.logs = []
+
+    def send_metric(self, metric):
+        self.metrics.append(metric)
+
+    def send_log(self, log):
+        self.logs.append(log)
+
+
+def entity(entity_id: str, state: str, updated: str = '2024-01-01T00:00:00', **attributes) -> dict:
+    return {'entity_id': entity_id, 'state': state, 'attributes': attributes, 'last_updated': updated}
+
+
+def snapshot(*states) -> dict:
+    return {'id': 2, 'type': 'result', 'success': True, 'result': list(states)}
+
+
+def state_changed(entity_id: str, new_state) -> dict:
+    return {'id': 1, 'type': 'event', 'event': {'event_type': 'state_changed',
+                                                'data': {'entity_id': entity_id, 'new_state': new_state}}}
+
+
+async def until(condition, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(main, 'collectors_client', recorder)
+    return recorder
+
+
+def follow(home_assistant: FakeHomeAssistant, scenario, **config):
+    async def run():
+        app = web.Application()
+        app.router.add_get('/api/websocket', home_assistant.handle)
+        server = TestServer(app)
+        await server.start_server()
+        connector = main.HomeAssistantConnector({
+            'url': str(server.make_url('')).rstrip('/'), 'token': 'token', 'mode': 'websocket', **config})
+        stream = asyncio.create_task(connector._follow_events())
+        try:
+            return await scenario(connector)
+        finally:
+            stream.cancel()
+            await asyncio.gather(stream, return_exceptions=True)
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def logged(recorder: Recorder) -> list:
+    return [log['message'] for log in recorder.logs]
+
+
+def test_subscribes_before_taking_the_snapshot(recorder):
+    home_assistant = FakeHomeAssistant([[snapshot(entity('sensor.temp', '21.5'), entity('light.kitchen', 'on'))]])
+
+    async def scenario(connector):
+        await until(lambda: len(connector.states) == 2)
+
+    follow(home_assistant, scenario)
+    assert [request['type'] for request in home_assistant.requests] == ['subscribe_events', 'get_states']
+    assert [metric['value'] for metric in recorder.metrics] == [21.5]
+    assert recorder.metrics[0]['labels']['entity_id'] == 'sensor.temp'
+    assert logged(recorder) == ['Entity sensor.temp state: 21.5', 'Entity light.kitchen state: on']
+
+
+def test_snapshot_larger_than_aiohttp_default_limit(recorder):
+    # Over the 4 MiB that aiohttp accepts unless told otherwise
+    states = [entity(f'sensor.s{i}', str(i), notes='x' * 5000) for i in range(1000)]
+    home_assistant = FakeHomeAssistant([[snapshot(*states)]])
+
+    async def scenario(connector):
+        await until(lambda: len(connector.states) == 1000)
+
+    follow(home_assistant, scenario)
+    assert home_assistant.connections == 1
+    assert len(recorder.metrics) == 1000
+
+
+def test_oversized_message_is_logged_as_an_error(recorder, caplog):
+    home_assistant = FakeHomeAssistant([[snapshot(entity('sensor.temp', '21.5', notes='x' * 4096))]])
+
+    async def scenario(connector):
+        await until(lambda: 'Home Assistant event stream error' in caplog.text)
+
+    with caplog.at_level(logging.INFO, logger=main.logger.name):
+        follow(home_assistant, scenario, max_message_size=1024)
+    assert 'WebSocket error' in caplog.text
+    assert 'closed the WebSocket connection' not in caplog.text
+    assert not recorder.metrics and not recorder.logs
+
+
+def test_only_state_transitions_are_forwarded(recorder):
+    home_assistant = FakeHomeAssistant([[
+        snapshot(entity('sensor.temp', '21.5'), entity('light.kitchen', 'on')),
+        state_changed('sensor.temp', entity('sensor.temp', '21.5', '2024-01-01T00:01:00', unit='°C')),
+        state_changed('sensor.temp', entity('sensor.temp', '22.0', '2024-01-01T00:02:00')),
+        state_changed('light.kitchen', None),
+    ]])
+
+    async def scenario(connector):
+        await until(lambda: 'light.kitchen' not in connector.states and connector.states)
+        return connector.states
+
+    states = follow(home_assistant, scenario)
+    assert list(states) == ['sensor.temp']
+    assert states['sensor.temp']['state'] == '22.0'
+    assert [metric['value'] for metric in recorder.metrics] == [21.5, 22.0]
+    assert logged(recorder) == [
+        'Entity sensor.temp state: 21.5',
+        'Entity light.kitchen state: on',
+        'Entity sensor.temp state: 22.0',
+        'Entity light.kitchen removed',
+    ]
+
+
+def test_event_newer_than_the_snapshot_wins(recorder):
+    home_assistant = FakeHomeAssistant([[
+        state_changed('sensor.temp', entity('sensor.temp', '23.0', '2024-01-01T00:05:00')),
+        snapshot(entity('sensor.temp', '21.5', '2024-01-01T00:00:00')),
+    ]])
+
+    async def scenario(connector):
+        # One metric from the event, one from the snapshot
+        await until(lambda: len(recorder.metrics) == 2)
+        return connector.states['sensor.temp']['state']
+
+    assert follow(home_assistant, scenario) == '23.0'
+    assert [metric['value'] for metric in recorder.metrics] == [23.0, 23.0]
+    assert logged(recorder) == ['Entity sensor.temp state: 23.0']
+
+
+def test_resync_after_a_gap_logs_only_what_changed(recorder):
+    home_assistant = FakeHomeAssistant([
+        [snapshot(entity('sensor.temp', '21.5'), entity('light.kitchen', 'on'), entity('lock.door', 'locked')), 'close'],
+        [snapshot(entity('sensor.temp', '21.5'), entity('light.kitchen', 'off', '2024-01-01T00:03:00'))],
+    ])
+
+    async def scenario(connector):
+        await until(lambda: home_assistant.connections == 2 and 'lock.door' not in connector.states)
+        return connector.states
+
+    states = follow(home_assistant, scenario)
+    assert sorted(states) == ['light.kitchen', 'sensor.temp']
+    assert logged(recorder) == [
+        'Entity sensor.temp state: 21.5',
+        'Entity light.kitchen state: on',
+        'Entity lock.door state: locked',
+        'Entity light.kitchen state: off',
+    ]
+    # Numeric states are re-sent on every snapshot so their series stay current
+    assert [metric['value'] for metric in recorder.metrics] == [21.5, 21.5]
+
+
+def test_rejected_token_is_reported(recorder, caplog):
+    home_assistant = FakeHomeAssistant([])
+
+    async def scenario(connector):
+        await until(lambda: 'authentication failed' in caplog.text)
+
+    with caplog.at_level(logging.INFO, logger=main.logger.name):
+        follow(home_assistant, scenario, token='wrong')
+    assert 'Invalid access token' in caplog.text
@@ -0,0 +1,119 @@
+import logging
+
+import pytest
+
+from modbus import plan_reads
+
+
+def spans(reads) -> list:
+    return [(read.unit_id, read.type, read.address, read.count) for read in reads]
+
+
+def register(name: str, address: int, count: int = 1, **fields) -> dict:
+    return {'name': name, 'address': address, 'count': count, **fields}
+
+
+def test_adjacent_entries_share_one_read():
+    reads = plan_reads([register('a', 0, 2), register('b', 2), register('c', 3, 2)])
+    assert spans(reads) == [(1, 'holding', 0, 5)]
+    assert [entry['name'] for entry in reads[0].entries] == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('gap, expected', [
+    (8, [(1, 'holding', 0, 10)]),
+    (9, [(1, 'holding', 0, 1), (1, 'holding', 10, 1)]),
+])
+def test_gaps_up_to_max_gap_are_read_through(gap, expected):
+    assert spans(plan_reads([register('a', 0), register('b', 1 + gap)], max_gap=8)) == expected
+
+
+def test_max_gap_zero_merges_only_adjacent_entries():
+    reads = plan_reads([register('a', 0), register('b', 1), register('c', 3)], max_gap=0)
+    assert spans(reads) == [(1, 'holding', 0, 2), (1, 'holding', 3, 1)]
+
+
+def test_entries_are_merged_regardless_of_configured_order():
+    reads = plan_reads([register('c', 4), register('a', 0), register('b', 2)])
+    assert spans(reads) == [(1, 'holding', 0, 5)]
+    assert [entry['name'] for entry in reads[0].entries] == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('reg_type, limit', [('holding', 125), ('input', 125), ('coil', 2000), ('discrete', 2000)])
+def test_reads_stay_within_the_protocol_limit(reg_type, limit):
+    registers = [register(f'r{i}', i, type=reg_type) for i in range(limit + 6)]
+    assert spans(plan_reads(registers)) == [(1, reg_type, 0, limit), (1, reg_type, limit, 6)]
+
+
+def test_gap_is_not_read_through_when_it_would_exceed_the_limit():
+    reads = plan_reads([register('a', 0, 120), register('b', 123, 4)])
+    assert spans(reads) == [(1, 'holding', 0, 120), (1, 'holding', 123, 4)]
+
+
+def test_entry_ending_exactly_at_the_limit_is_merged():
+    reads = plan_reads([register('a', 0, 120), register('b', 121, 4)])
+    assert spans(reads) == [(1, 'holding', 0, 125)]
+
+
+def test_configured_limit_overrides_the_protocol_limit():
+    registers = [register(f'r{i}', i) for i in range(10)]
+    assert spans(plan_reads(registers, max_read={'holding': 4})) == [
+        (1, 'holding', 0, 4), (1, 'holding', 4, 4), (1, 'holding', 8, 2)]
+
+
+def test_overlapping_entries_share_one_read():
+    reads = plan_reads([register('a', 10, 4), register('b', 12, 2), register('c', 11, 10), register('d', 10, 2)])
+    assert spans(reads) == [(1, 'holding', 10, 11)]
+    read = reads[0]
+    data = list(range(100, 111))
+    assert {entry['name']: read.values(data, entry) for entry in read.entries} == {
+        'a': [100, 101, 102, 103],
+        'b': [102, 103],
+        'c': list(range(101, 111)),
+        'd': [100, 101],
+    }
+
+
+def test_entry_inside_a_longer_one_does_not_shrink_the_read():
+    reads = plan_reads([register('a', 0, 10), register('b', 2, 2), register('c', 12)])
+    assert spans(reads) == [(1, 'holding', 0, 13)]
+
+
+def test_units_and_types_are_read_separately():
+    reads = plan_reads([
+        register('a', 0),
+        register('b', 1, unit_id=2),
+        register('c', 1, type='input'),
+        register('d', 2, type='coil', unit_id=2),
+        register('e', 1),
+    ], unit_id=1)
+    assert spans(reads) == [
+        (1, 'holding', 0, 2),
+        (1, 'input', 1, 1),
+        (2, 'coil', 2, 1),
+        (2, 'holding', 1, 1),
+    ]
+
+
+def test_entries_are_normalised():
+    [read] = plan_reads([{'name': 'a', 'address': '7'}], unit_id=3)
+    assert read.entries == [{'name': 'a', 'address': 7, 'count': 1, 'type': 'holding', 'unit_id': 3}]
+
+
+@pytest.mark.parametrize('count, expected', [(0, 1), (-3, 1), (200, 125)])
+def test_count_is_clamped(count, expected):
+    [read] = plan_reads([register('a', 0, count)])
+    assert read.count == expected
+    assert read.entries[0]['count'] == expected
+
+
+def test_clamped_count_is_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger='modbus'):
+        plan_reads([register('a', 0, 2500, type='coil')])
+    assert 'count 2500 exceeds the coil read limit of 2000' in caplog.text
+
+
+def test_unknown_type_is_skipped(caplog):
+    with caplog.at_level(logging.WARNING, logger='modbus'):
+        reads = plan_reads([register('a', 0, type='float'), register('b', 1)])
+    assert spans(reads) == [(1, 'holding', 1, 1)]
+    assert "unknown type 'float'" in caplog.text
@@ -0,0 +1,116 @@
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip('opcua')
+
+from opcua_session import NodeEntry, OPCUASession  # noqa: E402
+from opcua_simulator import OPCUASimulator  # noqa: E402
+
+TAGS = 12
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_simulator() -> OPCUASimulator:
+    simulator = OPCUASimulator(f'opc.tcp://127.0.0.1:{free_port()}', TAGS)
+    simulator.start()
+    return simulator
+
+
+@pytest.fixture(scope='module')
+def simulator():
+    simulator = start_simulator()
+    yield simulator
+    simulator.stop()
+
+
+def entries(simulator: OPCUASimulator, ids: list = None) -> list:
+    ids = ids if ids is not None else [f'Tag{i}' for i in range(TAGS)]
+    return [NodeEntry({'id': f'ns={simulator.namespace};s={tag}'}) for tag in ids]
+
+
+def session(simulator: OPCUASimulator, nodes: list, batch_size: int) -> OPCUASession:
+    session = OPCUASession(simulator.server.endpoint.geturl(), nodes, batch_size=batch_size)
+    session.connect()
+    return session
+
+
+def test_values_are_read_in_batches(simulator):
+    simulator.update()
+    nodes = entries(simulator)
+    client = session(simulator, nodes, batch_size=5)
+    calls = []
+    get_attributes = client.client.uaclient.get_attributes
+
+    def counting(node_ids, attribute):
+        calls.append(len(node_ids))
+        return get_attributes(node_ids, attribute)
+
+    client.client.uaclient.get_attributes = counting
+    try:
+        results = client.read()
+    finally:
+        client.close()
+    assert calls == [5, 5, 2]
+    assert [entry.id for entry, _ in results] == [node.id for node in nodes]
+    assert [value.Value.Value for _, value in results] == [tag.get_value() for tag in simulator.tags]
+
+
+def test_unknown_node_reads_as_a_bad_status(simulator):
+    client = session(simulator, entries(simulator, ['Tag0', 'Missing']), batch_size=500)
+    try:
+        (_, known), (_, missing) = client.read()
+    finally:
+        client.close()
+    assert known.StatusCode.is_good()
+    assert not missing.StatusCode.is_good()
+
+
+def test_subscription_monitors_every_node_and_forwards_changes(simulator):
+    nodes = entries(simulator, [f'Tag{i}' for i in range(TAGS)] + ['Missing'])
+    client = session(simulator, nodes, batch_size=5)
+    changed = {}
+    updated = threading.Event()
+
+    def on_change(entry, data_value):
+        changed[entry.id] = data_value.Value.Value
+        if len(changed) == TAGS:
+            updated.set()
+
+    try:
+        created = client.subscribe(on_change, publishing_interval=50, sampling_interval=10)
+        # The initial values arrive first; wait for the notifications of one update
+        assert updated.wait(5)
+        changed.clear()
+        updated.clear()
+        simulator.update()
+        assert updated.wait(5)
+    finally:
+        client.close()
+    assert created == TAGS
+    assert changed == {f'ns={simulator.namespace};s=Tag{i}': tag.get_value() for i, tag in enumerate(simulator.tags)}
+
+
+def test_check_notices_a_stopped_server():
+    simulator = start_simulator()
+    try:
+        client = session(simulator, entries(simulator), batch_size=500)
+        assert client.check()
+    finally:
+        simulator.stop()
+    try:
+        assert not client.check()
+        assert not client.healthy
+        assert not client.check()
+    finally:
+        client.close()
+
+
+def test_check_without_a_connection():
+    assert not OPCUASession('opc.tcp://127.0.0.1:1', []).check()
@@ -0,0 +1,223 @@
+import asyncio
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from transport import CollectorsClient
+
+
+class FakeCollectors:
+    """Collectors ingestion endpoint answering with queued (status, body, headers) replies, then 200 ok"""
+
+    def __init__(self, replies: list = ()):
+        self.replies = list(replies)
+        self.batches = []
+        self.encodings = []
+
+    async def handle(self, request):
+        # aiohttp inflates gzip request bodies itself
+        self.encodings.append(request.headers.get('Content-Encoding'))
+        self.batches.append(json.loads(await request.read()))
+        status, reply, headers = self.replies.pop(0) if self.replies else (200, {'status': 'ok'}, None)
+        return web.json_response(reply, status=status, headers=headers)
+
+    @property
+    def received(self) -> list:
+        return [entry['value'] for batch in self.batches for entry in batch]
+
+
+async def with_client(collectors: FakeCollectors, scenario, **settings):
+    app = web.Application()
+    app.router.add_post('/collect/metrics', collectors.handle)
+    server = TestServer(app)
+    await server.start_server()
+    client = CollectorsClient(str(server.make_url('')), **{'max_backoff': 0.01, **settings})
+    try:
+        return await scenario(client)
+    finally:
+        await client.close()
+        await server.close()
+
+
+def run(collectors: FakeCollectors, scenario, **settings):
+    return asyncio.run(with_client(collectors, scenario, **settings))
+
+
+def metric(value: int) -> dict:
+    return {'name': 'temperature', 'value': value}
+
+
+def test_queued_entries_are_sent_in_batches():
+    collectors = FakeCollectors()
+
+    async def scenario(client):
+        for i in range(7):
+            client.send_metric(metric(i))
+        await client.flush(client.channels['metrics'])
+        return client.sent['metrics']
+
+    assert run(collectors, scenario, batch_size=3) == 7
+    assert [len(batch) for batch in collectors.batches] == [3, 3, 1]
+    assert collectors.received == list(range(7))
+
+
+def test_full_batch_is_sent_before_the_interval():
+    collectors = FakeCollectors()
+
+    async def scenario(client):
+        client.start()
+        for i in range(3):
+            client.send_metric(metric(i))
+        await asyncio.sleep(0.2)
+        return len(collectors.batches)
+
+    assert run(collectors, scenario, batch_size=3, flush_interval=30) == 1
+
+
+def test_partial_batch_is_sent_after_the_interval():
+    collectors = FakeCollectors()
+
+    async def scenario(client):
+        client.start()
+        client.send_metric(metric(1))
+        await asyncio.sleep(0.02)
+        before = len(collectors.batches)
+        await asyncio.sleep(0.2)
+        return before, len(collectors.batches)
+
+    assert run(collectors, scenario, batch_size=100, flush_interval=0.1) == (0, 1)
+
+
+def test_large_batches_are_gzipped():
+    collectors = FakeCollectors()
+
+    async def scenario(client):
+        client.send_metric(metric(1))
+        await client.flush(client.channels['metrics'])
+        client.send_metric({'name': 'x' * 2000, 'value': 2})
+        await client.flush(client.channels['metrics'])
+
+    run(collectors, scenario, compress_min_bytes=1024)
+    assert collectors.encodings == [None, 'gzip']
+
+
+def test_full_queue_drops_the_oldest_entries():
+    async def scenario(client):
+        for i in range(8):
+            client.send_metric(metric(i))
+        channel = client.channels['metrics']
+        return [entry['value'] for entry in channel.entries], channel.dropped
+
+    assert run(FakeCollectors(), scenario, max_queue=5) == ([3, 4, 5, 6, 7], 3)
+
+
+def test_failed_batch_is_retried_with_backoff():
+    collectors = FakeCollectors([(503, {'error': 'down'}, None), (429, {'error': 'busy'}, {'Retry-After': '0'})])
+
+    async def scenario(client):
+        client.send_metric(metric(1))
+        await client.flush(client.channels['metrics'])
+        return client.sent['metrics']
+
+    assert run(collectors, scenario, max_retries=2) == 1
+    assert len(collectors.batches) == 3
+
+
+def test_batch_is_kept_at_the_front_when_retries_run_out():
+    collectors = FakeCollectors([(503, {'error': 'down'}, None)] * 2)
+
+    async def scenario(client):
+        for i in range(3):
+            client.send_metric(metric(i))
+        await client.flush(client.channels['metrics'])
+        client.send_metric(metric(3))
+        queued = [entry['value'] for entry in client.channels['metrics'].entries]
+        await client.flush(client.channels['metrics'])
+        return queued, client.sent['metrics']
+
+    assert run(collectors, scenario, batch_size=2, max_retries=1) == ([0, 1, 2, 3], 4)
+    assert collectors.received[-4:] == [0, 1, 2, 3]
+
+
+def test_invalid_batch_is_not_retried():
+    collectors = FakeCollectors([(400, {'status': 'rejected', 'accepted': 0, 'rejected': 1}, None)])
+
+    async def scenario(client):
+        client.send_metric(metric(1))
+        await client.flush(client.channels['metrics'])
+        return len(client.channels['metrics'].entries)
+
+    assert run(collectors, scenario) == 0
+    assert len(collectors.batches) == 1
+
+
+def test_shed_entries_of_a_partial_batch_are_sent_again_after_retry_after():
+    partial = {
+        'status': 'partial', 'accepted': 2, 'rejected': 3, 'shed': 1,
+        'errors': [
+            {'index': 1, 'error': "'value' must be a number"},
+            {'index': 2, 'error': 'dropped under memory pressure, retry later'},
+            {'index': 4, 'error': 'could not be buffered, retry later'},
+        ],
+        'errors_truncated': False,
+    }
+    collectors = FakeCollectors([(200, partial, {'Retry-After': '1'})])
+
+    async def scenario(client):
+        channel = client.channels['metrics']
+        for i in range(5):
+            client.send_metric(metric(i))
+        await client.flush(channel)
+        loop = asyncio.get_running_loop()
+        queued = [entry['value'] for entry in channel.entries]
+        return queued, channel.resume_at - loop.time(), client.sent['metrics']
+
+    queued, wait, sent = run(collectors, scenario)
+    assert queued == [2, 4]
+    assert 0.5 < wait <= 1
+    assert sent == 3
+
+
+def test_partial_batch_without_positions_is_sent_again_whole():
+    collectors = FakeCollectors([(200, {'status': 'partial', 'accepted': 1, 'rejected': 2, 'shed': 2}, None)])
+
+    async def scenario(client):
+        for i in range(3):
+            client.send_metric(metric(i))
+        await client.flush(client.channels['metrics'])
+        return [entry['value'] for entry in client.channels['metrics'].entries]
+
+    assert run(collectors, scenario) == [0, 1, 2]
+
+
+def test_entries_past_truncated_errors_are_sent_again():
+    partial = {
+        'status': 'partial', 'accepted': 1, 'rejected': 3,
+        'errors': [{'index': 0, 'error': "'value' must be a number"}], 'errors_truncated': True,
+    }
+    collectors = FakeCollectors([(200, partial, None)])
+
+    async def scenario(client):
+        for i in range(4):
+            client.send_metric(metric(i))
+        await client.flush(client.channels['metrics'])
+        return [entry['value'] for entry in client.channels['metrics'].entries]
+
+    assert run(collectors, scenario) == [1, 2, 3]
+
+
+def test_flush_loop_waits_for_retry_after():
+    partial = {'status': 'partial', 'accepted': 0, 'rejected': 1,
+               'errors': [{'index': 0, 'error': 'dropped under memory pressure, retry later'}]}
+    collectors = FakeCollectors([(200, partial, {'Retry-After': '1'})])
+
+    async def scenario(client):
+        client.start()
+        client.send_metric(metric(1))
+        await asyncio.sleep(0.3)
+        waiting = len(collectors.batches)
+        await asyncio.sleep(1)
+        return waiting, len(collectors.batches)
+
+    assert run(collectors, scenario, flush_interval=0.05) == (1, 2)
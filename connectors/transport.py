@@ -0,0 +1,212 @@
+"""Batched asynchronous transport from connectors to the collectors
+
+All connectors share one ``CollectorsClient``. Metrics and logs are queued in
+memory and sent as JSON-array batches over a pooled keep-alive aiohttp
+session, once a batch is full or the flush interval has passed. Failed
+batches are retried with exponential backoff; while the collectors are
+unreachable the queues are bounded and the oldest entries are dropped first.
+Entries the collectors shed or could not buffer in a partially accepted batch
+are queued again and sent once their ``Retry-After`` has passed.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import random
+from collections import deque
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: throttling and server-side trouble
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Per-entry errors of a partial response that ask for the entry to be sent again
+RETRY_LATER = 'retry later'
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds from a ``Retry-After`` header, if it holds a number"""
+    return float(value) if value and value.isdigit() else None
+
+
+class _Channel:
+    """Queue of entries for one collectors endpoint"""
+
+    def __init__(self, kind: str, path: str, max_size: int):
+        self.kind = kind
+        self.path = path
+        self.entries = deque(maxlen=max_size)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+        # Loop time before which the collectors asked not to be sent more
+        self.resume_at = 0.0
+
+
+class CollectorsClient:
+    """Shared, batching client for the collectors ingestion API"""
+
+    def __init__(self, base_url: str, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_queue: int = 100000, max_retries: int = 5, timeout: float = 10,
+                 compress_min_bytes: int = 1024, max_backoff: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.compress_min_bytes = compress_min_bytes
+        self.max_backoff = max_backoff
+        self.channels = {
+            'metrics': _Channel('metrics', '/collect/metrics', max_queue),
+            'logs': _Channel('logs', '/collect/logs', max_queue),
+        }
+        self.sent = {kind: 0 for kind in self.channels}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks = []
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=len(self.channels) * 2, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def _enqueue(self, kind: str, entry: Dict[str, Any]):
+        channel = self.channels[kind]
+        if len(channel.entries) == channel.entries.maxlen:
+            # The deque drops the oldest entry to make room
+            channel.dropped += 1
+        channel.entries.append(entry)
+        if len(channel.entries) >= self.batch_size:
+            channel.ready.set()
+
+    def send_metric(self, metric: Dict[str, Any]):
+        """Queue a metric for the next batch"""
+        self._enqueue('metrics', metric)
+
+    def send_log(self, log: Dict[str, Any]):
+        """Queue a log entry for the next batch"""
+        self._enqueue('logs', log)
+
+    def start(self):
+        """Start one flush task per endpoint"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._flush_loop(channel)) for channel in self.channels.values()]
+
+    async def _flush_loop(self, channel: _Channel):
+        loop = asyncio.get_running_loop()
+        while True:
+            if channel.resume_at > loop.time():
+                await asyncio.sleep(channel.resume_at - loop.time())
+            try:
+                await asyncio.wait_for(channel.ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            channel.ready.clear()
+            try:
+                await self.flush(channel)
+            except Exception as e:
+                logger.error(f"Error flushing {channel.kind} to collectors: {e}")
+
+    async def flush(self, channel: _Channel, max_retries: Optional[int] = None):
+        """Send everything queued on a channel in batches"""
+        if channel.dropped:
+            logger.warning(f"Dropped {channel.dropped} {channel.kind} entries, the send queue was full")
+            channel.dropped = 0
+        while channel.entries:
+            count = min(self.batch_size, len(channel.entries))
+            batch = [channel.entries.popleft() for _ in range(count)]
+            unsent = await self._send(channel, batch, self.max_retries if max_retries is None else max_retries)
+            self.sent[channel.kind] += len(batch) - len(unsent)
+            if unsent:
+                self._requeue(channel, unsent)
+                return
+
+    def _requeue(self, channel: _Channel, entries: list):
+        """Keep entries at the front for the next attempt, as far as the queue bound allows"""
+        room = channel.entries.maxlen - len(channel.entries)
+        channel.dropped += max(0, len(entries) - room)
+        channel.entries.extendleft(reversed(entries[len(entries) - room:] if room < len(entries) else entries))
+
+    async def _send(self, channel: _Channel, batch: list, max_retries: int) -> list:
+        """POST one batch, retrying with backoff; returns the entries to keep for later"""
+        body = json.dumps(batch).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            try:
+                session = self._get_session()
+                async with session.post(f"{self.base_url}{channel.path}", data=body, headers=headers) as response:
+                    text = await response.text()
+                    retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                    if response.status < 300:
+                        return self._unaccepted(channel, batch, text, retry_after)
+                    if response.status not in RETRY_STATUSES:
+                        # Rejected as invalid; sending it again will not help
+                        logger.error(f"Collectors rejected {len(batch)} {channel.kind} entries "
+                                     f"({response.status}): {text[:200]}")
+                        return []
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == max_retries:
+                logger.error(f"Failed to send {len(batch)} {channel.kind} entries after "
+                             f"{attempt + 1} attempt(s): {error}")
+                return batch
+            delay = min(self.max_backoff, 0.5 * 2 ** attempt) * random.uniform(0.5, 1)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            logger.debug(f"Retrying {channel.kind} batch in {delay:.1f}s: {error}")
+            await asyncio.sleep(delay)
+        return batch
+
+    def _unaccepted(self, channel: _Channel, batch: list, text: str, retry_after: Optional[float]) -> list:
+        """Entries of an accepted request that the collectors shed or could not buffer.
+
+        Positions come from the per-entry errors of a ``partial`` response.
+        Entries past the last reported error were not itemised (the error list
+        is capped), so they are sent again too, as is the whole batch when no
+        positions are reported at all.
+        """
+        try:
+            result = json.loads(text)
+        except ValueError:
+            return []
+        if not isinstance(result, dict) or result.get('status') != 'partial':
+            return []
+        errors = [e for e in result.get('errors') or () if isinstance(e, dict) and isinstance(e.get('index'), int)]
+        positions = {error['index'] for error in errors if RETRY_LATER in str(error.get('error', ''))}
+        if result.get('errors_truncated') or not errors:
+            positions.update(range(max((error['index'] for error in errors), default=-1) + 1, len(batch)))
+        unsent = [batch[i] for i in sorted(positions) if 0 <= i < len(batch)]
+        rejected = int(result.get('rejected') or 0)
+        if rejected > len(unsent):
+            logger.warning(f"Collectors rejected {rejected - len(unsent)} {channel.kind} entries: {text[:200]}")
+        if unsent:
+            logger.warning(f"Collectors did not take {len(unsent)} {channel.kind} entries, queued them again")
+            if retry_after is not None:
+                channel.resume_at = asyncio.get_running_loop().time() + retry_after
+        return unsent
+
+    async def close(self):
+        """Stop the flush tasks, send what is queued (one attempt each) and close the session"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for channel in self.channels.values():
+            await self.flush(channel, max_retries=0)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()